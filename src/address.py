@@ -3,21 +3,33 @@ Created on Oct 14, 2013
 
 @author: Vincent Ketelaars
 '''
-from struct import unpack
-from socket import AF_INET, AF_INET6, inet_aton, inet_pton
-from binascii import hexlify
+from socket import AF_INET, AF_INET6, error as socket_error
+from collections import OrderedDict
+from threading import Lock
 
-from src.tools.networks import get_interface_addresses
+from src.tools.networks import interface_table, ip_to_int
+from src.tools.prefix_trie import PrefixTrie
 
 from src.logger import get_logger
 from src.tools.network_interface import Interface
-from src.definitions import PRIVATE_IPV4_ADDRESSES
+from src.definitions import PRIVATE_IPV4_ADDRESSES, ADDRESS_CACHE_SIZE
 logger = get_logger(__name__)
 
+_PRIVATE_IPV4 = PrefixTrie(32)
+for i, n in PRIVATE_IPV4_ADDRESSES:
+    _PRIVATE_IPV4.insert(ip_to_int(i), PrefixTrie.prefix_length(ip_to_int(n)), (i, n))
+
+# Least recently used cache of string or tuple : Address components.
+# Addresses can be changed after creation, so each call still gets its own instance.
+_cache = OrderedDict()
+_cache_lock = Lock()
+
 class Address(object):
     '''
     This class represents an socket address. Either AF_INET or AF_INET6.
+    The ip is converted to an integer once, on creation.
     '''
+    __slots__ = ("_ip", "_port", "_family", "_flowinfo", "_scopeid", "_if", "_int", "_private")
     
     IFNAME_WILDCARD= "All"
     SWIFT_UNKNOWN = "AF_UNSPEC"
@@ -29,8 +41,55 @@ class Address(object):
         self._flowinfo = flowinfo # IPv6 only
         self._scopeid = scopeid # IPv6 only
         self._if = interface
+        self._int = self._ip_to_int()
         self._private = self._is_private_address()
         
+    def __getstate__(self):
+        return dict([(k, getattr(self, k)) for k in self.__slots__])
+    
+    def __setstate__(self, state):
+        for k, v in state.iteritems():
+            setattr(self, k, v)
+        
+    def _ip_to_int(self):
+        if self._family == AF_INET6:
+            try:
+                return self.ipv6_str_to_int(self._ip)
+            except (socket_error, ValueError):
+                return None # Only used for comparing subnets, which will raise when it is needed
+        return self.ipv4_str_to_int(self._ip)
+    
+    def _components(self):
+        return (self._ip, self._port, self._family, self._flowinfo, self._scopeid, self._int, self._private)
+    
+    @classmethod
+    def _from_components(cls, components, interface=None):
+        addr = cls.__new__(cls)
+        addr._ip, addr._port, addr._family, addr._flowinfo, addr._scopeid, addr._int, addr._private = components
+        addr._if = interface
+        return addr
+    
+    @classmethod
+    def _cached(cls, key, create):
+        """
+        Return a new Address from the cached components of key, or from create() if not cached
+        """
+        try:
+            with _cache_lock:
+                components = _cache.pop(key, None)
+                if components is not None:
+                    _cache[key] = components # Most recently used
+        except TypeError: # Not hashable
+            return create()
+        if components is not None:
+            return cls._from_components(components)
+        addr = create()
+        with _cache_lock:
+            _cache[key] = addr._components()
+            if len(_cache) > ADDRESS_CACHE_SIZE:
+                _cache.popitem(last=False)
+        return addr
+        
     @property
     def ip(self):
         return self._ip
@@ -59,8 +118,8 @@ class Address(object):
     def copy(cls, addr):
         # Assume Address instance
         try:
-            return cls(ip=addr.ip, port=addr.port, family=addr.family, flowinfo=addr.flowinfo, scopeid=addr.scopeid, 
-                       interface=Interface.copy(addr.interface) if addr.interface is not None else None)
+            return cls._from_components(addr._components(), 
+                                        interface=Interface.copy(addr.interface) if addr.interface is not None else None)
         except AttributeError:
             logger.debug("%s is not an Address instance!", addr)
             return cls()
@@ -103,6 +162,10 @@ class Address(object):
     def unknown(cls, addr):
         if isinstance(addr, Address):
             return cls.copy(addr)
+        return cls._cached(addr, lambda: cls._unknown(addr))
+    
+    @classmethod
+    def _unknown(cls, addr):
         try:
             p = int(addr)
             # If it is an integer, it is a port
@@ -110,7 +173,7 @@ class Address(object):
         except (ValueError, TypeError):
             pass
         if len(addr) == 2:
-            return cls.tuple(addr)
+            return cls._tuple(addr)
         # Not an integer or tuple, so most likely a string
         addr = addr.strip()
         try:               
@@ -128,6 +191,10 @@ class Address(object):
             
     @classmethod
     def tuple(cls, tuple_addr):
+        return cls._cached(tuple_addr, lambda: cls._tuple(tuple_addr))
+    
+    @classmethod
+    def _tuple(cls, tuple_addr):
         try:
             if tuple_addr[0].find("[") == 0:
                 return cls.ipv6(tuple_addr[0] + ":" + str(tuple_addr[1]))
@@ -167,6 +234,8 @@ class Address(object):
     def set_ipv4(self, ip):
         self._ip = ip
         self._family = AF_INET
+        self._int = self._ip_to_int()
+        self._private = self._is_private_address()
         
     def set_port(self, port):
         self._port = port
@@ -201,11 +270,8 @@ class Address(object):
         if self.is_wildcard_ip():
             self._if = Interface(self.IFNAME_WILDCARD, self._ip, self._ip, self._ip)
             return True
-        for if_ in get_interface_addresses(version=self.family):
-            if self.same_subnet(if_.address, interface=if_): # Same subnet
-                self._if = if_
-                return True
-        return False
+        self._if = interface_table.subnet_interface(self._ip, version=self._family)
+        return self._if is not None
     
     def same_subnet(self, ip, interface=None):
         """
@@ -215,33 +281,29 @@ class Address(object):
         if interface is None:
             interface = self._if
         if self.family == AF_INET6:
-            return (self.ipv6_str_to_int(ip) & self.ipv6_str_to_int(interface.netmask) ==
-                    self.ipv6_str_to_int(self.ip) & self.ipv6_str_to_int(interface.netmask))
-        return (self.ipv4_str_to_int(ip) & self.ipv4_str_to_int(interface.netmask) == 
-                self.ipv4_str_to_int(self.ip) & self.ipv4_str_to_int(interface.netmask))
+            netmask = self.ipv6_str_to_int(interface.netmask)
+            own = self._int if self._int is not None else self.ipv6_str_to_int(self.ip)
+            return self.ipv6_str_to_int(ip) & netmask == own & netmask
+        netmask = self.ipv4_str_to_int(interface.netmask)
+        return self.ipv4_str_to_int(ip) & netmask == self._int & netmask
     
     def interface_exists(self):
         if self._if is None:
             return False
-        for if_ in get_interface_addresses():
-            if (self._if.name == if_.name and self._if.address == if_.address):
-                return True
-        return False
+        return interface_table.exists(self._if.name, self._if.address)
     
     def ipv4_str_to_int(self, ipv4_addr):
-        return unpack("!L", inet_aton(ipv4_addr))[0]
+        return ip_to_int(ipv4_addr, AF_INET)
     
     def ipv6_str_to_int(self, ipv6_addr):
-        return int(hexlify(inet_pton(AF_INET6, ipv6_addr)), 16)
+        return ip_to_int(ipv6_addr, AF_INET6)
     
     def is_private_address(self):
         return self._private
         
     def _is_private_address(self):
         if self.family == AF_INET:
-            for i, n in PRIVATE_IPV4_ADDRESSES:
-                if self.same_subnet(i, Interface(None, i, n, None)):
-                    return True
+            return self._int in _PRIVATE_IPV4
         # We do not mark any IPv6 addresses as private
         return False
     
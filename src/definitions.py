@@ -73,6 +73,8 @@ DEFAULT_MESSAGE_DELAY = 0.0 # Seconds
 
 # Time in seconds
 SLEEP_TIME = 0.5
+USE_INOTIFY = True # Let the FilePusher wait for inotify events, where available, instead of scanning every SLEEP_TIME
+FILEPUSHER_RECONCILE_TIME = 60.0 # Seconds between full scans of the FilePusher when inotify is used
 TOTAL_RUN_TIME = 10
 BLOOM_FILTER_UPDATE = 5.0
 REPORT_DISPERSY_INFO_TIME = 1.0
@@ -110,6 +112,17 @@ REACHABLE_ENDPOINT_MAX_MESSAGES = 10
 REACHABLE_ENDPOINT_RETRY_ADDRESSES = 5
 MIN_TIME_BETWEEN_PUNCTURE_REQUESTS = 4.0 # Seconds
 MIN_TIME_BETWEEN_ADDRESSES_MESSAGE = 10.0 # Seconds
+ENDPOINT_SEND_QUEUE_SIZE = 256 # Number of sends that can wait for a single endpoint
+STRIPE_PACKETS = False # Split large batches over all endpoints that have channels with the peer
+STRIPE_MIN_PACKETS = 4 # Smaller batches are sent by a single endpoint
+REDUNDANT_MESSAGE_NAMES = [PUNCTURE_MESSAGE_NAME, ADDRESSES_MESSAGE_NAME, API_MESSAGE_NAME] # Sent over two endpoints at once
+REDUNDANT_PATHS = 2 # Number of disjoint endpoints to send these messages with
+REDUNDANT_RECV_CACHE_SIZE = 1024 # Number of recently received redundant messages to recognize duplicates by
+HEALTH_EWMA_ALPHA = 0.3 # Weight of a new sample in the endpoint health averages
+ENDPOINT_DEAD_TIME = 5.0 # Seconds that a socket can be in error before its endpoint is removed
+ENDPOINT_MAX_LOSS = 0.95 # Loss estimate at which an endpoint is no longer chosen to send
+INCOMING_BATCH_WINDOW = 0.01 # Seconds that incoming packets are held to hand them to Dispersy together
+INCOMING_BATCH_SIZE = 64 # Number of incoming packets that are handed to Dispersy right away
 
 # Filepusher
 FILETYPES_NOT_TO_SEND = [".mhash",".mbinmap"]
@@ -118,6 +131,8 @@ FILENAMES_NOT_TO_SEND = ["swifturl-"]
 # Private addresses, including loopback
 PRIVATE_IPV4_ADDRESSES = [("127.0.0.0", "255.0.0.0"), ("10.0.0.0", "255.0.0.0"), ("172.16.0.0", "255.240.0.0"), 
                      ("192.168.0.0", "255.255.0.0")]
+ADDRESS_CACHE_SIZE = 1024 # Number of parsed address strings and tuples to remember
+INTERFACE_TABLE_REFRESH = 5.0 # Seconds between interface table refreshes, if changes can not be monitored
 
 """
 Swift
@@ -129,14 +144,36 @@ DELETE_CONTENT = False # If True it will be deleted immediately when finished, a
 PEXON = False # If True Swift might disseminate data to unauthorized peers
 MAX_CONCURRENT_DOWNLOADING_SWARMS = 5
 MAX_CONCURRENT_SEEDING_SWARMS = 10
+ADAPTIVE_SWARM_CONCURRENCY = True # Adapt the number of concurrent swarms, starting from MAX_CONCURRENT_*_SWARMS
+SWARM_CONCURRENCY_MIN = 1
+SWARM_CONCURRENCY_MAX = 200
+SWARM_CONCURRENCY_INCREASE = 1.0 # Swarms added when aggregate goodput rose while all swarms are in use
+SWARM_CONCURRENCY_GAIN = 0.1 # Goodput has to rise this fraction above the goodput before the previous increase
+SWARM_CONCURRENCY_PROBE_TICKS = 5 # Ticks to wait before judging whether an increase raised the goodput
+SWARM_CONCURRENCY_DECREASE = 0.5 # Factor applied to the number of swarms when throughput collapses or send queues grow
+SWARM_THROUGHPUT_COLLAPSE = 0.5 # Throughput per swarm below this fraction of its average counts as a collapse
+SWARM_SEND_QUEUE_GROWTH = 2.0 # Send queue above this multiple of its average counts as congestion
+SWARM_EWMA_ALPHA = 0.3 # Weight of a new sample in the swarm goodput, send queue and download speed averages
 ALMOST_DONE_DOWNLOADING_TIME = 5.0 # Seconds
+SWIFT_SCHEDULING_POLICY = "timestamp" # Order of the swift stacks: timestamp, srsf, edf or wfq (see swift.scheduling)
+SWIFT_DIRECTORY_SLA = {} # Directory : seconds after its timestamp that a file should be delivered, used by edf
+SWIFT_DEFAULT_SLA = 60.0 # Seconds, for files in directories without an SLA
+PREEMPT_SWARMS = True # Make room for a file by removing a running swarm of lower priority, which is put back on its stack
+SWIFT_DIRECTORY_WEIGHTS = {} # Directory : share of the bandwidth, relative to the default of 1.0, used by wfq
 BUFFER_DRAIN_TIME = 2.0 # Seconds
 MAX_SOCKET_INITIALIZATION_TIME = 0.9 # Seconds
 MAX_SWARM_LIFE_WITHOUT_LEECHERS = 60.0 # Seconds
 DOWNLOAD_MOREINFO_UPDATE = 1.0 # Seconds
+MOREINFO_DELTA = False # Ask Swift to report only the channels whose counters changed since its previous MOREINFO
+MOREINFO_MAX_UNREAD_DELTAS = 32 # Unread delta reports of a swarm kept as JSON, older ones are merged
 UPLOAD_STACK_PAUSE = 10
 UPLOAD_STACK_UNPAUSE = 5
 MAX_WAIT_FOR_TCP = 5.0 # Seconds
+CMDGW_BINARY = False # Ask Swift for binary records on the command connection, text is used if it does not support them
+CMDGW_NEGOTIATE_TIMEOUT = 2.0 # Seconds
+CMDGW_UNIX_SOCKET = False # Use a unix domain socket instead of loopback TCP for the command connection
+CMDGW_POLL_INTERVAL = 0.01 # Seconds between checks whether Swift has created the unix domain socket
+USE_REACTOR = False # Read swift's command connection and output, and run the community looper, on a single epoll thread
 
 # Error codes
 SWIFT_ERROR_TCP_FAILED = 0
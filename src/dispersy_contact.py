@@ -5,6 +5,7 @@ Created on Nov 21, 2013
 '''
 
 from datetime import datetime, timedelta
+from threading import RLock
 from src.address import Address
 
 from src.logger import get_logger
@@ -33,6 +34,7 @@ class DispersyContact(object):
         self._addresses_sent = datetime.min
         self._addresses_requested = datetime.min
         self._member_id = member_id
+        self._registries = [] # ContactRegistries that index this contact
         
     @classmethod
     def shallow_copy(cls, contact):
@@ -77,6 +79,7 @@ class DispersyContact(object):
     @member_id.setter
     def member_id(self, member_id):
         self._member_id = member_id
+        self._reindex()
         
     def sent_addresses(self):
         self._addresses_sent = datetime.utcnow()
@@ -162,6 +165,7 @@ class DispersyContact(object):
         self.peer = peer
         if addresses_received:
             self._addresses_received = datetime.utcnow()
+        self._reindex()
         
     def has_address(self, address):
         """
@@ -185,6 +189,11 @@ class DispersyContact(object):
             self.peer = Peer([lan_address], [wan_address], [endpoint_id], mid)
         else:
             self.peer.update_address(lan_address, wan_address, endpoint_id)
+        self._reindex()
+    
+    def _reindex(self):
+        for r in self._registries:
+            r.reindex(self)
     
     def merge(self, contact):
         self.merge_stats(contact)
@@ -237,4 +246,120 @@ class DispersyContact(object):
     # The address should be the key
     # We do not use peer because we rely on the user to ensure that the same peer does not get multiple DispersyContacts
     def __hash__(self, *args, **kwargs):
-        return hash(self.address)
\ No newline at end of file
+        return hash(self.address)
+
+class ContactRegistry(object):
+    '''
+    Set of DispersyContacts, indexed by each of their addresses, endpoint ids and member id.
+    A contact notifies the registries it is in whenever its peer or member id changes, so lookups 
+    do not need to walk over all contacts. 
+    The index only narrows down the candidates, which are then checked by the contact itself.
+    Each method holds the lock of the registry, which callers also hold to find and add or merge contacts at once.
+    '''
+    
+    def __init__(self, contacts=[]):
+        self.lock = RLock() # Contacts are updated by the send threads of the endpoints and the thread that receives
+        self._contacts = set()
+        self._by_address = {} # Address : Set(DispersyContact)
+        self._by_id = {} # endpoint id : Set(DispersyContact)
+        self._by_member = {} # member id : Set(DispersyContact)
+        self._keys = {} # DispersyContact : (List(Address), List(str), str)
+        for c in contacts:
+            self.add(c)
+    
+    def add(self, contact):
+        """
+        @type contact: DispersyContact
+        """
+        with self.lock:
+            if contact in self._contacts:
+                return
+            self._contacts.add(contact)
+            contact._registries.append(self)
+            self._index(contact)
+        
+    def discard(self, contact):
+        with self.lock:
+            if not contact in self._contacts:
+                return
+            self._contacts.discard(contact)
+            contact._registries.remove(self)
+            self._unindex(contact)
+        
+    def difference_update(self, contacts):
+        for c in list(contacts):
+            self.discard(c)
+        
+    def reindex(self, contact):
+        with self.lock:
+            self._unindex(contact)
+            self._index(contact)
+        
+    def _index(self, contact):
+        addresses = [contact.address] + (list(contact.peer.addresses) if contact.peer is not None else [])
+        ids = contact.peer.endpoint_ids if contact.peer is not None else []
+        self._keys[contact] = (addresses, ids, contact.member_id)
+        for a in addresses:
+            self._by_address.setdefault(a, set()).add(contact)
+        for i in ids:
+            self._by_id.setdefault(i, set()).add(contact)
+        self._by_member.setdefault(contact.member_id, set()).add(contact)
+            
+    def _unindex(self, contact):
+        addresses, ids, mid = self._keys.pop(contact, ([], [], None))
+        
+        def remove(index, key):
+            contacts = index.get(key)
+            if contacts is not None:
+                contacts.discard(contact)
+                if not contacts:
+                    del index[key]
+                    
+        for a in addresses:
+            remove(self._by_address, a)
+        for i in ids:
+            remove(self._by_id, i)
+        remove(self._by_member, mid)
+        
+    def find(self, address):
+        """
+        @type address: Address
+        @return: The contacts that have this address
+        @rtype: List(DispersyContact)
+        """
+        with self.lock:
+            return [c for c in self._by_address.get(address, ()) if c.has_address(address)]
+    
+    def find_primary(self, address):
+        """
+        @return: The contact with this address as primary address or None
+        @rtype: DispersyContact or None
+        """
+        with self.lock:
+            for c in self._by_address.get(address, ()):
+                if c.address == address:
+                    return c
+        return None
+    
+    def match(self, addresses=[], ids=[], mid=None):
+        """
+        @return: The contacts with this member id or any of these addresses or endpoint ids
+        @rtype: List(DispersyContact)
+        """
+        with self.lock:
+            contacts = set(self._by_member.get(mid, ()))
+            for a in addresses:
+                contacts.update(self._by_address.get(a, ()))
+            for i in ids:
+                contacts.update(self._by_id.get(i, ()))
+            return [c for c in contacts if c.member_id == mid or c.has_any(addresses, ids=ids)]
+        
+    def __contains__(self, contact):
+        return contact in self._contacts
+    
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self._contacts))
+    
+    def __len__(self):
+        return len(self._contacts)
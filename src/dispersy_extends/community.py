@@ -26,8 +26,10 @@ from src.dispersy_extends.payload import SmallFilePayload, FileHashPayload, Addr
 from src.definitions import DISTRIBUTION_DIRECTION, DISTRIBUTION_PRIORITY, NUMBER_OF_PEERS_TO_SYNC, HASH_LENGTH, \
     FILE_HASH_MESSAGE_NAME, SMALL_FILE_MESSAGE_NAME, ADDRESSES_MESSAGE_NAME,\
     MESSAGE_KEY_API_MESSAGE, API_MESSAGE_NAME, PUNCTURE_MESSAGE_NAME,\
-    ADDRESSES_REQUEST_MESSAGE_NAME, PUNCTURE_RESPONSE_MESSAGE_NAME
+    ADDRESSES_REQUEST_MESSAGE_NAME, PUNCTURE_RESPONSE_MESSAGE_NAME, USE_REACTOR
 from src.tools.periodic_task import Looper, PeriodicIntroductionRequest
+from src.tools.reactor import get_reactor
+from src.tools.timer_wheel import TimerWheel
 from src.swift.swift_community import SwiftCommunity
 
 from src.logger import get_logger
@@ -65,10 +67,14 @@ class MyCommunity(Community):
         self._update_bloomfilter = -1
         self._intro_request_updates = {}
         self._api_callback = api_callback
-        self._looper = Looper(sleep=0.1, name="MyCommunity_looper")
+        self._looper = Looper(name="MyCommunity_looper", reactor=get_reactor() if USE_REACTOR else None)
         self._looper.start()
+        self._timer_wheel = TimerWheel(name="MyCommunity_timer_wheel") # Introduction request retries of all candidates
+        self._timer_wheel.start()
         self._lock = Lock()
         self.swift_community = SwiftCommunity(self, self.dispersy.endpoint, api_callback=api_callback)
+        if hasattr(self.dispersy.endpoint, "packet_classifier"): # Let the endpoint know our message types
+            self.dispersy.endpoint.packet_classifier.add_community(self)
         
     def initiate_conversions(self):
         """
@@ -294,7 +300,7 @@ class MyCommunity(Community):
             self._looper.add_task(request_update)
         
         else: # Only add a timeout regardless if walker is enabled or not
-            request_update = IntroductionRequestTimeout(candidate, send_request)
+            request_update = IntroductionRequestTimeout(candidate, send_request, self._timer_wheel)
         
         # request_update should have a candidate field
         self._intro_request_updates.update({candidate.sock_addr : request_update})
@@ -381,6 +387,9 @@ class MyCommunity(Community):
         Taking down this Community, and the SwiftCommunity as well.
         """
         self._looper.stop()
+        self._timer_wheel.stop()
+        if hasattr(self.dispersy.endpoint, "packet_classifier"):
+            self.dispersy.endpoint.packet_classifier.remove_community(self.cid)
         Community.unload_community(self)
         return self.swift_community.unload_community()
     
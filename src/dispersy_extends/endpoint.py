@@ -8,10 +8,13 @@ import time
 import logging
 import Queue
 import random
+import heapq
+import hashlib
+from collections import OrderedDict
 from os import urandom
 from os.path import isfile, dirname, getmtime
 from datetime import datetime, timedelta
-from threading import Thread, Event, RLock
+from threading import Thread, Event, RLock, Lock
 from errno import EADDRINUSE, EADDRNOTAVAIL, EWOULDBLOCK
 from _mysql_exceptions import ProgrammingError
 
@@ -27,17 +30,30 @@ from src.dispersy_extends.candidate import EligibleWalkCandidate
 from src.definitions import MESSAGE_KEY_SWIFT_STATE, MESSAGE_KEY_SOCKET_STATE, MESSAGE_KEY_SWIFT_PID,\
      STATE_RESETTING, STATE_RUNNING, STATE_STOPPED,\
     REPORT_DISPERSY_INFO_TIME, MESSAGE_KEY_DISPERSY_INFO, \
-    MAX_CONCURRENT_DOWNLOADING_SWARMS, ALMOST_DONE_DOWNLOADING_TIME,\
+    MAX_CONCURRENT_DOWNLOADING_SWARMS,\
     BUFFER_DRAIN_TIME, MAX_SOCKET_INITIALIZATION_TIME, ENDPOINT_SOCKET_TIMEOUT,\
     SWIFT_ERROR_TCP_FAILED, PUNCTURE_MESSAGE_NAME, ADDRESSES_MESSAGE_NAME,\
     ENDPOINT_CONTACT_TIMEOUT, ENDPOINT_CHECK, ENDPOINT_ID_LENGTH,\
     MAX_CONCURRENT_SEEDING_SWARMS, MESSAGE_KEY_UPLOAD_STACK, DELETE_CONTENT,\
     ADDRESSES_REQUEST_MESSAGE_NAME, MIN_TIME_BETWEEN_PUNCTURE_REQUESTS,\
     MIN_TIME_BETWEEN_ADDRESSES_MESSAGE, REACHABLE_ENDPOINT_MAX_MESSAGES,\
-    REACHABLE_ENDPOINT_RETRY_ADDRESSES, PUNCTURE_RESPONSE_MESSAGE_NAME
-from src.dispersy_contact import DispersyContact
+    REACHABLE_ENDPOINT_RETRY_ADDRESSES, PUNCTURE_RESPONSE_MESSAGE_NAME,\
+    ENDPOINT_SEND_QUEUE_SIZE, SLEEP_TIME, STRIPE_PACKETS, STRIPE_MIN_PACKETS,\
+    REDUNDANT_MESSAGE_NAMES, REDUNDANT_PATHS, REDUNDANT_RECV_CACHE_SIZE,\
+    INCOMING_BATCH_WINDOW, INCOMING_BATCH_SIZE, ADAPTIVE_SWARM_CONCURRENCY,\
+    SWIFT_SCHEDULING_POLICY, PREEMPT_SWARMS
+from src.dispersy_contact import DispersyContact, ContactRegistry
 from src.peer import Peer
 from src.tools.priority_stack import PriorityStack
+from src.tools.prefix_trie import PrefixTrie
+from src.tools.networks import ip_to_int
+from src.tools.clock import monotonic
+from src.swift.channel_index import ChannelIndex
+from src.swift.swarm_accounting import SwarmAccounting, DOWNLOADING, SEEDING
+from src.swift.swarm_concurrency import SwarmConcurrency
+from src.swift.scheduling import get_policy
+from src.endpoint_health import EndpointHealth
+from src.dispersy_extends.packet_classifier import PacketClassifier
 
 logger = get_logger(__name__)
 
@@ -77,7 +93,14 @@ class SwiftHandler(TunnelEndpoint):
         self._started_downloads = {}
         self._swift_download_stack = PriorityStack()
         self._swift_upload_stack = PriorityStack()
+        self._download_policy = get_policy(SWIFT_SCHEDULING_POLICY)
+        self._upload_policy = get_policy(SWIFT_SCHEDULING_POLICY)
         self._added_peers = {} # Dictionary of sets (paddr, saddr)
+        self._swarms = SwarmAccounting()
+        self._running_swarms = OrderedDict() # key : (upload, item) of swarms popped of a stack, in the order they started
+        self._download_concurrency = SwarmConcurrency(MAX_CONCURRENT_DOWNLOADING_SWARMS, name="downloading")
+        self._seeding_concurrency = SwarmConcurrency(MAX_CONCURRENT_SEEDING_SWARMS, name="seeding")
+        self._last_evaluation = -REPORT_DISPERSY_INFO_TIME # Monotonic time of the last evaluate_swift_swarms
         self._closing = False
         
         self.lock = RLock() # Reentrant Lock
@@ -180,6 +203,7 @@ class SwiftHandler(TunnelEndpoint):
                 return logger.debug("%s is a bad swarm", d.get_def().get_roothash_as_hex())
             self._started_downloads[d.get_def().get_roothash()] = cid
             self._swift.start_download(d)
+            self._swarms.update(d.get_def().get_roothash(), d)
             self.add_peers_to_download(d, cid)
         else:
             logger.warning("This roothash %s was already started!", d.get_def().get_roothash_as_hex())
@@ -204,7 +228,9 @@ class SwiftHandler(TunnelEndpoint):
         """
         if d is not None and d.get_def().get_roothash() in self._started_downloads.keys() and not d.bad_swarm:
             del self._started_downloads[d.get_def().get_roothash()]
-            del self._added_peers[d.get_def().get_roothash()]
+            self._added_peers.pop(d.get_def().get_roothash(), None) # Not there if no peer was added
+            self._swarms.remove(d.get_def().get_roothash())
+            self._running_swarms.pop(d.get_def().get_roothash(), None)
             self._swift.remove_download(d, rm_state, rm_content)
     
     @_swift_runnable_decorator
@@ -269,6 +295,8 @@ class SwiftHandler(TunnelEndpoint):
             except AttributeError:
                 pass                
             self._started_downloads = {} # Reset the started downloads before restarting
+            self._swarms.clear()
+            self._running_swarms.clear()
                             
             while not temp_queue.empty():
                 self._swift_cmd_queue.put(temp_queue.get())
@@ -311,6 +339,8 @@ class SwiftHandler(TunnelEndpoint):
         self._swift.set_on_tcp_connection_callback(self.swift_started_running_callback)
         self._swift.set_on_sockaddr_info_callback(self.sockaddr_info_callback)
         self._swift.set_on_channel_closed_callback(self.channel_closed_callback)
+        self._swift.set_on_moreinfo_callback(self.moreinfo_callback)
+        self._swift.set_on_info_callback(self.info_callback)
         
     def sockaddr_info_callback(self, address, state):
         """
@@ -318,97 +348,187 @@ class SwiftHandler(TunnelEndpoint):
         """
         self.socket_running = state
         
-    def put_swift_upload_stack(self, func, size, timestamp, priority=0, args=(), kwargs={}):
+    def set_scheduling_policy(self, name):
         """
-        Put (func, size, timestamp, args, kwargs) on upload stack
-        Sort by increasing priority first then increasing timestamp
+        Order the files on the stacks, and those that are put from now on, by this policy
+        @param name: Name of the policy, see swift.scheduling.POLICIES
+        """
+        with self.lock:
+            self._download_policy = get_policy(name)
+            self._upload_policy = get_policy(name)
+            # The keys of the previous policy do not compare with those of this one
+            self._swift_download_stack.rekey(lambda item: self._stack_key(self._download_policy, item))
+            self._swift_upload_stack.rekey(lambda item: self._stack_key(self._upload_policy, item))
+    
+    def put_swift_upload_stack(self, func, size, timestamp, priority=0, args=(), kwargs={}, key=None, directory=""):
+        """
+        Put (func, size, timestamp, args, kwargs, key, priority, directory) on upload stack
+        Sort by decreasing priority first, then as the scheduling policy determines
         @param func: Function that will be executed when popped of the stack
         @param size: Size of the file
         @param timestamp: Modification / creation time of file
         @type timestamp: float (Important that it is comparable)
         @param priority: priority of the file
         @type priority: int
+        @param key: Identifies the file, such as its roothash, it is not put on the stack twice
+        @param directory: Directory of the file, used by the scheduling policy
         """
-        if not (func, size, timestamp, args, kwargs) in self._swift_upload_stack:
-            self._swift_upload_stack.put((priority, timestamp), (func, size, timestamp, args, kwargs))
-            self.evaluate_swift_swarms() # Evaluate directly (That is, don't wait for the loop thread to do this)
+        self._put_swift_stack(True, (func, size, timestamp, args, kwargs, key, priority, directory))
                 
-    def put_swift_download_stack(self, func, size, timestamp, priority=0, args=(), kwargs={}):
+    def put_swift_download_stack(self, func, size, timestamp, priority=0, args=(), kwargs={}, key=None, directory=""):
         """
-        Put (func, size, timestamp, args, kwargs) on download stack
-        Sort by increasing priority first then increasing timestamp
+        Put (func, size, timestamp, args, kwargs, key, priority, directory) on download stack
+        Sort by decreasing priority first, then as the scheduling policy determines
         @param func: Function that will be executed when popped of the stack
         @param size: Size of the file
         @param timestamp: Modification / creation time of file
         @type timestamp: float (Important that it is comparable)
         @param priority: priority of the file
         @type priority: int
+        @param key: Identifies the file, such as its roothash, it is not put on the stack twice
+        @param directory: Directory of the file, used by the scheduling policy
         """
-        if not (func, size, timestamp, args, kwargs) in self._swift_download_stack:
-            self._swift_download_stack.put((priority, timestamp), (func, size, timestamp, args, kwargs))
-            self.evaluate_swift_swarms() # Evaluate directly (That is, don't wait for the loop thread to do this)
+        self._put_swift_stack(False, (func, size, timestamp, args, kwargs, key, priority, directory))
+        
+    def _put_swift_stack(self, upload, item):
+        if self._stack_put(upload, item):
+            if PREEMPT_SWARMS and self.preempt_swarm(upload, item[6]):
+                self.evaluate_swift_swarms() # Start the urgent swarm within this tick
+            else:
+                self.request_evaluation()
+        
+    def _stack_put(self, upload, item):
+        """
+        @return: True if the item was put
+        """
+        with self.lock:
+            stack, policy = (self._swift_upload_stack, self._upload_policy) if upload else \
+                (self._swift_download_stack, self._download_policy)
+            key = item[5]
+            if key is not None and key in stack:
+                return False
+            return stack.put(self._stack_key(policy, item), item, key=key, size=item[1])
+
+    def _stack_key(self, policy, item):
+        func, size, timestamp, args, kwargs, key, priority, directory = item
+        return policy.key(priority, size, timestamp, directory)
         
     def pop_swift_upload_stack(self):
         """
-        Pop (func, size, timestamp, args, kwargs) from upload stack
+        Pop (func, size, timestamp, args, kwargs, key, priority, directory) from upload stack
         """
-        item = self._swift_upload_stack.pop()
-        if item is not None:
-            logger.debug("Pop file of size %d with timestamp %f and function arguments %s %s of upload stack", 
-                         item[1], item[2], item[3], item[4])
-            item[0](*item[3], **item[4]) # Call function
+        self._stack_pop(True)
         
     def pop_swift_download_stack(self):
         """
-        Pop (func, size, timestamp, args, kwargs) from download stack
+        Pop (func, size, timestamp, args, kwargs, key, priority, directory) from download stack
         """
-        item = self._swift_download_stack.pop()
+        self._stack_pop(False)
+        
+    def _stack_pop(self, upload):
+        stack, policy = (self._swift_upload_stack, self._upload_policy) if upload else \
+            (self._swift_download_stack, self._download_policy)
+        priority = stack.peek_priority()
+        item = stack.pop()
         if item is not None:
-            logger.debug("Pop file of size %d with timestamp %f and function arguments %s %s of download stack", 
-                         item[1], item[2], item[3], item[4])
+            policy.popped(priority)
+            logger.debug("Pop file of size %d with timestamp %f and function arguments %s %s of %s stack", 
+                         item[1], item[2], item[3], item[4], "upload" if upload else "download")
+            if item[5] is not None:
+                self._running_swarms[item[5]] = (upload, item)
             item[0](*item[3], **item[4]) # Call function
+            
+    def preempt_swarm(self, upload, priority):
+        """
+        If there is no room for another swarm, make room for a file of this priority by removing the running swarm 
+        with the lowest priority below it, the most recently started among equals.
+        Only swarms that were started from the same stack are considered, so that a finished download that is seeding
+        is never put back on the download stack to make room for an upload.
+        The swarm is checkpointed and removed with its state, and put back on the stack it came from.
+        @param upload: True for the seeding swarms, False for the downloading swarms
+        @return: True if a swarm was preempted
+        """
+        with self.lock:
+            if upload:
+                state, full = SEEDING, self._swarms.seeding >= self._seeding_concurrency.allowed
+            else:
+                state, full = DOWNLOADING, (self._swarms.downloading - self._swarms.almost_done >= 
+                                            self._download_concurrency.allowed)
+            if not full:
+                return False
+            victim = None
+            for key, (from_upload_stack, item) in self._running_swarms.iteritems():
+                if from_upload_stack == upload and item[6] < priority and self._swarms.state(key) == (state, False) and \
+                        (victim is None or item[6] <= victim[1][6]):
+                    victim = (key, item)
+            if victim is None:
+                return False
+            key, item = victim
+            d = self._swift.roothash2dl.get(key)
+            if d is None:
+                return False
+            logger.info("Preempt %s with priority %d for a file with priority %d", 
+                        d.get_def().get_roothash_as_hex(), item[6], priority)
+            self.swift_checkpoint(d)
+            self.swift_remove_download(d, False, False) # Keep state and content, as SwiftCommunity.pause_download does
+            if self._stack_put(upload, item):
+                d.stacked()
+            return True
+    
+    def request_evaluation(self):
+        """
+        Evaluate directly (That is, don't wait for the loop thread to do this), unless that already happened this tick.
+        Otherwise the next tick of the loop will, so that adding many files at once costs a single evaluation per tick.
+        """
+        if monotonic() - self._last_evaluation >= REPORT_DISPERSY_INFO_TIME:
+            self.evaluate_swift_swarms()
+    
+    def adapt_swarm_concurrency(self):
+        """
+        Let the number of swarms that are allowed to download and seed at once follow the goodput of the running swarms.
+        Should be called once per tick.
+        """
+        if not ADAPTIVE_SWARM_CONCURRENCY:
+            return
+        with self.lock:
+            downloading = self._swarms.swarms(DOWNLOADING)
+            seeding = self._swarms.swarms(SEEDING)
+        self._download_concurrency.update(len(downloading), sum([d.speed("down") for d in downloading]), 
+                                          sum([self.swarm_send_queue(d.get_def().get_roothash()) for d in downloading]))
+        self._seeding_concurrency.update(len(seeding), sum([d.speed("up") for d in seeding]), 
+                                         sum([self.swarm_send_queue(d.get_def().get_roothash()) for d in seeding]))
+    
+    def swarm_send_queue(self, roothash):
+        """
+        @return: The sum of the send queues of the channels of this swarm
+        """
+        return 0 # Implemented by MultiEndpoint
     
     def evaluate_swift_swarms(self):
         """
-        This function determines the state of all downloading and seeding swarms.
-        It determines the number of swarms (almost) done downloading, 
-        and subsequently pops new swarms to be created of the stack if there is room.
-        It tracks both the seeding and downloading swarms to see if they have peers
-        to exchange data with. If there are others on the stack and swarms are not useful, 
-        they are marked to be removed.
+        This function pops new swarms to be created of the stack if there is room,
+        given the number of downloading swarms that are not almost done and the number of seeding swarms.
+        These numbers are kept up to date by SwarmAccounting as INFO comes in from Swift.
+        If there are others on the stack, the downloading or seeding swarms that have no peers
+        to exchange data with are marked to be removed.
         @return: The swarms that should be removed
         """
-        if not self.socket_running: # TODO: This does not seem to be useful
-            return []
-        seeding_swarms = 0
-        downloading_swarms = 0
-        almost_done_swarms = 0
-        swarms_to_be_removed = []
-        for d in self.swift.roothash2dl.values():
-            if not isinstance(d, MultiEndpoint): # MultiEndpoint is added to the roothash2dl list in open()
-                if d.downloading():
-                    downloading_swarms += 1
-                    speed = d.speed("down")
-                    if speed != 0:
-                        # The estimated number of seconds left before download is finished
-                        dw_time_left = d.dynasize * (1 - d.progress) / 1024 / speed
-                        if dw_time_left < ALMOST_DONE_DOWNLOADING_TIME:
-                            almost_done_swarms += 1
-                            logger.debug("Estimate %s to be done downloading in %f", 
-                                         d.get_def().get_roothash_as_hex(), dw_time_left)
-                    if len(self._swift_download_stack) and not d.has_peer():
-                        swarms_to_be_removed.append(d)
-                elif d.seeding() or d.initialized(): # Seeding or initializing
-                    seeding_swarms += 1
-                    if len(self._swift_upload_stack) and not d.has_peer():
-                        swarms_to_be_removed.append(d)
-        # Start new swarms if there is room
-        for _ in range(downloading_swarms - almost_done_swarms, MAX_CONCURRENT_DOWNLOADING_SWARMS):
-            self.pop_swift_download_stack()
-        for _ in range(seeding_swarms, MAX_CONCURRENT_SEEDING_SWARMS):
-            self.pop_swift_upload_stack()
+        with self.lock:
+            self._last_evaluation = monotonic()
+            if not self.socket_running: # TODO: This does not seem to be useful
+                return []
+            swarms_to_be_removed = []
+            if len(self._swift_download_stack):
+                swarms_to_be_removed.extend(self._swarms.peerless(DOWNLOADING))
+            if len(self._swift_upload_stack):
+                swarms_to_be_removed.extend(self._swarms.peerless(SEEDING))
+            # Start new swarms if there is room
+            for _ in range(self._swarms.downloading - self._swarms.almost_done, self._download_concurrency.allowed):
+                self.pop_swift_download_stack()
+            for _ in range(self._swarms.seeding, self._seeding_concurrency.allowed):
+                self.pop_swift_upload_stack()
         # This callback is used by API to figure out if the FilePusher should pause or unpause its efforts
-        self.do_callback(MESSAGE_KEY_UPLOAD_STACK, len(self._swift_upload_stack), sum([f[1] for f in self._swift_upload_stack]))
+        self.do_callback(MESSAGE_KEY_UPLOAD_STACK, len(self._swift_upload_stack), self._swift_upload_stack.total_size())
         return swarms_to_be_removed
             
     def retrieve_download_impl(self, roothash):
@@ -443,6 +563,20 @@ class SwiftHandler(TunnelEndpoint):
         except KeyError:
             logger.exception("Channel %s %s %s could not be removed", roothash, str(paddr), str(saddr))
             
+    def moreinfo_callback(self, roothash, midict):
+        """
+        Callback from SwiftProcess with the MOREINFO dictionary of a swarm
+        """
+        pass # Implemented by MultiEndpoint
+    
+    def info_callback(self, roothash, d):
+        """
+        Callback from SwiftProcess after d has processed an INFO, or an ERROR
+        """
+        if not isinstance(d, MultiEndpoint): # MultiEndpoint is added to the roothash2dl list in open()
+            with self.lock:
+                self._swarms.update(roothash, d)
+            
         
 class CommonEndpoint(SwiftHandler):
     """
@@ -454,7 +588,7 @@ class CommonEndpoint(SwiftHandler):
         SwiftHandler.__init__(self, swift_process, api_callback)
         self.start_time = datetime.utcnow()
         self.id = urandom(ENDPOINT_ID_LENGTH)
-        self.dispersy_contacts = set()
+        self.dispersy_contacts = ContactRegistry()
         self.is_alive = False # The endpoint is alive between open and close
         self.address = address
             
@@ -500,14 +634,15 @@ class CommonEndpoint(SwiftHandler):
             contact.rcvd(len(packets), _bytes, address=address)
         else: # Sending packets
             contact.sent(len(packets), _bytes, address=address)
-        # Merge this contact with existing one, if present
-        for dc in self.dispersy_contacts:
-            if dc.has_address(contact.address): # There should be only one contact that fits the description
+        contacts = self.dispersy_contacts
+        with contacts.lock: # Find and add at once, the send threads and the receiving thread both get here
+            # Merge this contact with existing one, if present
+            for dc in contacts.find(contact.address): # There should be only one contact that fits the description
                 dc.merge(contact)
                 if recv and dc.total_rcvd() == contact.total_rcvd(): # First time receiving anything
                     return community, dc
                 return community, None
-        self.dispersy_contacts.add(contact) # New address
+            contacts.add(contact) # New address
         if recv:
             return community, contact
         return community, None
@@ -528,28 +663,27 @@ class CommonEndpoint(SwiftHandler):
         @param ids: List of endpoint ids
         @return: The DispersyContact that represents this peer
         """
-        same_contacts = []
-        for dc in self.dispersy_contacts:
-            if dc.member_id == mid or dc.has_any(lan_addresses + wan_addresses, ids=ids): # Both lan and wan can have arrived
-                same_contacts.append(dc)
-        # Quite possibly some of these addresses are not public, and may therefore not be reachable by each local address
-        if len(same_contacts) == 0: # Can happen with endpoints that have not had contact yet
-            dc = DispersyContact(lan_addresses[0], community_id=community.cid, 
-                                 addresses_received=True, member_id=mid)
-            self.dispersy_contacts.add(dc)
-        elif len(same_contacts) == 1: # The normal case
-            dc = same_contacts[0]
-        else: # Merge same_contacts into one
-            self.dispersy_contacts.difference_update(set(same_contacts)) # Remove all but first from set
-            for c in same_contacts:
-                if c.address in lan_addresses + wan_addresses: # At least one of them matches the description
-                    dc = c
-            for c in same_contacts:
-                if c != dc: # Merge with the others
-                    dc.merge(c) # Merge
-            self.dispersy_contacts.add(dc)
-        dc.member_id = mid # Set member id
-        dc.set_peer(Peer(lan_addresses, wan_addresses, ids, mid), True) # update the peer to include all addresses
+        with self.dispersy_contacts.lock:
+            # Both lan and wan can have arrived
+            same_contacts = self.dispersy_contacts.match(lan_addresses + wan_addresses, ids=ids, mid=mid)
+            # Quite possibly some of these addresses are not public, and may therefore not be reachable by each local address
+            if len(same_contacts) == 0: # Can happen with endpoints that have not had contact yet
+                dc = DispersyContact(lan_addresses[0], community_id=community.cid, 
+                                     addresses_received=True, member_id=mid)
+                self.dispersy_contacts.add(dc)
+            elif len(same_contacts) == 1: # The normal case
+                dc = same_contacts[0]
+            else: # Merge same_contacts into one
+                self.dispersy_contacts.difference_update(set(same_contacts)) # Remove all but first from set
+                for c in same_contacts:
+                    if c.address in lan_addresses + wan_addresses: # At least one of them matches the description
+                        dc = c
+                for c in same_contacts:
+                    if c != dc: # Merge with the others
+                        dc.merge(c) # Merge
+                self.dispersy_contacts.add(dc)
+            dc.member_id = mid # Set member id
+            dc.set_peer(Peer(lan_addresses, wan_addresses, ids, mid), True) # update the peer to include all addresses
         return dc
     
     def get_community(self, community_id):
@@ -568,10 +702,8 @@ class CommonEndpoint(SwiftHandler):
         Get contact by address or member id
         @rtype: DispersyContact or None
         """
-        for dc in self.dispersy_contacts:
-            if dc.member_id == mid or dc.has_address(address):
-                return dc
-        return None
+        contacts = self.dispersy_contacts.find(address) or self.dispersy_contacts.match(mid=mid)
+        return contacts[0] if contacts else None
                 
     def last_contact(self):
         """
@@ -589,7 +721,7 @@ class MultiEndpoint(CommonEndpoint):
     SwiftEndpoint are not explicitly added, rather each time Swift returns a new address
     to listen to, we add an endpoint to represent it. 
     Addresses can be given on initialization or dynamically via the interface_came_up method.
-    Similarly if an endpoint socket has not been functioning for ENDPOINT_SOCKET_TIMEOUT it is removed.
+    Similarly if an endpoint socket has been in error for ENDPOINT_DEAD_TIME it is removed.
     Important is the routing of messages through these endpoints, which is determined for each packet
     and each candidate it is supposed to go to. Packets can be routed through any endpoint,
     to any address of the peer it needs to go to, defined by determine_endpoint.
@@ -602,6 +734,13 @@ class MultiEndpoint(CommonEndpoint):
         self._thread_stop_event = Event()
         self._endpoint = None
         self.swift_endpoints = []
+        self._channel_index = ChannelIndex() # Channels of all swarms by peer address, kept up to date by MOREINFO
+        self._pending_moreinfo = {} # roothash : MoreInfo that has not been read yet
+        self._moreinfo_lock = Lock()
+        self._subnet_cache = (None, {}) # (Endpoints with their address and interface, subnet tries) of _subnets
+        self._recent_redundant = OrderedDict() # Digests of recently received REDUNDANT_MESSAGE_NAMES packets
+        self.packet_classifier = PacketClassifier(
+            lambda data: self._dispersy.convert_packet_to_meta_message(data, load=False, auto_load=False))
         CommonEndpoint.__init__(self, swift_process, api_callback=api_callback)
         
         if swift_process:
@@ -623,7 +762,9 @@ class MultiEndpoint(CommonEndpoint):
     def send(self, candidates, packets):
         """
         Send packets to each candidate in turn
+        The packets are queued at the chosen endpoint, which sends them in its own thread
         """
+        send_success = False
         with self.lock:
             if not self._swift.is_ready() or not self.socket_running:
                 if not self._dequeueing_cmd_queue: # Functions are dequeued when swift is running, hence we're not keeping messages to be send
@@ -631,10 +772,52 @@ class MultiEndpoint(CommonEndpoint):
                 return False
             logger.debug("Send %s %d", [c.sock_addr for c in candidates], len(packets))
             
+            redundant, ordinary = [], packets
+            if len(self.swift_endpoints) > 1:
+                redundant, ordinary = self._split_redundant(packets)
             for c in candidates:
-                new_c = self.determine_endpoint(c, packets)
-                send_success = self._endpoint.send(new_c, packets)
-                self.update_dispersy_contacts(new_c.sock_addr, packets, recv=False)
+                paths = self._redundant_endpoints(c, redundant) if redundant else []
+                if len(paths) > 1:
+                    # Only the REDUNDANT_MESSAGE_NAMES packets go over every path, the receiver drops only those duplicates
+                    for e, paddr in paths:
+                        new_c = WalkCandidate(paddr.addr(), True, paddr.addr(), paddr.addr(), u"unknown")
+                        send_success = e.enqueue_send(new_c, redundant) or send_success
+                        self.update_dispersy_contacts(new_c.sock_addr, redundant, recv=False)
+                    remaining = ordinary
+                else:
+                    remaining = packets
+                if remaining:
+                    send_success = self._send_single_path(c, remaining) or send_success
+        return send_success
+    
+    def _split_redundant(self, packets):
+        """
+        @return: (packets in REDUNDANT_MESSAGE_NAMES, the other packets), both in their original order
+        """
+        redundant = []
+        ordinary = []
+        for p in packets:
+            (redundant if self._packet_name(p) in REDUNDANT_MESSAGE_NAMES else ordinary).append(p)
+        return redundant, ordinary
+    
+    def _send_single_path(self, candidate, packets):
+        """
+        Send packets through a single endpoint, or striped over several if there are enough of them
+        @return: True if the packets were queued
+        """
+        send_success = False
+        stripes = []
+        if STRIPE_PACKETS and len(packets) >= STRIPE_MIN_PACKETS and len(self.swift_endpoints) > 1:
+            stripes = self._stripe_packets(candidate, packets)
+        if len(stripes) > 1:
+            for e, paddr, ps in stripes:
+                new_c = WalkCandidate(paddr.addr(), True, paddr.addr(), paddr.addr(), u"unknown")
+                send_success = e.enqueue_send(new_c, ps) or send_success
+                self.update_dispersy_contacts(new_c.sock_addr, ps, recv=False)
+            return send_success
+        new_c = self.determine_endpoint(candidate, packets)
+        send_success = self._endpoint.enqueue_send(new_c, packets)
+        self.update_dispersy_contacts(new_c.sock_addr, packets, recv=False)
         return send_success
             
     def open(self, dispersy):
@@ -644,6 +827,7 @@ class MultiEndpoint(CommonEndpoint):
                     
         self.is_alive = True
         
+        # Not on the reactor, even if USE_REACTOR, because evaluating the swarms takes the lock and starts swarms
         self._thread_loop = Thread(target=self._loop, name="MultiEndpoint_periodic_loop")
         self._thread_loop.daemon = True
         self._thread_loop.start()
@@ -668,7 +852,7 @@ class MultiEndpoint(CommonEndpoint):
         logger.info("Add %s", addr)
         with self.lock:
             new_endpoint = SwiftEndpoint(self._swift, addr, api_callback=self._api_callback)
-            new_endpoint.dispersy_contacts = set([DispersyContact.shallow_copy(dc) for dc in self.dispersy_contacts]) # Initialize
+            new_endpoint.dispersy_contacts = ContactRegistry([DispersyContact.shallow_copy(dc) for dc in self.dispersy_contacts]) # Initialize
             try:
                 new_endpoint.open(self._dispersy)
             except AttributeError:
@@ -748,6 +932,34 @@ class MultiEndpoint(CommonEndpoint):
                     last_contacts.append((e, paddr, contact.last_contact(paddr)))
         return sorted(last_contacts, key=lambda x: x[2], reverse=True)
     
+    def _subnets(self):
+        """
+        Put the subnet of each endpoint in a trie, such that each peer address needs only one lookup.
+        The tries are kept until an endpoint is added or removed, or changes its address or interface.
+        @return: Dict(family : PrefixTrie of List((index, SwiftEndpoint)))
+        """
+        endpoints = list(self.swift_endpoints)
+        signature = [(e, e.address, e.address.interface) for e in endpoints]
+        cached_signature, subnets = self._subnet_cache
+        if signature == cached_signature:
+            return subnets
+        subnets = {socket.AF_INET : PrefixTrie(32), socket.AF_INET6 : PrefixTrie(128)}
+        for i, e in enumerate(endpoints):
+            if e.address.interface is None or e.address.family not in subnets:
+                continue
+            try:
+                netmask = ip_to_int(e.address.interface.netmask, e.address.family)
+                network = ip_to_int(e.address.ip, e.address.family) & netmask
+            except (TypeError, ValueError, socket.error): # No netmask
+                continue
+            subnet = subnets[e.address.family].get(network, PrefixTrie.prefix_length(netmask))
+            if subnet is None:
+                subnet = []
+                subnets[e.address.family].insert(network, PrefixTrie.prefix_length(netmask), subnet)
+            subnet.append((i, e))
+        self._subnet_cache = (signature, subnets)
+        return subnets
+    
     def _subnet_endpoints(self, contact, endpoints=[]):
         """
         This function returns the endpoints that reside in the same subnet.
@@ -757,31 +969,40 @@ class MultiEndpoint(CommonEndpoint):
         @param endpoints: List of endpoints to use (defaults to self.swift_endpoints)
         @return: List((SwiftEndpoint, peer Address))
         """
-        if not endpoints:
-            endpoints = self.swift_endpoints
+        allowed = set(endpoints) if endpoints else None
+        subnets = self._subnets()
+        peer_addresses = {} # SwiftEndpoint : List(Address)
         same_subnet = []
-        for e in endpoints:
-            for paddr in contact.get_peer_addresses(e.address, e.wan_address):
-                if e.address.same_subnet(paddr.ip):
-                    same_subnet.append((e, paddr))
-        return same_subnet
+        for paddr in contact.addresses:
+            if paddr.family not in subnets:
+                continue
+            for subnet in subnets[paddr.family].matches(ip_to_int(paddr.ip, paddr.family)):
+                for i, e in subnet:
+                    if allowed is not None and not e in allowed:
+                        continue
+                    if not e in peer_addresses:
+                        peer_addresses[e] = contact.get_peer_addresses(e.address, e.wan_address)
+                    if paddr in peer_addresses[e]: # The address this endpoint would use for the peer
+                        same_subnet.append((i, peer_addresses[e].index(paddr), e, paddr))
+        return [(e, paddr) for _, _, e, paddr in sorted(same_subnet)]
     
     def _get_channels(self, contact):
         """
-        Retrieve channels from DownloadImpls
+        Retrieve channels from the channel index
         Include the socket and peer address as well
         @type contact: DispersyContact
         @rtype List((Dict, Address, Address))
         """
-        channels = []
-        for d in self.swift.roothash2dl.values():
-            if not isinstance(d, MultiEndpoint) and "channels" in d.midict:
-                for c in d.midict.get("channels", []):
-                    saddr = Address.unknown(c["socket_ip"].encode("ascii", "ignore") + ":" + str(c["socket_port"]))
-                    paddr = Address.unknown(c["ip"].encode("ascii", "ignore") + ":" + str(c["port"]))
-                    if contact.has_address(paddr):
-                        channels.append((c, saddr, paddr))
-        return channels
+        return [(c.info, c.sock_addr, c.peer_addr) for c in self._channel_index.channels(self._contact_addresses(contact))]
+    
+    def _contact_addresses(self, contact):
+        """
+        @type contact: DispersyContact
+        @return: All addresses that belong to this contact
+        """
+        addresses = set(contact.addresses)
+        addresses.add(contact.address)
+        return addresses
     
     def _get_channel_speeds(self, contact):
         """
@@ -832,28 +1053,90 @@ class MultiEndpoint(CommonEndpoint):
         estimated send time = send_queue / upload_speed (socket total) + packet_size / upload_speed(channel) 
         or if channel upspeed is 0                                     + round trip time / 2
         Only nonzero total upspeeds will be added to the list.
+        The first term is cached per peer by the channel index, and only changes with MOREINFO.
         @type contact: DispersyContact
         @param packet_size = Total amount of bytes that need to be sent
         @rtype: List((SwiftEndpoint, Address, float))
         """
         if not endpoints:
             endpoints = self.swift_endpoints
-        channels = self._get_channels(contact)
-        upspeeds ={}
-        for c, saddr, _ in channels:
-            upspeeds[saddr] = upspeeds.get(saddr, 0) + c["cur_speed_up"]
+        endpoints = dict([(e.address, e) for e in endpoints])
         r = []
-        for e in endpoints:
-            for c, saddr, paddr in channels:
-                if e.address == saddr and upspeeds[saddr] > 0: # Only add if we have measured speed                    
-                    est = c["send_queue"] / float(upspeeds[saddr]) # send_queue (bytes) / total upload_speed (bytes/s)  
-                    if c["cur_speed_up"] > 0:
-                        est += packet_size / float(c["cur_speed_up"]) # packet_size (bytes) / upload_speed (bytes/s)
-                    else:
-                        est += c["avg_rtt"] / float(10**6) / 2 # avg_rtt (us) / 10^6 / 2
-                    r.append((e, paddr, est))
+        for c, est in self._channel_index.ranked(self._contact_addresses(contact)):
+            e = endpoints.get(c.sock_addr)
+            if e is None:
+                continue
+            if c.speed_up > 0:
+                est += packet_size / float(c.speed_up) # packet_size (bytes) / upload_speed (bytes/s)
+            else:
+                est += c.avg_rtt / float(10**6) / 2 # avg_rtt (us) / 10^6 / 2
+            r.append((e, c.peer_addr, est * e.health.expected_transmissions()))
         return sorted(r, key=lambda x: x[2]) # From low to high
     
+    def _stripe_packets(self, candidate, packets, endpoints=[]):
+        """
+        Split the packets over the endpoints that have channels with this peer, according to their capacity.
+        Each endpoint's capacity is the upload speed of its channels with the peer, 
+        and each already has its send_queue waiting. Packets are handed out one by one, in their original order,
+        to the endpoint that would finish sending it first: (send_queue + assigned + packet) / upload_speed.
+        Within each stripe the packets keep their original order.
+        @type candidate: Candidate
+        @param endpoints: List of endpoints to use (defaults to self.swift_endpoints)
+        @return: List((SwiftEndpoint, peer Address, List(str))), only endpoints with packets
+        """
+        if not endpoints:
+            endpoints = self.swift_endpoints
+        endpoints = dict([(x.address, x) for x in endpoints if x.is_usable()])
+        contact = self.dispersy_contacts.find_primary(Address.tuple(candidate.sock_addr))
+        if contact is None:
+            contact = DispersyContact(Address.tuple(candidate.sock_addr))
+        capacity = {} # SwiftEndpoint : [upload_speed, send_queue, peer Address, channel upload speed]
+        for c in self._channel_index.channels(self._contact_addresses(contact)):
+            e = endpoints.get(c.sock_addr)
+            if e is None or c.speed_up <= 0:
+                continue
+            cap = capacity.setdefault(e, [0.0, 0, c.peer_addr, 0.0])
+            cap[0] += c.speed_up
+            cap[1] += c.send_queue
+            if c.speed_up > cap[3]: # Use the peer address of the fastest channel
+                cap[2] = c.peer_addr
+                cap[3] = c.speed_up
+        if len(capacity) < 2:
+            return []
+        heap = [(q / up, i, x) for i, (x, (up, q, _, _)) in enumerate(capacity.iteritems())]
+        heapq.heapify(heap)
+        assigned = dict([(x, []) for x in capacity.iterkeys()])
+        for packet in packets:
+            finish, i, first = heap[0]
+            assigned[first].append(packet)
+            heapq.heapreplace(heap, (finish + len(packet) / capacity[first][0], i, first))
+        return [(x, capacity[x][2], ps) for x, ps in assigned.iteritems() if ps]
+    
+    def _redundant_endpoints(self, candidate, packets, endpoints=[]):
+        """
+        Choose the REDUNDANT_PATHS best endpoints that do not share their local ip, 
+        in the same order of preference as determine_endpoint.
+        @type candidate: Candidate
+        @param endpoints: List of endpoints to use (defaults to self.swift_endpoints)
+        @return: List((SwiftEndpoint, peer Address))
+        """
+        addr = Address.tuple(candidate.sock_addr)
+        contact = self.dispersy_contacts.find_primary(addr)
+        if contact is None:
+            contact = DispersyContact(addr)
+        total_size = sum([len(packet) for packet in packets])
+        options = ([(e, p) for e, p, _ in self._sort_endpoints_by_estimated_response_time(contact, total_size, endpoints)] + 
+                   [(e, p) for e, p, _ in self._last_endpoints(contact.address, endpoints)] + 
+                   self._subnet_endpoints(contact, endpoints) + self._pick_public_endpoints_at_random(contact, endpoints))
+        paths = []
+        for e, paddr in options:
+            if (e is not None and e.is_usable() and 
+                not any(e.address.ip == o.address.ip for o, _ in paths)):
+                paths.append((e, paddr))
+                if len(paths) == REDUNDANT_PATHS:
+                    break
+        return paths
+    
     def _pick_public_endpoints_at_random(self, contact, endpoints=[]):
         """
         Determine public endpoints and public contact addresses, choose from these at random
@@ -886,31 +1169,29 @@ class MultiEndpoint(CommonEndpoint):
         
         def determine(addr):
             # Find the peer addresses
-            contact = DispersyContact(addr) # Default to the address supplied
-            for dc in self.dispersy_contacts:
-                if dc.address == addr:
-                    contact = dc
-                    break
+            contact = self.dispersy_contacts.find_primary(addr)
+            if contact is None:
+                contact = DispersyContact(addr) # Default to the address supplied
             # Choose the endpoint that currently has the highest transfer speed with this peer
             for e, paddr, ert in self._sort_endpoints_by_estimated_response_time(contact, total_size):
-                if e is not None and e.is_alive and e.socket_running:
+                if e is not None and e.is_usable():
                     logger.debug("%d bytes will be sent %s to %s with estimated response time of %f ms", total_size, 
                                  e, paddr, ert * 1000)
                     return (e, paddr.addr())
             # Choose the endpoint that was the last to receive anything from this contact
             for e, paddr, last_contact in self._last_endpoints(contact.address):
-                if e is not None and e.is_alive and e.socket_running:
+                if e is not None and e.is_usable():
                     logger.debug("%d bytes will be sent with %s that had contact with %s at %s", total_size, e, paddr, 
                                  last_contact.strftime("%H:%M:%S"))
                     return (e, paddr.addr())
             # In case no contact has been made with this peer (or those endpoint are not available)
             for e, paddr in self._subnet_endpoints(contact):
-                if e is not None and e.is_alive and e.socket_running:
+                if e is not None and e.is_usable():
                     logger.debug("%d bytes will be sent with %s in the same subnet as %s", total_size, e, paddr)
                     return (e, paddr.addr())
             # Pick one endpoint at random and one of the peer's endpoints as long as they are public
             for e, paddr in self._pick_public_endpoints_at_random(contact):
-                if e is not None and e.is_alive and e.socket_running:
+                if e is not None and e.is_usable():
                     logger.debug("%d bytes will be sent with public endpoint %s and public peer %s", total_size, e, paddr)
                     return (e, paddr.addr())
             return recur(self._endpoint, len(self.swift_endpoints))
@@ -924,11 +1205,26 @@ class MultiEndpoint(CommonEndpoint):
             self._endpoint = self.swift_endpoints[0]
         return candidate
         
+    def _packet_name(self, data):
+        """
+        @return: The name of the meta message of this packet, or ??? if unknown
+        """
+        return self.packet_classifier.name(data)
+        
+    def _is_duplicate(self, data):
+        """
+        Messages in REDUNDANT_MESSAGE_NAMES arrive once per path, only the first should reach Dispersy
+        """
+        digest = hashlib.sha1(data).digest()
+        if digest in self._recent_redundant:
+            return True
+        self._recent_redundant[digest] = None
+        if len(self._recent_redundant) > REDUNDANT_RECV_CACHE_SIZE:
+            self._recent_redundant.popitem(last=False)
+        return False
+        
     def i2ithread_data_came_in(self, session, sock_addr, data, incoming_addr=Address()):
-        try:
-            name = self._dispersy.convert_packet_to_meta_message(data, load=False, auto_load=False).name
-        except:
-            name = "???"
+        name = self._packet_name(data)
         logger.debug("%20s <- %15s:%-5d %30s %4d bytes", str(incoming_addr), sock_addr[0], sock_addr[1], name, len(data))
         self._dispersy.statistics.dict_inc(self._dispersy.statistics.endpoint_recv, name)
         
@@ -936,48 +1232,61 @@ class MultiEndpoint(CommonEndpoint):
         # to keep things clean.
         self.update_dispersy_contacts(sock_addr, [data], recv=True)
         
+        deliver = not (name in REDUNDANT_MESSAGE_NAMES and self._is_duplicate(data))
         e = self.get_endpoint(incoming_addr)
         if e is not None:
-            e.i2ithread_data_came_in(session, sock_addr, data) # Ensure that you fool the SwiftEndpoint as well
+            e.i2ithread_data_came_in(session, sock_addr, data, deliver=deliver) # Ensure that you fool the SwiftEndpoint as well
+            if not deliver:
+                return
             if name == ADDRESSES_REQUEST_MESSAGE_NAME: # Apparently someone does not know us yet (Perhaps my wan is not what I think it is)
                 message = self._dispersy.convert_packet_to_message(data, load=False, auto_load=False)
                 e.vote_wan_address(message.payload.wan_address, message.payload.sender_lan, message.payload.sender_wan)
             return
         logger.warning("This %s should be represented by an endpoint", sock_addr)
         # In case the incoming_addr does not match any of the endpoints
-        TunnelEndpoint.i2ithread_data_came_in(self, session, sock_addr, data)        
+        if deliver:
+            TunnelEndpoint.i2ithread_data_came_in(self, session, sock_addr, data)        
         
     def dispersythread_data_came_in(self, sock_addr, data, timestamp):
         self._dispersy.on_incoming_packets([(EligibleWalkCandidate(sock_addr, True, sock_addr, sock_addr, u"unknown"), data)], True, timestamp)
     
     def _loop(self):
         while not self._thread_stop_event.is_set():
-            self.dequeue_swift_queue()
-            swarms_to_be_removed = self.evaluate_swift_swarms()
-            for d in swarms_to_be_removed:
-                # Keeping state if keeping content (Because it would have been seeding at some point then)
-                self.swift_remove_download(d, DELETE_CONTENT, DELETE_CONTENT) 
-            if int(time.time()) % ENDPOINT_CHECK == 0:
-                self.check_endpoints()
+            self._maintain()
             self._thread_stop_event.wait(REPORT_DISPERSY_INFO_TIME)
-            data = []
-            for e in self.swift_endpoints:
-                data.append({"address" : e.address, "contacts" : len(e.dispersy_contacts),
-                             "num_sent" : sum([dc.num_sent() for dc in e.dispersy_contacts]), 
-                             "bytes_sent" : sum([dc.total_sent() for dc in e.dispersy_contacts]), 
-                             "num_rcvd" : sum([dc.num_rcvd() for dc in e.dispersy_contacts]),
-                             "bytes_rcvd" : sum([dc.total_rcvd() for dc in e.dispersy_contacts])})
-            self.do_callback(MESSAGE_KEY_DISPERSY_INFO, {"multiendpoint" : data})
+            self._report()
             
-    def check_endpoints(self):
-        marked_remove = []
+    def _maintain(self):
+        self.apply_moreinfo()
+        self.dequeue_swift_queue()
+        self.adapt_swarm_concurrency()
+        swarms_to_be_removed = self.evaluate_swift_swarms()
+        for d in swarms_to_be_removed:
+            # Keeping state if keeping content (Because it would have been seeding at some point then)
+            self.swift_remove_download(d, DELETE_CONTENT, DELETE_CONTENT) 
+        self.remove_dead_endpoints()
+        if int(time.time()) % ENDPOINT_CHECK == 0:
+            self.check_endpoints()
+            
+    def _report(self):
+        data = []
         for e in self.swift_endpoints:
-            # In case an error has persisted for more than ENDPOINT_SOCKET_TIMEOUT seconds, remove endpoint
-            if e._socket_running[0] > 0 and e._socket_running[1] < datetime.utcnow() - timedelta(seconds=ENDPOINT_SOCKET_TIMEOUT):
-                marked_remove.append(e)
-        for e in marked_remove:
+            data.append({"address" : e.address, "contacts" : len(e.dispersy_contacts),
+                         "num_sent" : sum([dc.num_sent() for dc in e.dispersy_contacts]), 
+                         "bytes_sent" : sum([dc.total_sent() for dc in e.dispersy_contacts]), 
+                         "num_rcvd" : sum([dc.num_rcvd() for dc in e.dispersy_contacts]),
+                         "bytes_rcvd" : sum([dc.total_rcvd() for dc in e.dispersy_contacts])})
+        self.do_callback(MESSAGE_KEY_DISPERSY_INFO, {"multiendpoint" : data})
+            
+    def remove_dead_endpoints(self):
+        """
+        Remove the endpoints whose health, as kept up to date by SOCKETINFO and MOREINFO, says they are dead
+        """
+        for e in [e for e in self.swift_endpoints if e.health.is_dead()]:
+            logger.info("Removing %s with %s", e, e.health)
             self.remove_endpoint(e)
             
+    def check_endpoints(self):
         def send_puncture(endpoint, cid, address, id_):
             if not id_ is None:
                 endpoint.send_puncture_message(self.get_community(cid), address, id_)
@@ -1116,6 +1425,9 @@ class MultiEndpoint(CommonEndpoint):
     
     def restart_swift(self, error_code=-1):
         SwiftHandler.restart_swift(self, error_code)
+        with self._moreinfo_lock:
+            self._pending_moreinfo = {}
+        self._channel_index.clear() # A new swift starts without channels
         for e in self.swift_endpoints: # We need to add the reference to the new swift to each endpoint
             e._swift = self._swift
         
@@ -1195,8 +1507,43 @@ class MultiEndpoint(CommonEndpoint):
         if dc.addresses_sent + timedelta(seconds=MIN_TIME_BETWEEN_ADDRESSES_MESSAGE) < datetime.utcnow():
             self.send_addresses_to_communities(community, dc)
     
+    def swift_remove_download(self, d, rm_state, rm_content):
+        if d is not None:
+            with self._moreinfo_lock:
+                self._pending_moreinfo.pop(d.get_def().get_roothash(), None)
+            self._channel_index.remove_swarm(d.get_def().get_roothash())
+            for e in self.swift_endpoints:
+                e.health.remove(d.get_def().get_roothash())
+        CommonEndpoint.swift_remove_download(self, d, rm_state, rm_content)
+        
+    def swarm_send_queue(self, roothash):
+        return sum([c.send_queue for c in self._channel_index.swarm(roothash)])
+        
+    def moreinfo_callback(self, roothash, midict):
+        """
+        Only keep the report, it is read in the next iteration of the loop by apply_moreinfo
+        @type midict: MoreInfo
+        """
+        with self._moreinfo_lock:
+            self._pending_moreinfo[roothash] = midict
+            
+    def apply_moreinfo(self):
+        """
+        Update the channel index and the endpoint health with the latest report of each swarm that has one
+        """
+        with self._moreinfo_lock:
+            pending, self._pending_moreinfo = self._pending_moreinfo, {}
+        for roothash, midict in pending.iteritems():
+            self._channel_index.update(roothash, midict)
+            channels = {}
+            for c in self._channel_index.swarm(roothash):
+                channels.setdefault(c.sock_addr, []).append(c)
+            for e in self.swift_endpoints:
+                e.health.update(roothash, channels.get(e.address, []))
+    
     def channel_closed_callback(self, roothash, saddr, paddr):
         CommonEndpoint.channel_closed_callback(self, roothash, saddr, paddr)
+        self._channel_index.remove_channel(roothash, saddr, paddr)
         d = self.retrieve_download_impl(roothash)
         if roothash in self._started_downloads.keys() and self._swift.is_running() and d.downloading():
             self.add_peers_to_download(d, self._started_downloads[roothash], saddr)
@@ -1206,6 +1553,12 @@ class SwiftEndpoint(CommonEndpoint):
     def __init__(self, swift_process, address, api_callback=None):
         super(SwiftEndpoint, self).__init__(swift_process, api_callback=api_callback, address=address) # Dispersy and session code 
         self.waiting_queue = Queue.Queue()
+        self._send_queue = Queue.Queue(ENDPOINT_SEND_QUEUE_SIZE) # (Candidate, List(str)) waiting to be sent
+        self._send_stop_event = Event()
+        self._send_thread = None
+        self.health = EndpointHealth()
+        self._incoming = [] # (sock_addr, data, timestamp) waiting to be handed to Dispersy
+        self._incoming_lock = Lock()
         self._wan_voters = {}
         self._wan_address = { address : 0 } # Initialize zero vote
         if self.address.resolve_interface():
@@ -1218,13 +1571,47 @@ class SwiftEndpoint(CommonEndpoint):
         
     def open(self, dispersy):
         self.is_alive = True
+        self._send_stop_event = Event() # A thread of a previous open may still be stopping on the old event
+        self._send_thread = Thread(target=self._send_loop, args=(self._send_stop_event,), 
+                                   name="SwiftEndpoint_send_" + str(self.address))
+        self._send_thread.daemon = True
+        self._send_thread.start()
         return Endpoint.open(self, dispersy) # Dispersy, but not add_download(self)
         
     def close(self, timeout=0.0):
         self.is_alive = False
+        self._send_stop_event.set()
+        self._send_thread = None
         self._swift = None
         return super(TunnelEndpoint, self).close(timeout)
     
+    def enqueue_send(self, candidate, packets):
+        """
+        Queue these packets to be sent by this endpoint's send thread
+        If the queue is full, for instance because the socket would block, the packets are dropped
+        @return: True if queued, False otherwise
+        """
+        if self._send_thread is None: # Not opened
+            return self.send(candidate, packets)
+        try:
+            self._send_queue.put_nowait((candidate, packets))
+            return True
+        except Queue.Full:
+            logger.warning("%s has %d sends waiting, dropping %d packets to %s", self.address, self._send_queue.qsize(), 
+                           len(packets), candidate.sock_addr)
+            return False
+        
+    def _send_loop(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                candidate, packets = self._send_queue.get(timeout=SLEEP_TIME)
+            except Queue.Empty:
+                continue
+            try:
+                self.send(candidate, packets)
+            except Exception:
+                logger.exception("Failed to send %d packets to %s", len(packets), candidate.sock_addr)
+    
     def get_address(self):
         # Dispersy retrieves the local ip
         return self.address.addr()
@@ -1234,49 +1621,71 @@ class SwiftEndpoint(CommonEndpoint):
         return max(self._wan_address, key=self._wan_address.get) # Return the address with the highest vote
     
     def send(self, candidate, packets):
-        if self._swift is not None and self._swift.is_ready():
+        """
+        Called by the send thread of this endpoint, or directly if it is not opened.
+        The global splock is not taken, so that endpoints send in parallel. 
+        The write on the command connection is serialized by the connection itself.
+        """
+        swift = self._swift # Close sets it to None
+        if swift is not None and swift.is_ready():
             if any(len(packet) > 2**16 - 60 for packet in packets):
                 raise RuntimeError("UDP does not support %d byte packets" % len(max(len(packet) for packet in packets)))
 
-            self._swift.splock.acquire()
-            try:
-                sock_addr = candidate.sock_addr
-                assert self._dispersy.is_valid_address(sock_addr), sock_addr
+            sock_addr = candidate.sock_addr
+            assert self._dispersy.is_valid_address(sock_addr), sock_addr
 
-                for data in packets:
-                    if logger.isEnabledFor(logging.DEBUG):
-                        try:
-                            name = self._dispersy.convert_packet_to_meta_message(data, load=False, auto_load=False).name
-                        except:
-                            name = "???"
-                        logger.debug("%20s -> %15s:%-5d %30s %4d bytes", str(self.address), sock_addr[0], sock_addr[1], name, len(data))
-                        self._dispersy.statistics.dict_inc(self._dispersy.statistics.endpoint_send, name)
-                    self._swift.send_tunnel(self._session, sock_addr, data, self.address)
-                    
-                # This contact may be spoofed by MultiEndpoint, which ensures that we don't have DispersyContacts
-                # that resolve to the same peer
-                self.update_dispersy_contacts(candidate.sock_addr, packets, recv=False)
-    
-                # return True when something has been send
-                return candidate and packets
-    
-            finally:
-                self._swift.splock.release()
+            for data in packets:
+                if logger.isEnabledFor(logging.DEBUG):
+                    try:
+                        name = self._dispersy.convert_packet_to_meta_message(data, load=False, auto_load=False).name
+                    except:
+                        name = "???"
+                    logger.debug("%20s -> %15s:%-5d %30s %4d bytes", str(self.address), sock_addr[0], sock_addr[1], name, len(data))
+                    self._dispersy.statistics.dict_inc(self._dispersy.statistics.endpoint_send, name)
+            swift.send_tunnels(self._session, sock_addr, packets, self.address) # All packets in one write
+            
+            # This contact may be spoofed by MultiEndpoint, which ensures that we don't have DispersyContacts
+            # that resolve to the same peer
+            self.update_dispersy_contacts(candidate.sock_addr, packets, recv=False)
+
+            # return True when something has been send
+            return candidate and packets
         
-    def i2ithread_data_came_in(self, session, sock_addr, data):
+    def i2ithread_data_came_in(self, session, sock_addr, data, deliver=True):
+        """
+        @param deliver: False if only the statistics should be updated, i.e. for duplicates
+        """
         self.update_dispersy_contacts(sock_addr, [data], recv=True)
         self._total_down += len(data)
+        if not deliver:
+            return
         
         # Spoof the contact address for the benefit of Dispersy
-        for dc in self.dispersy_contacts:
-            if dc.has_address(Address.tuple(sock_addr)):
-                sock_addr = dc.address.addr()    
-        self._dispersy.callback.register(self.dispersythread_data_came_in, (sock_addr, data, time.time()))        
+        for dc in self.dispersy_contacts.find(Address.tuple(sock_addr)):
+            sock_addr = dc.address.addr()    
+        
+        # Packets are handed to Dispersy in batches, after INCOMING_BATCH_WINDOW or once there are INCOMING_BATCH_SIZE
+        with self._incoming_lock:
+            self._incoming.append((sock_addr, data, time.time()))
+            if len(self._incoming) == 1:
+                self._dispersy.callback.register(self.dispersythread_batch_came_in, delay=INCOMING_BATCH_WINDOW)
+            elif len(self._incoming) == INCOMING_BATCH_SIZE:
+                self._dispersy.callback.register(self.dispersythread_batch_came_in)
             
-    def dispersythread_data_came_in(self, sock_addr, data, timestamp):
-        self._dispersy.on_incoming_packets([(EligibleWalkCandidate(sock_addr, True, sock_addr, sock_addr, u"unknown"), 
-                                             data)], True, timestamp)
+    def dispersythread_batch_came_in(self):
+        with self._incoming_lock:
+            incoming, self._incoming = self._incoming, []
+        if not incoming:
+            return
+        self._dispersy.on_incoming_packets([(EligibleWalkCandidate(sock_addr, True, sock_addr, sock_addr, u"unknown"), data)
+                                            for sock_addr, data, _ in incoming], True, incoming[0][2])
     
+    def is_usable(self):
+        """
+        @return: True if this endpoint can be used to send
+        """
+        return self.is_alive and self.socket_running and not self.health.is_dead() and not self.health.is_lossy()
+        
     def socket_initializing(self):
         return (self._socket_running[0] == -1 and 
                 self._socket_running[1] > datetime.utcnow() - timedelta(seconds=MAX_SOCKET_INITIALIZATION_TIME))
@@ -1290,6 +1699,7 @@ class SwiftEndpoint(CommonEndpoint):
     def sockaddr_info_callback(self, address, state):
         if self.address == address: # Should be redundant
             self.socket_running = state
+            self.health.socket_state(state)
         else:
             logger.warning("Socket info callback for %s is at %s", address, self.address)
         if state == EWOULDBLOCK:
@@ -1329,7 +1739,7 @@ class SwiftEndpoint(CommonEndpoint):
         meta_puncture = community.get_meta_message(PUNCTURE_MESSAGE_NAME)
         message = meta_puncture.impl(authentication=(community.my_member,), distribution=(community.claim_global_time(),), 
                                      destination=(candidate,), payload=(self.address, self.wan_address, self.id, address, id_))
-        self.send(candidate, [message.packet]) # In case this one fails, there will be others later if necessary
+        self.enqueue_send(candidate, [message.packet]) # In case this one fails, there will be others later if necessary
         
     def send_puncture_response_message(self, community, address, id_):
         logger.debug("Creating puncture response message for %s %s %s", community.cid, str(address), str(id_))
@@ -1339,7 +1749,7 @@ class SwiftEndpoint(CommonEndpoint):
         meta_puncture = community.get_meta_message(PUNCTURE_RESPONSE_MESSAGE_NAME)
         message = meta_puncture.impl(authentication=(community.my_member,), distribution=(community.claim_global_time(),), 
                                      destination=(candidate,), payload=(self.address, self.wan_address, address, id_))
-        self.send(candidate, [message.packet]) # In case this one fails, there will be others later if necessary
+        self.enqueue_send(candidate, [message.packet]) # In case this one fails, there will be others later if necessary
     
     def vote_wan_address(self, address, sender_lan, sender_wan):
         """
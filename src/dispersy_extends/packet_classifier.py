@@ -0,0 +1,67 @@
+'''
+Created on Mar 6, 2014
+
+@author: Vincent Ketelaars
+'''
+from threading import Lock
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+UNKNOWN_NAME = "???"
+
+class PacketClassifier(object):
+    '''
+    Find the name of the meta message of a packet without decoding it.
+    A Dispersy packet starts with the dispersy version, the community version, the 20 byte community id
+    and a single byte that identifies the message type within that conversion.
+    These first 23 bytes are mapped to the name of the meta message. The map is filled from the
+    conversions of a community, and otherwise on first sight of a packet by the supplied convert function.
+    '''
+    PREFIX_LENGTH = 23
+
+    def __init__(self, convert):
+        """
+        @param convert: function(packet) that returns the meta message of the packet
+        """
+        self._convert = convert
+        self._names = {} # packet prefix : meta message name
+        self._lock = Lock()
+
+    def add_community(self, community):
+        """
+        Add the message types of each of the conversions of this community
+        """
+        for conversion in getattr(community, "_conversions", []):
+            prefix = getattr(conversion, "prefix", None)
+            if prefix is None:
+                continue
+            with self._lock:
+                for byte, decode in getattr(conversion, "_decode_message_map", {}).iteritems():
+                    self._names[prefix + byte] = decode.meta.name
+
+    def remove_community(self, cid):
+        """
+        @param cid: Community id
+        """
+        with self._lock:
+            for key in [k for k in self._names.iterkeys() if k[2:22] == cid]:
+                del self._names[key]
+
+    def name(self, packet):
+        """
+        @return: Name of the meta message of this packet, UNKNOWN_NAME if it can not be determined
+        """
+        key = packet[:self.PREFIX_LENGTH]
+        name = self._names.get(key)
+        if name is None:
+            try:
+                name = self._convert(packet).name
+            except:
+                return UNKNOWN_NAME # Unknown packets are not kept, the community might still be loaded
+            with self._lock:
+                self._names[key] = name
+        return name
+
+    def __len__(self):
+        return len(self._names)
@@ -0,0 +1,92 @@
+'''
+Created on Mar 5, 2014
+
+@author: Vincent Ketelaars
+'''
+from datetime import datetime, timedelta
+from errno import EWOULDBLOCK
+
+from src.definitions import HEALTH_EWMA_ALPHA, ENDPOINT_DEAD_TIME, ENDPOINT_MAX_LOSS
+
+class EndpointHealth(object):
+    '''
+    Exponentially weighted moving averages of the round trip time, loss and throughput of a single socket,
+    together with its error state.
+    Swift does not report lost packets, so a MOREINFO in which the socket has a send queue,
+    but has not sent a single byte since the previous one, counts as loss.
+    '''
+
+    def __init__(self, alpha=HEALTH_EWMA_ALPHA):
+        self.alpha = alpha
+        self.rtt = None # Seconds, None until measured
+        self.loss = 0.0 # Fraction
+        self.throughput = 0.0 # Bytes/s, up and down
+        self.state = -1 # Last SOCKETINFO state
+        self.error_since = None # datetime of the first of consecutive error states, a full buffer is no error
+        self._raw_bytes_up = {} # roothash : raw bytes up at the last MOREINFO
+
+    def _ewma(self, average, sample):
+        if average is None:
+            return sample
+        return self.alpha * sample + (1 - self.alpha) * average
+
+    def socket_state(self, state):
+        """
+        Update the error state with SOCKETINFO
+        @param state: 0 if the socket is running, EWOULDBLOCK if its buffer is full, otherwise an error
+        """
+        if not self._is_error(state):
+            self.error_since = None
+        else:
+            if self.error_since is None:
+                self.error_since = datetime.utcnow()
+            self.loss = self._ewma(self.loss, 1.0)
+        self.state = state
+
+    def _is_error(self, state):
+        return state > 0 and state != EWOULDBLOCK
+
+    def update(self, roothash, channels):
+        """
+        Update with the channels this socket has in this swarm, as reported by MOREINFO
+        @type channels: List(Channel)
+        """
+        if not channels:
+            self._raw_bytes_up.pop(roothash, None)
+            return
+        rtts = [c.avg_rtt for c in channels if c.avg_rtt > 0]
+        if rtts:
+            self.rtt = self._ewma(self.rtt, sum(rtts) / float(len(rtts)) / 10**6) # avg_rtt is in us
+        self.throughput = self._ewma(self.throughput, sum([c.speed_up + c.speed_down for c in channels]))
+        raw_bytes_up = sum([c.info.get("raw_bytes_up", 0) for c in channels])
+        previous = self._raw_bytes_up.get(roothash)
+        if previous is not None:
+            stalled = sum([c.send_queue for c in channels]) > 0 and raw_bytes_up <= previous
+            self.loss = self._ewma(self.loss, 1.0 if stalled else 0.0)
+        self._raw_bytes_up[roothash] = raw_bytes_up
+
+    def remove(self, roothash):
+        self._raw_bytes_up.pop(roothash, None)
+
+    def expected_transmissions(self):
+        """
+        @return: The number of times a packet is expected to be sent before it arrives
+        """
+        return 1 / (1 - min(self.loss, ENDPOINT_MAX_LOSS))
+
+    def is_dead(self, dead_time=ENDPOINT_DEAD_TIME):
+        """
+        The socket is considered dead if it has been in error (other than a full buffer) for dead_time seconds
+        """
+        return self._is_error(self.state) and self.error_since + timedelta(seconds=dead_time) < datetime.utcnow()
+
+    def is_lossy(self):
+        """
+        Whether the socket has hardly been able to send anything for a while.
+        This can also be due to the peers, so it is no reason to remove the socket.
+        """
+        return self.loss >= ENDPOINT_MAX_LOSS
+
+    def __str__(self):
+        return "rtt %s, loss %.2f, throughput %.0f, state %d" % ("%.3f" % self.rtt if self.rtt is not None else "-",
+                                                                self.loss, self.throughput, self.state)
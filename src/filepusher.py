@@ -8,13 +8,16 @@ from threading import Thread, Event
 from datetime import datetime
 from string import find
 from os import listdir
-from os.path import exists, isfile, isdir, getmtime, join, getsize, basename, abspath
+from os.path import exists, isfile, isdir, getmtime, join, getsize, basename, abspath, dirname
 
 from src.logger import get_logger
 from src.tools.runner import CallFunctionThread
 from src.dispersy_extends.payload import SmallFileCarrier, FileHashCarrier
 from src.dispersy_extends.endpoint import get_hash
-from src.definitions import SLEEP_TIME, MAX_MESSAGE_SIZE, FILENAMES_NOT_TO_SEND, FILETYPES_NOT_TO_SEND
+from src.tools import inotify
+from src.tools.clock import monotonic
+from src.definitions import SLEEP_TIME, MAX_MESSAGE_SIZE, FILENAMES_NOT_TO_SEND, FILETYPES_NOT_TO_SEND, USE_INOTIFY,\
+    FILEPUSHER_RECONCILE_TIME
 
 logger = get_logger(__name__)
 
@@ -23,7 +26,12 @@ class FilePusher(Thread):
     FilePusher goes through a directory or a list of files to find either new files or updated files,
     and does a callback with the list of these files. It distinguishes between files larger and smaller than _file_size.
     In the former case the filename is send back, whereas in the latter case the contents of the file (string) is send back.
+    Where inotify is available, it waits for files to be written or moved into the directories, 
+    and only does a full scan every FILEPUSHER_RECONCILE_TIME seconds in case events were missed.
+    Otherwise it scans every SLEEP_TIME seconds.
     '''
+    
+    WATCH_MASK = inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_CREATE | inotify.IN_ONLYDIR
 
     def __init__(self, callback, swift_path, directories=[], files=[], file_size=MAX_MESSAGE_SIZE, hidden=False, min_timestamp=None):
         '''
@@ -38,13 +46,17 @@ class FilePusher(Thread):
         Thread.__init__(self, name="Filepusher")
         self.setDaemon(True)
         self._dirs = set()
+        self._added = [] # Files and directories added since the last iteration
         for d in directories:
             self.add_directory(d)
         
         self._files = set()
+        self._abs_files = {} # Absolute path : path in _files
         self.add_files(files)
                 
-        self._recent_files = []
+        self._recent_files = {} # Filename : last modified time when it was last sent
+        self._inotify = None
+        self._last_scan = None # Monotonic time of the last full scan
         self._callback = callback
         self._file_size = file_size
         self.swift_path = swift_path
@@ -58,11 +70,14 @@ class FilePusher(Thread):
     def add_directory(self, directory):
         if directory and exists(directory) and isdir(directory):
             self._dirs.add(abspath(directory)) # Add only absolute paths, no ambiguities
+            self._added.append(abspath(directory))
         
     def add_files(self, files):
         for f in files:
             if exists(f) and isfile(f):
                 self._files.add(f)
+                self._abs_files[abspath(f)] = f
+                self._added.append(f)
 
     def run(self):
         """
@@ -71,22 +86,96 @@ class FilePusher(Thread):
         Call _callback with each of these files.
         """        
         self._thread_func.start()
+        if USE_INOTIFY and inotify.available():
+            try:
+                self._inotify = inotify.Inotify()
+            except OSError:
+                logger.exception("Could not start inotify, scan every %f seconds instead", SLEEP_TIME)
         
-        while not self._stop_event.is_set():                            
-            diff = self._list_files_to_send()
-            for absfilename in diff:
-                if datetime.fromtimestamp(getmtime(absfilename)) < self._min_timestamp:
-                    continue # Only go for files that are older than self._min_timestamp
-                logger.debug("New file to be sent: %s", absfilename)
-                if getsize(absfilename) > self._file_size:
-                    self._thread_func.put(self.send_file_hash_message, absfilename, dirs=self._get_dir(absfilename), 
-                                          queue_priority=getmtime(absfilename))
-                else:
-                    with file(absfilename) as f:
-                        s = f.read()
-                        self._callback(message=SmallFileCarrier(absfilename, s))
-                
-            self._stop_event.wait(SLEEP_TIME)
+        while not self._stop_event.is_set():
+            if self._inotify is None or self._last_scan is None or monotonic() - self._last_scan >= FILEPUSHER_RECONCILE_TIME:
+                self._last_scan = monotonic()
+                del self._added[:] # Part of the full scan
+                for absfilename in self._list_files_to_send():
+                    self._handle(absfilename)
+            else:
+                self._handle_added()
+            if self._inotify is None:
+                self._stop_event.wait(SLEEP_TIME)
+            else:
+                self._handle_events(self._inotify.read(SLEEP_TIME))
+        if self._inotify is not None:
+            self._inotify.close()
+            
+    def _handle(self, absfilename):
+        try:
+            if datetime.fromtimestamp(getmtime(absfilename)) < self._min_timestamp:
+                return # Only go for files that are older than self._min_timestamp
+            logger.debug("New file to be sent: %s", absfilename)
+            if getsize(absfilename) > self._file_size:
+                self._thread_func.put(self.send_file_hash_message, absfilename, dirs=self._get_dir(absfilename), 
+                                      queue_priority=getmtime(absfilename))
+            else:
+                with file(absfilename) as f:
+                    s = f.read()
+                    self._callback(message=SmallFileCarrier(absfilename, s))
+        except (IOError, OSError):
+            logger.debug("%s is no longer available", absfilename)
+            
+    def _handle_added(self):
+        """
+        Send the files and the files in the directories that were added since the previous iteration
+        """
+        while self._added:
+            path = self._added.pop(0)
+            if isdir(path):
+                files = self._list_directory(path)
+            else:
+                files = [path]
+                self._watch(dirname(abspath(path)))
+            for f in self._diff(files):
+                self._handle(f)
+            
+    def _handle_events(self, events):
+        """
+        Send the files that inotify reports to be written or moved into a watched directory
+        @param events: List of (path, mask, cookie, name)
+        """
+        for path, mask, _, name in events:
+            if mask & inotify.IN_Q_OVERFLOW: # Events were lost, so scan everything
+                self._last_scan = None
+                continue
+            absname = join(path, name)
+            if not self._in_directories(path): # Parent of one of _files
+                f = self._abs_files.get(absname)
+                if f is not None and not mask & inotify.IN_ISDIR:
+                    for f in self._diff([f]):
+                        self._handle(f)
+            elif mask & inotify.IN_ISDIR:
+                if mask & (inotify.IN_CREATE | inotify.IN_MOVED_TO) and self._wanted_directory(name):
+                    # Files may have been written before the watch was added
+                    for f in self._diff(self._list_directory(absname)):
+                        self._handle(f)
+            elif mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO) and self._wanted_file(name):
+                for f in self._diff([absname]):
+                    self._handle(f)
+                    
+    def _in_directories(self, path):
+        return any(path == d or path.startswith(d + "/") for d in self._dirs)
+    
+    def _watch(self, directory):
+        """
+        Watch directory with inotify. If that fails, for example because the limit of watches is reached,
+        inotify is no longer used.
+        """
+        if self._inotify is None:
+            return
+        try:
+            self._inotify.add_watch(directory, self.WATCH_MASK)
+        except OSError:
+            logger.exception("Could not watch %s, scan every %f seconds instead", directory, SLEEP_TIME)
+            self._inotify.close()
+            self._inotify = None
             
     def _get_dir(self, absfilename):
         """
@@ -133,39 +222,70 @@ class FilePusher(Thread):
         self._stop_event.set()
         self._thread_func.stop()
             
+    def _wanted_file(self, f):
+        # Files which do not end in any of the FILETYPES_NOT_TO_SEND or contain FILENAMES_NOT_TO_SEND
+        return not (any(f.endswith(t) for t in FILETYPES_NOT_TO_SEND) or any(f.find(n) >= 0 for n in FILENAMES_NOT_TO_SEND)) and \
+            not (not self._hidden and f[0] == ".") # which if not hidden, do no start with a dot
+    
+    def _wanted_directory(self, d):
+        # If not hidden, don't go into directories starting with a dot
+        return not (not self._hidden and d[0] == ".")
+    
+    def _list_directory(self, dir_):
+        """
+        Watch dir_ and its subdirectories if inotify is used
+        @return: All files in dir_ and its subdirectories, as absolute filename paths
+        """
+        self._watch(dir_)
+        all_files = []
+        for f in listdir(dir_):
+            path = join(dir_, f)
+            if isfile(path):
+                if self._wanted_file(f):
+                    all_files.append(path)
+            elif isdir(path) and self._wanted_directory(f):
+                all_files.extend(self._list_directory(path))
+        return all_files
+    
+    def _diff(self, files):
+        """
+        @return: The files that have not been sent before, or that have been modified since
+        """
+        diff = []
+        for f in files:
+            try:
+                modified = getmtime(f)
+            except OSError:
+                continue
+            if self._recent_files.get(f) != modified:
+                diff.append(f)
+                self._recent_files[f] = modified
+        return diff
+            
     def _list_files_to_send(self):
         """
-        Compare all files in _directory and _files, combined in file_updates with the current list _recent_files,
-        which both hold tuples of filename and last modified time.
+        Compare all files in _directory and _files, combined in file_updates with the current _recent_files,
+        which both map filename to last modified time.
+        The parents of _files are watched as well if inotify is used.
         
         @return: the difference between _recent_files and the file_updates
         """
-        
-        def recur(dir_):
-            # all_files should only contain absolute filename paths in dir_
-            all_files = [ join(dir_,f) for f in listdir(dir_) if isfile(join(dir_,f)) and 
-                         # which do not end in any of the FILETYPES_NOT_TO_SEND or contain FILENAMES_NOT_TO_SEND
-                         not (any(f.endswith(t) for t in FILETYPES_NOT_TO_SEND) 
-                              or any(f.find(n) >= 0 for n in FILENAMES_NOT_TO_SEND)) and
-                        # which if not hidden, do no start with a dot
-                         not (not self._hidden and f[0] == ".") ]
-                        
-            all_dir = [join(dir_, d) for d in listdir(dir_) if isdir(join(dir_, d)) and 
-                       # If not hidden, don't go into directories starting with a dot
-                       not (not self._hidden and d[0] == ".") ]
-            for d in all_dir:
-                all_files.extend(recur(d))
-            return all_files
-        
         # Get all files in the directory and subdirectories
-        all_files = set([f for d in self._dirs for f in recur(d)])
+        all_files = set([f for d in self._dirs for f in self._list_directory(d)])
         all_files.update(self._files)
-        file_updates = [ (f, getmtime(f)) for f in all_files] # create tuple of file and last modified timestamp
-
+        for f in self._abs_files.iterkeys():
+            if not self._in_directories(dirname(f)):
+                self._watch(dirname(f))
+        file_updates = {}
+        for f in all_files: # Map file to its last modified timestamp
+            try:
+                file_updates[f] = getmtime(f)
+            except OSError:
+                pass
+        
         # Each file in the directory should be send at least once
         # If renewed they should be sent again
-        diff = [_ft[0] for _ft in file_updates if _ft not in self._recent_files]
+        diff = [f for f, t in file_updates.iteritems() if self._recent_files.get(f) != t]
         
         self._recent_files = file_updates
         return diff
-    
\ No newline at end of file
@@ -0,0 +1,181 @@
+'''
+Created on Mar 3, 2014
+
+@author: Vincent Ketelaars
+'''
+from threading import RLock
+
+from src.address import Address
+from src.swift.moreinfo import channel_key
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+class Channel(object):
+    '''
+    Snapshot of a single swift channel as reported by MOREINFO.
+    The socket and peer addresses are parsed once, when the MOREINFO arrives.
+    '''
+
+    def __init__(self, roothash, channel):
+        self.roothash = roothash
+        self.info = channel # The raw dictionary as reported by swift
+        self.key = channel_key(channel)
+        self.sock_addr = Address.unknown(channel["socket_ip"].encode("ascii", "ignore") + ":" + str(channel["socket_port"]))
+        self.peer_addr = Address.unknown(channel["ip"].encode("ascii", "ignore") + ":" + str(channel["port"]))
+
+    @property
+    def speed_up(self):
+        return self.info.get("cur_speed_up", 0.0)
+
+    @property
+    def speed_down(self):
+        return self.info.get("cur_speed_down", 0.0)
+
+    @property
+    def send_queue(self):
+        return self.info.get("send_queue", 0)
+
+    @property
+    def avg_rtt(self):
+        return self.info.get("avg_rtt", 0)
+
+class ChannelIndex(object):
+    '''
+    This index holds the channels of all swarms, keyed by the peer address on the other side of the channel.
+    It is updated incrementally, per swarm for each MOREINFO and per channel for each CHANNELCLOSED,
+    such that finding the channels to a peer does not require a walk over every swarm.
+    The ranking of a peer's channels by estimated queueing delay is cached until any of that peer's channels change.
+    A MOREINFO only marks the peers dirty whose channels were added, removed or have different counters.
+    '''
+
+    def __init__(self):
+        self._lock = RLock()
+        self._swarms = {} # roothash : List(Channel)
+        self._peers = {} # peer Address : Dict(roothash : List(Channel))
+        self._ranked = {} # frozenset(peer Address) : List((Channel, float))
+        self._ranked_keys = {} # peer Address : Set(frozenset(peer Address))
+
+    def update(self, roothash, midict):
+        """
+        Replace the channels of this swarm with those in midict
+        Channels whose information did not change are kept, as are the rankings of their peers
+        @param midict: MOREINFO dictionary
+        @return: List(Channel) that were added or changed
+        """
+        with self._lock:
+            previous = dict([(c.key, c) for c in self._swarms.get(roothash, [])])
+            channels = []
+            changed = []
+            for info in midict.get("channels", []):
+                try:
+                    c = previous.pop(channel_key(info), None)
+                    if c is None or c.info != info:
+                        c = Channel(roothash, info)
+                        changed.append(c)
+                except (KeyError, AttributeError):
+                    logger.debug("Incomplete channel information %s", info)
+                    continue
+                channels.append(c)
+            if not changed and not previous and roothash in self._swarms:
+                return changed
+            self._unlink_swarm(roothash)
+            self._swarms[roothash] = channels
+            for c in channels:
+                self._peers.setdefault(c.peer_addr, {}).setdefault(roothash, []).append(c)
+            for c in changed + previous.values(): # Previous now only holds the removed channels
+                self._invalidate(c.peer_addr)
+            return changed
+
+    def remove_channel(self, roothash, sock_addr, peer_addr):
+        """
+        Remove the channel between sock_addr and peer_addr from this swarm
+        @type sock_addr: Address
+        @type peer_addr: Address
+        """
+        with self._lock:
+            channels = self._swarms.get(roothash)
+            if channels is None:
+                return
+            self._swarms[roothash] = [c for c in channels if not (c.sock_addr == sock_addr and c.peer_addr == peer_addr)]
+            swarms = self._peers.get(peer_addr, {})
+            if roothash in swarms:
+                swarms[roothash] = [c for c in swarms[roothash] if c.sock_addr != sock_addr]
+                if not swarms[roothash]:
+                    del swarms[roothash]
+                if not swarms:
+                    del self._peers[peer_addr]
+            self._invalidate(peer_addr)
+
+    def remove_swarm(self, roothash):
+        with self._lock:
+            self._remove_swarm(roothash)
+
+    def _remove_swarm(self, roothash):
+        # Assume lock is held
+        for c in self._unlink_swarm(roothash):
+            self._invalidate(c.peer_addr)
+
+    def _unlink_swarm(self, roothash):
+        # Assume lock is held
+        channels = self._swarms.pop(roothash, [])
+        for c in channels:
+            swarms = self._peers.get(c.peer_addr)
+            if swarms is None:
+                continue
+            swarms.pop(roothash, None)
+            if not swarms:
+                del self._peers[c.peer_addr]
+        return channels
+
+    def _invalidate(self, address):
+        # Assume lock is held
+        for key in self._ranked_keys.pop(address, set()):
+            self._ranked.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._swarms = {}
+            self._peers = {}
+            self._ranked = {}
+            self._ranked_keys = {}
+
+    def swarm(self, roothash):
+        """
+        @return: List(Channel) of this swarm
+        """
+        with self._lock:
+            return list(self._swarms.get(roothash, []))
+
+    def channels(self, addresses):
+        """
+        @param addresses: Addresses of a single peer
+        @return: List(Channel) with any of these addresses on the other side
+        """
+        with self._lock:
+            return [c for a in set(addresses) for cs in self._peers.get(a, {}).itervalues() for c in cs]
+
+    def ranked(self, addresses):
+        """
+        The channels to this peer, sorted by send_queue / upload speed of the channel's socket, low to high.
+        The upload speed of a socket is the sum over the channels it has with this peer.
+        Channels without a measured upload speed are left out.
+        @param addresses: Addresses of a single peer
+        @return: List((Channel, float))
+        """
+        key = frozenset(addresses)
+        with self._lock:
+            ranked = self._ranked.get(key)
+            if ranked is None:
+                channels = self.channels(key)
+                upspeeds = {}
+                for c in channels:
+                    upspeeds[c.sock_addr] = upspeeds.get(c.sock_addr, 0) + c.speed_up
+                ranked = sorted([(c, c.send_queue / float(upspeeds[c.sock_addr])) for c in channels
+                                 if upspeeds[c.sock_addr] > 0], key=lambda x: x[1])
+                self._ranked[key] = ranked
+                for a in key:
+                    self._ranked_keys.setdefault(a, set()).add(key)
+            return ranked
+
+    def __len__(self):
+        return sum([len(cs) for cs in self._swarms.itervalues()])
@@ -0,0 +1,123 @@
+'''
+Created on Mar 8, 2014
+
+Binary records for the Swift command connection.
+Each record is a header of a one byte type and a four byte payload length, followed by the payload.
+Numbers are in network byte order. Addresses are a one byte length of the packed ip (0, 4 or 16),
+the packed ip and a two byte port. Commands without a record type of their own are sent as TEXT records,
+which hold one or more \r\n ended text commands.
+
+@author: Vincent Ketelaars
+'''
+import socket
+from struct import Struct
+
+NEGOTIATE = "PROTOCOL BINARY"
+
+HEADER = Struct("!BI")
+
+TEXT = 0
+TUNNELSEND = 1
+TUNNELRECV = 2
+INFO = 3
+CHANNELS = 4
+
+_PORT = Struct("!H")
+_INFO = Struct("!20sBQQddIIQQ") # roothash, status, complete, total, dlspeed, ulspeed, leechers, seeders, content down, content up
+_SWARM = Struct("!20sQQQQH") # roothash, bytes up, bytes down, raw bytes up, raw bytes down, number of channels
+_CHANNEL = Struct("!ddQQQQII") # speed up, speed down, bytes up, bytes down, raw bytes up, raw bytes down, send queue, rtt
+_CHANNEL_KEYS = ("cur_speed_up", "cur_speed_down", "bytes_up", "bytes_down", "raw_bytes_up", "raw_bytes_down",
+                 "send_queue", "avg_rtt")
+_SWARM_KEYS = ("bytes_up", "bytes_down", "raw_bytes_up", "raw_bytes_down")
+
+def record(rtype, payload):
+    return HEADER.pack(rtype, len(payload)) + payload
+
+def pack_address(ip, port):
+    """
+    @param ip: String ip, empty for no address
+    """
+    if not ip:
+        packed = ""
+    elif ":" in ip:
+        packed = socket.inet_pton(socket.AF_INET6, ip)
+    else:
+        packed = socket.inet_aton(ip)
+    return chr(len(packed)) + packed + _PORT.pack(port)
+
+def unpack_address(data, offset):
+    """
+    @return: ((ip, port), offset after the address)
+    """
+    length = ord(data[offset])
+    offset += 1
+    if length == 0:
+        ip = ""
+    elif length == 16:
+        ip = socket.inet_ntop(socket.AF_INET6, data[offset:offset + length])
+    else:
+        ip = socket.inet_ntoa(data[offset:offset + length])
+    offset += length
+    return (ip, _PORT.unpack_from(data, offset)[0]), offset + _PORT.size
+
+def text(cmds):
+    return record(TEXT, cmds)
+
+def tunnelsend(session, address, data, source=("", 0)):
+    """
+    @param address: (ip, port) of the destination
+    @param source: (ip, port) of the local socket, port 0 lets Swift choose
+    """
+    return record(TUNNELSEND, pack_address(*address) + chr(len(session)) + session + pack_address(*source) + data)
+
+def unpack_tunnel(payload):
+    """
+    Unpack TUNNELSEND and TUNNELRECV, which share their layout
+    @return: (session, (ip, port), data, (ip, port) of the local socket)
+    """
+    address, offset = unpack_address(payload, 0)
+    length = ord(payload[offset])
+    session = payload[offset + 1:offset + 1 + length]
+    local, offset = unpack_address(payload, offset + 1 + length)
+    return session, address, payload[offset:], local
+
+def tunnelrecv(session, address, data, incoming=("", 0)):
+    return record(TUNNELRECV, pack_address(*address) + chr(len(session)) + session + pack_address(*incoming) + data)
+
+def info(roothash, dlstatus, complete, total, dlspeed, ulspeed, numleech, numseeds, contentdl=0, contentul=0):
+    return record(INFO, _INFO.pack(roothash, dlstatus, complete, total, dlspeed, ulspeed, numleech, numseeds,
+                                   contentdl, contentul))
+
+def unpack_info(payload):
+    """
+    @return: (roothash, dlstatus, complete, total, dlspeed, ulspeed, numleech, numseeds, contentdl, contentul)
+    """
+    return _INFO.unpack(payload)
+
+def channels(roothash, midict):
+    """
+    @param midict: MOREINFO dictionary with the swarm totals and its channels
+    """
+    payload = [_SWARM.pack(roothash, *[midict.get(k, 0) for k in _SWARM_KEYS] + [len(midict.get("channels", []))])]
+    for c in midict.get("channels", []):
+        payload.append(pack_address(c["socket_ip"], c["socket_port"]))
+        payload.append(pack_address(c["ip"], c["port"]))
+        payload.append(_CHANNEL.pack(*[c.get(k, 0) for k in _CHANNEL_KEYS]))
+    return record(CHANNELS, "".join(payload))
+
+def unpack_channels(payload):
+    """
+    @return: (roothash, MOREINFO dictionary with the swarm totals and its channels)
+    """
+    values = _SWARM.unpack_from(payload, 0)
+    midict = dict(zip(_SWARM_KEYS, values[1:-1]))
+    midict["channels"] = []
+    offset = _SWARM.size
+    for _ in range(values[-1]):
+        (socket_ip, socket_port), offset = unpack_address(payload, offset)
+        (ip, port), offset = unpack_address(payload, offset)
+        c = dict(zip(_CHANNEL_KEYS, _CHANNEL.unpack_from(payload, offset)))
+        offset += _CHANNEL.size
+        c.update(socket_ip=socket_ip, socket_port=socket_port, ip=ip, port=port)
+        midict["channels"].append(c)
+    return values[0], midict
@@ -0,0 +1,138 @@
+'''
+Created on Mar 9, 2014
+
+@author: Vincent Ketelaars
+'''
+import re
+import json
+from threading import RLock
+
+from src.definitions import MOREINFO_MAX_UNREAD_DELTAS
+
+_REPORT = 0
+_CLOSED = 1
+_DELTA = re.compile(r'"delta"\s*:\s*(true|[1-9])')
+
+def channel_key(channel):
+    """
+    @param channel: Channel dictionary as reported by MOREINFO
+    @return: (socket ip, socket port, peer ip, peer port)
+    """
+    return (channel["socket_ip"], channel["socket_port"], channel["ip"], channel["port"])
+
+def is_delta(raw):
+    """
+    Tell a delta report from a full report without parsing it
+    @param raw: JSON string
+    """
+    return _DELTA.search(raw) is not None
+
+def _apply(midict, kind, value):
+    """
+    @param midict: The dictionary so far, which is not changed, or None
+    @return: The dictionary after the report or closed channel
+    """
+    if kind == _CLOSED:
+        if midict is None:
+            return None
+        midict = dict(midict)
+        midict["channels"] = [c for c in midict.get("channels", []) if channel_key(c) != value]
+        return midict
+    report = json.loads(value)
+    if report.get("delta") and midict is not None:
+        channels = dict([(channel_key(c), c) for c in midict.get("channels", [])])
+        for c in report.get("channels", []):
+            channels[channel_key(c)] = c
+        report["channels"] = channels.values()
+    return report
+
+class MoreInfo(object):
+    '''
+    MOREINFO dictionary that is only parsed from its JSON the first time it is read.
+    In delta mode Swift only reports the channels whose counters changed since its previous report,
+    which it marks with "delta". The other channels are then taken over from the previous report.
+    A delta report does not hold on to the previous report, but to the last parsed dictionary before it
+    and the unparsed reports and closed channels since, which are merged in order when it is read.
+    A full report needs nothing from the previous report.
+    At most MOREINFO_MAX_UNREAD_DELTAS unparsed reports are kept, beyond that the oldest is merged.
+    '''
+    _lock = RLock() # Shared by all reports, a report may merge the pending reports of its predecessor
+
+    def __init__(self, raw, previous=None):
+        """
+        @param raw: JSON string
+        @param previous: The previous MoreInfo of this swarm
+        """
+        self._dict = None
+        self._base = None # Last parsed dictionary before the pending reports
+        self._pending = [(_REPORT, raw)] # (_REPORT, JSON) or (_CLOSED, channel key), oldest first
+        if previous is not None and is_delta(raw):
+            with self._lock:
+                if previous._dict is not None:
+                    self._base = previous._dict
+                else:
+                    self._base = previous._base
+                    self._pending = previous._pending + self._pending
+                while sum([1 for kind, _ in self._pending if kind == _REPORT]) > MOREINFO_MAX_UNREAD_DELTAS:
+                    self._merge_oldest()
+
+    def _merge_oldest(self):
+        """
+        Merge the oldest pending report, and the channels closed after it, into the base
+        """
+        midict = self._base
+        for i, (kind, value) in enumerate(self._pending):
+            if kind == _REPORT and i > 0:
+                break
+            midict = _apply(midict, kind, value)
+        else:
+            i = len(self._pending)
+        self._base = midict
+        self._pending = self._pending[i:]
+
+    @property
+    def parsed(self):
+        return self._dict is not None
+
+    def _parse(self):
+        if self._dict is not None:
+            return self._dict
+        with self._lock:
+            if self._dict is None:
+                midict = self._base
+                for kind, value in self._pending:
+                    midict = _apply(midict, kind, value)
+                self._dict = midict
+                self._base = self._pending = None
+        return self._dict
+
+    def remove_channel(self, sock_addr, peer_addr):
+        """
+        A closed channel is not reported again, so it should not be taken over by the next delta report
+        @type sock_addr: Address
+        @type peer_addr: Address
+        """
+        key = (sock_addr.ip, sock_addr.port, peer_addr.ip, peer_addr.port)
+        with self._lock:
+            if self._dict is None:
+                self._pending.append((_CLOSED, key))
+                return
+        self._dict["channels"] = [c for c in self._dict.get("channels", []) if channel_key(c) != key]
+
+    def get(self, key, default=None):
+        return self._parse().get(key, default)
+
+    def keys(self):
+        return self._parse().keys()
+
+    def __getitem__(self, key):
+        return self._parse()[key]
+
+    def __contains__(self, key):
+        return key in self._parse()
+
+    def __iter__(self):
+        return iter(self._parse())
+
+    def __len__(self):
+        return len(self._parse())
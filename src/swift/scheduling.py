@@ -0,0 +1,99 @@
+'''
+Created on Mar 15, 2014
+
+@author: Vincent Ketelaars
+'''
+from os.path import dirname
+
+from src.definitions import SWIFT_DIRECTORY_SLA, SWIFT_DEFAULT_SLA, SWIFT_DIRECTORY_WEIGHTS
+
+def _lookup(table, directory, default):
+    """
+    @return: The value of the directory, or of the closest parent directory that is in the table
+    """
+    while directory:
+        if directory in table:
+            return table[directory]
+        parent = dirname(directory.rstrip("/"))
+        if parent == directory:
+            break
+        directory = parent
+    return default
+
+class SchedulingPolicy(object):
+    '''
+    A scheduling policy determines the priority under which a file is put on a swift stack, 
+    where the highest priority is popped first. 
+    The priority given by the caller always comes first, the policy only orders files of equal priority.
+    This default policy pops the newest file first, which is how the stacks have always been ordered.
+    '''
+
+    def key(self, priority, size, timestamp, directory):
+        """
+        @param priority: Priority of the file as given by the caller
+        @param size: Size of the file
+        @param timestamp: Modification / creation time of the file
+        @param directory: Directory of the file
+        @return: Priority for the stack
+        """
+        return (priority, timestamp)
+
+    def popped(self, key):
+        """
+        Called with the priority of the file that is popped of the stack
+        """
+        pass
+
+class ShortestFirstPolicy(SchedulingPolicy):
+    '''
+    Shortest remaining size first, so that small files do not wait behind a large one.
+    A file that has not started has its full size remaining.
+    '''
+
+    def key(self, priority, size, timestamp, directory):
+        return (priority, -size, -timestamp)
+
+class EarliestDeadlinePolicy(SchedulingPolicy):
+    '''
+    Earliest deadline first, where the deadline of a file is its timestamp plus the SLA of its directory.
+    '''
+
+    def __init__(self, slas=SWIFT_DIRECTORY_SLA, default=SWIFT_DEFAULT_SLA):
+        self.slas = slas
+        self.default = default
+
+    def key(self, priority, size, timestamp, directory):
+        return (priority, -(timestamp + _lookup(self.slas, directory, self.default)))
+
+class WeightedFairPolicy(SchedulingPolicy):
+    '''
+    Weighted fair queueing between directories.
+    Each file gets a virtual finish time, which is the later of the current virtual time and the finish time 
+    of the previous file of its directory, plus its size divided by the weight of the directory.
+    The virtual time is the start time of the last popped file, so that an idle directory does not build up credit.
+    '''
+
+    def __init__(self, weights=SWIFT_DIRECTORY_WEIGHTS, default=1.0):
+        self.weights = weights
+        self.default = default
+        self._virtual_time = 0.0
+        self._finish = {} # directory : virtual finish time of its last file
+
+    def key(self, priority, size, timestamp, directory):
+        start = max(self._virtual_time, self._finish.get(directory, 0.0))
+        finish = start + max(size, 1) / float(_lookup(self.weights, directory, self.default))
+        self._finish[directory] = finish
+        return (priority, -finish, -start)
+
+    def popped(self, key):
+        self._virtual_time = max(self._virtual_time, -key[2])
+
+POLICIES = {"timestamp" : SchedulingPolicy, "srsf" : ShortestFirstPolicy, "edf" : EarliestDeadlinePolicy, 
+            "wfq" : WeightedFairPolicy}
+
+def get_policy(name):
+    """
+    @param name: Key of POLICIES
+    @rtype: SchedulingPolicy
+    """
+    return POLICIES[name]()
@@ -0,0 +1,127 @@
+'''
+Created on Mar 13, 2014
+
+@author: Vincent Ketelaars
+'''
+from src.definitions import ALMOST_DONE_DOWNLOADING_TIME, SWARM_EWMA_ALPHA
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+DOWNLOADING = "downloading"
+SEEDING = "seeding" # Seeding or initializing
+
+class SwarmAccounting(object):
+    '''
+    Keeps count of the downloading, almost done downloading and seeding swarms.
+    A swarm is classified again only when news about it comes in, such as an INFO from swift,
+    so that the counters never require a pass over all swarms.
+    Peerless swarms depend on the time since the last peer was seen,
+    so these are found by going over the swarms of a single state, and only when asked.
+    The time left for a download is estimated with a moving average of its speed, 
+    so that a single fast or slow INFO does not change its state.
+    '''
+
+    def __init__(self, alpha=SWARM_EWMA_ALPHA):
+        self.alpha = alpha
+        self._state = {} # roothash : (state, almost done)
+        self._swarms = {DOWNLOADING : {}, SEEDING : {}} # state : {roothash : SwiftDownloadImpl}
+        self._speed = {} # roothash : average download speed
+        self.almost_done = 0
+
+    def _classify(self, roothash, d):
+        """
+        @type d: SwiftDownloadImpl
+        @return: (state, almost done), where state is None if the swarm is neither downloading nor seeding
+        """
+        if d.downloading():
+            speed = d.speed("down")
+            if roothash in self._speed:
+                speed = self.alpha * speed + (1 - self.alpha) * self._speed[roothash]
+            self._speed[roothash] = speed
+            if speed != 0:
+                # The estimated number of seconds left before download is finished
+                dw_time_left = d.dynasize * (1 - d.progress) / 1024 / speed
+                if dw_time_left < ALMOST_DONE_DOWNLOADING_TIME:
+                    logger.debug("Estimate %s to be done downloading in %f", d.get_def().get_roothash_as_hex(), dw_time_left)
+                    return (DOWNLOADING, True)
+            return (DOWNLOADING, False)
+        self._speed.pop(roothash, None)
+        if d.seeding() or d.initialized():
+            return (SEEDING, False)
+        return (None, False)
+
+    def update(self, roothash, d):
+        """
+        Classify the swarm again
+        @type d: SwiftDownloadImpl
+        @return: True if the state of the swarm changed
+        """
+        new = self._classify(roothash, d)
+        old = self._state.get(roothash, (None, False))
+        if new == old:
+            return False
+        self._unlink(roothash, old)
+        self._state[roothash] = new
+        if new[0] is not None:
+            self._swarms[new[0]][roothash] = d
+        if new[1]:
+            self.almost_done += 1
+        return True
+
+    def remove(self, roothash):
+        """
+        @return: True if the swarm was counted
+        """
+        self._speed.pop(roothash, None)
+        old = self._state.pop(roothash, None)
+        if old is None:
+            return False
+        self._unlink(roothash, old)
+        return True
+
+    def _unlink(self, roothash, old):
+        if old[0] is not None:
+            del self._swarms[old[0]][roothash]
+        if old[1]:
+            self.almost_done -= 1
+
+    def clear(self):
+        self._state = {}
+        self._swarms = {DOWNLOADING : {}, SEEDING : {}}
+        self._speed = {}
+        self.almost_done = 0
+
+    @property
+    def downloading(self):
+        return len(self._swarms[DOWNLOADING])
+
+    @property
+    def seeding(self):
+        return len(self._swarms[SEEDING])
+
+    def state(self, roothash):
+        """
+        @return: (state, almost done) of the swarm, where state is None if it is not counted
+        """
+        return self._state.get(roothash, (None, False))
+
+    def swarms(self, state):
+        """
+        @param state: DOWNLOADING or SEEDING
+        @return: List of SwiftDownloadImpl in this state
+        """
+        return self._swarms[state].values()
+
+    def peerless(self, state):
+        """
+        @param state: DOWNLOADING or SEEDING
+        @return: List of SwiftDownloadImpl in this state that have not seen a peer for too long
+        """
+        return [d for d in self._swarms[state].itervalues() if not d.has_peer()]
+
+    def __contains__(self, roothash):
+        return roothash in self._state
+
+    def __len__(self):
+        return len(self._state)
@@ -0,0 +1,96 @@
+'''
+Created on Mar 14, 2014
+
+@author: Vincent Ketelaars
+'''
+from src.definitions import SWARM_CONCURRENCY_MIN, SWARM_CONCURRENCY_MAX, SWARM_CONCURRENCY_INCREASE, \
+    SWARM_CONCURRENCY_DECREASE, SWARM_CONCURRENCY_GAIN, SWARM_CONCURRENCY_PROBE_TICKS, SWARM_THROUGHPUT_COLLAPSE, \
+    SWARM_SEND_QUEUE_GROWTH, SWARM_EWMA_ALPHA
+
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+class SwarmConcurrency(object):
+    '''
+    Additive increase, multiplicative decrease of the number of swarms that are allowed to run at once.
+    When all allowed swarms are in use, one more swarm is allowed, and after a few ticks the average goodput
+    is compared to the goodput measured before that increase. If it did not rise by a clear margin, 
+    the increase is undone, and the next increase waits until goodput rises by that margin over the same reference.
+    This way noise on a saturated link does not raise the number of swarms.
+    When the throughput per swarm collapses, or the send queue grows, the number of swarms is cut.
+    '''
+
+    def __init__(self, initial, minimum=SWARM_CONCURRENCY_MIN, maximum=SWARM_CONCURRENCY_MAX, 
+                 alpha=SWARM_EWMA_ALPHA, gain=SWARM_CONCURRENCY_GAIN, probe_ticks=SWARM_CONCURRENCY_PROBE_TICKS, name=""):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.alpha = alpha
+        self.gain = gain
+        self.probe_ticks = probe_ticks
+        self.name = name
+        self.goodput = None # Average aggregate goodput
+        self.per_swarm = None # Average goodput per swarm
+        self.send_queue = None # Average aggregate send queue
+        self.reference = None # Average aggregate goodput before the previous increase
+        self.probe = None # Ticks since the increase that is being judged
+
+    def _ewma(self, average, sample):
+        if average is None:
+            return sample
+        return self.alpha * sample + (1 - self.alpha) * average
+
+    @property
+    def allowed(self):
+        """
+        @return: The number of swarms that are allowed to run at once
+        """
+        return int(self.limit)
+
+    def update(self, active, goodput, send_queue=0):
+        """
+        Called once per tick
+        @param active: Number of running swarms
+        @param goodput: Sum of the speeds of the running swarms
+        @param send_queue: Sum of the send queues of the channels of the running swarms
+        @return: allowed
+        """
+        if active == 0: # Nothing to learn from
+            return self.allowed
+        first = self.goodput is None
+        decreased = True
+        per_swarm = goodput / float(active)
+        if self.per_swarm is not None and per_swarm < self.per_swarm * SWARM_THROUGHPUT_COLLAPSE:
+            self._decrease("throughput per swarm dropped to %f" % per_swarm)
+            self.per_swarm = per_swarm # Measure the next collapse against the new situation
+        elif self.send_queue is not None and send_queue > max(self.send_queue, 1.0) * SWARM_SEND_QUEUE_GROWTH:
+            self._decrease("send queue grew to %d" % send_queue)
+        else:
+            decreased = False
+        self.goodput = self._ewma(self.goodput, goodput)
+        self.per_swarm = self._ewma(self.per_swarm, per_swarm)
+        self.send_queue = self._ewma(self.send_queue, send_queue)
+        if first or decreased:
+            return self.allowed
+        if self.probe is not None:
+            self.probe += 1
+            if self.probe < self.probe_ticks:
+                return self.allowed
+            self.probe = None
+            if not self._gained():
+                self.limit = max(self.minimum, self.limit - SWARM_CONCURRENCY_INCREASE)
+                logger.debug("Allow %d %s swarms, because goodput %f did not rise", self.allowed, self.name, self.goodput)
+                return self.allowed
+        if active >= self.allowed and self.limit < self.maximum and (self.reference is None or self._gained()):
+            self.reference = self.goodput
+            self.limit = min(self.maximum, self.limit + SWARM_CONCURRENCY_INCREASE)
+            self.probe = 0
+        return self.allowed
+
+    def _gained(self):
+        return self.goodput > self.reference * (1 + self.gain)
+
+    def _decrease(self, reason):
+        self.limit = max(self.minimum, self.limit * SWARM_CONCURRENCY_DECREASE)
+        self.reference = self.probe = None # Free to probe upwards again from here
+        logger.debug("Allow %d %s swarms, because %s", self.allowed, self.name, reason)
@@ -5,7 +5,7 @@ Created on Jan 7, 2014
 '''
 import binascii
 from os import makedirs
-from os.path import exists, basename, join
+from os.path import exists, basename, join, dirname
 from threading import Thread, Event
 
 from src.swift.tribler.SwiftDef import SwiftDef
@@ -31,6 +31,7 @@ class SwiftCommunity(object):
         self.downloads = {}
         
         self._thread_stop_event = Event()
+        # Not on the reactor, even if USE_REACTOR, because putting a download on the stack can start swarms
         self._thread_loop = Thread(target=self._loop, name="SwiftCommunity_periodic_loop")
         self._thread_loop.setDaemon(True)
         self._thread_loop.start()
@@ -54,8 +55,13 @@ class SwiftCommunity(object):
             # Sharing so setting seed to True
             download = self.add_to_downloads(roothash, filename, d, size, timestamp, seed=True, destination=destination) 
             if download.community_destination():
+                sent = []
+                def send_message_once(): # The swarm is started again after it has been preempted
+                    if not sent:
+                        sent.append(True)
+                        send_message()
                 self.endpoint.put_swift_upload_stack(self._swift_start, size, timestamp, priority=0, args=(d, self.dcomm.cid), 
-                                                     kwargs={"func" : send_message})
+                                                     kwargs={"func" : send_message_once}, key=roothash, directory=dirname(filename))
                 download.stacked()
             
     def clean_up_download(self, download):
@@ -107,7 +113,8 @@ class SwiftCommunity(object):
             download = self.add_to_downloads(roothash, d.get_dest_dir(), d, size, timestamp,
                                   seed=seed, download=True, destination=destination, priority=priority)
             if download.community_destination():
-                self.endpoint.put_swift_download_stack(self._swift_start, size, timestamp, priority=priority, args=(d, self.dcomm.cid))
+                self.endpoint.put_swift_download_stack(self._swift_start, size, timestamp, priority=priority, args=(d, self.dcomm.cid),
+                                                       key=roothash, directory=dirname(d.get_dest_dir()))
             
             
     def file_received(self, filename, contents):
@@ -249,14 +256,18 @@ class SwiftCommunity(object):
                         
     def _loop(self):
         while not self._thread_stop_event.is_set():
-            self.do_callback(MESSAGE_KEY_SWIFT_INFO, {"regular" : self._overal_data()})
-            for download in self.downloads.itervalues():
-                if not download.is_finished() and not download.running_on_swift() and not download.on_stack() and not download.is_bad_swarm():
-                    self.endpoint.put_swift_download_stack(self._swift_start, download.size, download.timestamp, 
-                                                           priority=download.priority, args=(download.downloadimpl, self.dcomm.cid))
-                    download.stacked()
+            self._loop_once()
             self._thread_stop_event.wait(REPORT_DISPERSY_INFO_TIME)
             
+    def _loop_once(self):
+        self.do_callback(MESSAGE_KEY_SWIFT_INFO, {"regular" : self._overal_data()})
+        for download in self.downloads.itervalues():
+            if not download.is_finished() and not download.running_on_swift() and not download.on_stack() and not download.is_bad_swarm():
+                self.endpoint.put_swift_download_stack(self._swift_start, download.size, download.timestamp, 
+                                                       priority=download.priority, args=(download.downloadimpl, self.dcomm.cid),
+                                                       key=download.roothash, directory=dirname(download.downloadimpl.get_dest_dir()))
+                download.stacked()
+            
     def unload_community(self):
         self._thread_stop_event.set()
         self._thread_loop.join()
@@ -8,7 +8,9 @@ import random
 import subprocess
 import sys
 import os
-import json
+import tempfile
+import time
+import errno
 from collections import defaultdict
 from threading import RLock, currentThread, Thread, Event
 
@@ -19,9 +21,14 @@ from src.swift.tribler.SwiftProcess import SwiftProcess, DONE_STATE_WORKING, DON
 from src.address import Address
 from src.definitions import LIBEVENT_LIBRARY, SWIFT_ERROR_TCP_FAILED,\
     SWIFT_ERROR_UNKNOWN_COMMAND, SWIFT_ERROR_MISSING_PARAMETER,\
-    SWIFT_ERROR_BAD_PARAMETER, MAX_WAIT_FOR_TCP
+    SWIFT_ERROR_BAD_PARAMETER, MAX_WAIT_FOR_TCP, CMDGW_BINARY, CMDGW_NEGOTIATE_TIMEOUT,\
+    CMDGW_UNIX_SOCKET, CMDGW_POLL_INTERVAL, MOREINFO_DELTA, USE_REACTOR
+from src.swift import cmdgw_records
+from src.swift.moreinfo import MoreInfo
 import socket
 from src.swift.tribler.exceptions import TCPConnectionFailedException
+from src.swift.tribler.FastI2I import FastI2IConnection
+from src.tools.reactor import get_reactor, set_nonblocking
 import signal
 
 try:
@@ -43,7 +50,12 @@ class MySwiftProcess(SwiftProcess):
         self.working_sockets = set()
         
         # NSSA control socket
-        if cmdgwport is None:
+        if CMDGW_UNIX_SOCKET and hasattr(socket, "AF_UNIX"):
+            # The path takes the place of the port, FastI2I connects to a path with AF_UNIX
+            self.cmdport = os.path.join(tempfile.gettempdir(), "swift_cmdgw_%d_%d.sock" % (os.getpid(), id(self)))
+            if os.path.exists(self.cmdport):
+                os.remove(self.cmdport)
+        elif cmdgwport is None:
             self.cmdport = random.randint(11001, 11999)
         else:
             self.cmdport = cmdgwport
@@ -79,7 +91,10 @@ class MySwiftProcess(SwiftProcess):
             args.append(gs[:-1])
         
         args.append("-c")  # command port
-        args.append("127.0.0.1:" + str(self.cmdport))
+        if self.cmdgw_unix():
+            args.append("unix:" + self.cmdport)
+        else:
+            args.append("127.0.0.1:" + str(self.cmdport))
 #         args.append("-g")  # HTTP gateway port
 #         args.append("127.0.0.1:" + str(self.httpport))
         args.append("-w")
@@ -110,10 +125,18 @@ class MySwiftProcess(SwiftProcess):
         self._swift_restart_callback = None
         self._tcp_connection_open_callback = None
         self._channel_closed_callback = None
+        self._moreinfo_callback = None
+        self._info_callback = None
         
         self.roothash2dl = {}
+        self._moreinfo = {} # roothash : last MoreInfo, on which delta reports build
         self.donestate = DONE_STATE_WORKING  # shutting down
         self.fastconn = None
+        self.reactor = get_reactor() if USE_REACTOR else None
+        self.cmdgw_binary = False # Whether Swift has agreed to binary records
+        self._negotiated = Event()
+        self._negotiated.set()
+        self._negotiating = False # Whether the answer to negotiate_binary is still expected
 
         # callbacks for when swift detect a channel close
         self._channel_close_callbacks = defaultdict(list)
@@ -150,9 +173,42 @@ class MySwiftProcess(SwiftProcess):
                     self.connection_lost(self.get_cmdport(), output_read=True)
                     break
                 print >> sys.stderr, prefix, line.rstrip()
-        self.popen_outputthreads = [Thread(target=read_and_print, args=(self.popen.stdout,), name="SwiftProcess_%d_stdout" % self.popen.pid), 
-                                    Thread(target=read_and_print, args=(self.popen.stderr,), name="SwiftProcess_%d_stderr" % self.popen.pid)]
-        [thread.start() for thread in self.popen_outputthreads]
+        if self.reactor is not None:
+            self.popen_outputthreads = []
+            self.read_on_reactor(self.popen.stdout, "SwiftProcess_%d_stdout" % self.popen.pid)
+            self.read_on_reactor(self.popen.stderr, "SwiftProcess_%d_stderr" % self.popen.pid)
+        else:
+            self.popen_outputthreads = [Thread(target=read_and_print, args=(self.popen.stdout,), name="SwiftProcess_%d_stdout" % self.popen.pid), 
+                                        Thread(target=read_and_print, args=(self.popen.stderr,), name="SwiftProcess_%d_stderr" % self.popen.pid)]
+            [thread.start() for thread in self.popen_outputthreads]
+
+    def read_on_reactor(self, pipe, name):
+        """
+        Read and print the output of swift on the reactor, instead of in a thread of its own
+        """
+        prefix = name + ":"
+        partial = [""] # Output after the last newline
+        def readable(fd):
+            try:
+                data = os.read(fd, 4096)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    return
+                data = ""
+            if not data:
+                self.reactor.remove_reader(fd)
+                if partial[0]:
+                    self.read_and_print_out(partial[0])
+                print >> sys.stderr, prefix, "readline returned nothing quitting"
+                self.connection_lost(self.get_cmdport(), output_read=True)
+                return
+            lines = (partial[0] + data).split("\n")
+            partial[0] = lines.pop()
+            for line in lines:
+                self.read_and_print_out(line + "\n")
+                print >> sys.stderr, prefix, line.rstrip()
+        set_nonblocking(pipe.fileno())
+        self.reactor.add_reader(pipe.fileno(), readable)
 
                 
     def read_and_print_out(self, line):
@@ -173,13 +229,21 @@ class MySwiftProcess(SwiftProcess):
     def start_cmd_connection(self):
         # Wait till Libswift is actually ready to create a TCP connection
         def wait_to_start():
+            if self.cmdgw_unix():
+                self._wait_for_unix_socket()
             if not self._last_moreinfo.is_set():
                 self._last_moreinfo.wait(MAX_WAIT_FOR_TCP) # Timeout in case something fails
             try:
-                SwiftProcess.start_cmd_connection(self)
+                if self.reactor is not None and self.is_alive():
+                    self.fastconn = FastI2IConnection(self.cmdport, self.i2ithread_readlinecallback, self.connection_lost,
+                                                      reactor=self.reactor)
+                else:
+                    SwiftProcess.start_cmd_connection(self)
             except TCPConnectionFailedException: # If Swift fails to connect within 60 seconds
                 if self._swift_restart_callback:
                     self._swift_restart_callback(error_code=SWIFT_ERROR_TCP_FAILED)
+            if self.fastconn is not None and CMDGW_BINARY:
+                self.negotiate_binary()
             if self.fastconn is not None and self._tcp_connection_open_callback is not None:
                 self._tcp_connection_open_callback()
             else:
@@ -190,6 +254,66 @@ class MySwiftProcess(SwiftProcess):
         t.start()
         # Python will clean up when it is done
     
+    def cmdgw_unix(self):
+        """
+        @return: True if the command connection is a unix domain socket
+        """
+        return isinstance(self.cmdport, basestring)
+
+    def _wait_for_unix_socket(self):
+        """
+        Swift is about ready as soon as it has created the socket file, so there is no need to wait for its output.
+        It creates the file before it listens, FastI2IConnection retries to connect until it does
+        """
+        timeout = time.time() + MAX_WAIT_FOR_TCP
+        while not os.path.exists(self.cmdport) and time.time() < timeout and self.is_alive():
+            time.sleep(CMDGW_POLL_INTERVAL)
+        if os.path.exists(self.cmdport):
+            self._last_moreinfo.set()
+
+    def negotiate_binary(self):
+        """
+        Ask Swift to switch the command connection to binary records.
+        Swift answers with the same line and switches both directions right after it.
+        Nothing else should be written until the answer has come in, which is why this is done
+        before the TCP connection callback. Swift versions that do not know the command answer
+        with an error, or not at all, and the text protocol remains.
+        The answer is still expected after the timeout, see i2ithread_readlinecallback.
+        """
+        self.fastconn.recordcallback = self.i2ithread_recordcallback
+        self._negotiating = True
+        self._negotiated.clear()
+        self.write(cmdgw_records.NEGOTIATE + "\r\n")
+        if not self._negotiated.wait(CMDGW_NEGOTIATE_TIMEOUT):
+            logger.debug("No answer to %s, continue in text", cmdgw_records.NEGOTIATE)
+        with self.splock: # Either the answer has switched to binary or it is late
+            self._negotiated.set()
+        logger.debug("Command connection uses %s", "binary records" if self.cmdgw_binary else "text")
+
+    def _negotiation_reply(self, ic, cmd, words):
+        """
+        Handle the answer to negotiate_binary, also when it comes in after the timeout
+        @return: True if cmd was the answer
+        """
+        if cmd == cmdgw_records.NEGOTIATE: # From here on Swift sends and expects records
+            with self.splock:
+                self._negotiating = False
+                if not self._negotiated.is_set():
+                    ic.binary = True
+                    self.cmdgw_binary = True
+                    self._negotiated.set()
+                    return True
+            # Text has been written since the timeout, which Swift can no longer read
+            logger.warning("Swift switched to binary records after %s seconds", CMDGW_NEGOTIATE_TIMEOUT)
+            ic.binary = True # Do not read its records as lines
+            self.connection_lost(self.get_cmdport(), error_code=SWIFT_ERROR_TCP_FAILED)
+            return True
+        if words[0] == "ERROR" and (len(words) < 2 or len(words[1]) != 40): # Swift does not support binary records, other errors have a roothash
+            self._negotiating = False
+            self._negotiated.set()
+            return True
+        return False
+
     def set_on_swift_restart_callback(self, callback):
         self._swift_restart_callback = callback
         
@@ -203,6 +327,12 @@ class MySwiftProcess(SwiftProcess):
     
     def set_on_channel_closed_callback(self, callback):
         self._channel_closed_callback = callback
+        
+    def set_on_moreinfo_callback(self, callback):
+        self._moreinfo_callback = callback
+        
+    def set_on_info_callback(self, callback):
+        self._info_callback = callback
     
     def i2ithread_readlinecallback(self, ic, cmd):
 #         logger.debug("CMD IN: %s", cmd)
@@ -212,6 +342,9 @@ class MySwiftProcess(SwiftProcess):
         words = cmd.split()
         assert all(isinstance(word, str) for word in words)
         
+        if self._negotiating and self._negotiation_reply(ic, cmd, words):
+            return
+
         if words[0] == "TUNNELRECV":
             address, session = words[1].split("/")
             host, port = address.split(":")
@@ -223,18 +356,11 @@ class MySwiftProcess(SwiftProcess):
                 incoming_addr = Address.unknown(words[3])
 
             # require LENGTH bytes
-            if len(ic.buffer) < length:
-                return length - len(ic.buffer)
-
-            data = ic.buffer[:length]
-            ic.buffer = ic.buffer[length:]
+            if ic.available() < length:
+                return length - ic.available()
 
-            try:
-                self.roothash2dl["dispersy-endpoint"].i2ithread_data_came_in(session, (host, port), data, incoming_addr)
-            except KeyError:
-                if self._warn_missing_endpoint:
-                    self._warn_missing_endpoint = False
-                    print >> sys.stderr, "sp: Dispersy endpoint is not available"
+            data = ic.read(length)
+            self._tunnel_data_came_in(session, (host, port), data, incoming_addr)
                     
         elif words[0] == "SOCKETINFO":
             saddr = Address.unknown(words[1])
@@ -300,34 +426,103 @@ class MySwiftProcess(SwiftProcess):
                 if len(words) > 8:
                     contentdl = int(words[8])
                     contentul = int(words[9])
-                d.i2ithread_info_callback(dlstatus, progress, dynasize, dlspeed, ulspeed, numleech, numseeds, contentdl, contentul)
+                self._info_came_in(d, roothash, dlstatus, progress, dynasize, dlspeed, ulspeed, numleech, numseeds, contentdl, contentul)
             elif words[0] == "PLAY":
                 # print >>sys.stderr,"sp: i2ithread_readlinecallback: Got PLAY",cmd
                 httpurl = words[2]
                 d.i2ithread_vod_event_callback(VODEVENT_START, httpurl)
             elif words[0] == "MOREINFO":
                 jsondata = cmd[len("MOREINFO ") + 40 + 1:]
-                midict = json.loads(jsondata)
-                d.i2ithread_moreinfo_callback(midict)
+                midict = MoreInfo(jsondata, self._moreinfo.get(roothash)) # Parsed only when read
+                self._moreinfo[roothash] = midict
+                self._moreinfo_came_in(d, roothash, midict)
             elif words[0] == "ERROR":
-                d.i2ithread_info_callback(DLSTATUS_STOPPED_ON_ERROR, 0.0, 0, 0.0, 0.0, 0, 0, 0, 0)                    
+                self._info_came_in(d, roothash, DLSTATUS_STOPPED_ON_ERROR, 0.0, 0, 0.0, 0.0, 0, 0, 0, 0)
             elif words[0] == "CHANNELCLOSED":
                 saddr = Address.unknown(words[2])
                 paddr = Address.unknown(words[3])
+                if roothash in self._moreinfo:
+                    self._moreinfo[roothash].remove_channel(saddr, paddr)
                 if self._channel_closed_callback is not None:
                     self._channel_closed_callback(roothash, saddr, paddr)
                 if d._channel_closed_callback is not None:
                     d._channel_closed_callback(roothash, saddr, paddr)
     
+    def _info_came_in(self, d, roothash, *args):
+        d.i2ithread_info_callback(*args)
+        if self._info_callback is not None: # After the download, which holds the new state
+            self._info_callback(roothash, d)
+
+    def _moreinfo_came_in(self, d, roothash, midict):
+        if self._moreinfo_callback is not None: # Before the download, which might remove itself
+            self._moreinfo_callback(roothash, midict)
+        d.i2ithread_moreinfo_callback(midict)
+
+    def _tunnel_data_came_in(self, session, address, data, incoming_addr):
+        try:
+            self.roothash2dl["dispersy-endpoint"].i2ithread_data_came_in(session, address, data, incoming_addr)
+        except KeyError:
+            if self._warn_missing_endpoint:
+                self._warn_missing_endpoint = False
+                print >> sys.stderr, "sp: Dispersy endpoint is not available"
+
+    def i2ithread_recordcallback(self, ic, rtype, payload):
+        """
+        Binary counterpart of i2ithread_readlinecallback, see cmdgw_records
+        """
+        if self.donestate != DONE_STATE_WORKING:
+            return
+
+        if rtype == cmdgw_records.TUNNELRECV:
+            session, address, data, incoming = cmdgw_records.unpack_tunnel(payload)
+            incoming_addr = 0 # None port numbers are ignored
+            if incoming[1] != 0:
+                ip = "[" + incoming[0] + "]" if ":" in incoming[0] else incoming[0]
+                incoming_addr = Address.tuple((ip, incoming[1]))
+            self._tunnel_data_came_in(session, address, data, incoming_addr)
+        elif rtype == cmdgw_records.TEXT:
+            for cmd in payload.split("\r\n"):
+                if cmd:
+                    self.i2ithread_readlinecallback(ic, cmd)
+        elif rtype in (cmdgw_records.INFO, cmdgw_records.CHANNELS):
+            if rtype == cmdgw_records.INFO:
+                values = cmdgw_records.unpack_info(payload)
+                roothash = values[0]
+            else:
+                roothash, midict = cmdgw_records.unpack_channels(payload)
+            with self.splock:
+                d = self.roothash2dl.get(roothash)
+            if d is None:
+                logger.debug("Unknown roothash %s", binascii.hexlify(roothash))
+                return
+            if rtype == cmdgw_records.INFO:
+                dlstatus, complete, dynasize = values[1:4]
+                progress = 0.0 if dynasize == 0 else float(complete) / dynasize
+                self._info_came_in(d, roothash, dlstatus, progress, dynasize, *values[4:])
+            else:
+                self._moreinfo_came_in(d, roothash, midict)
+        else:
+            logger.warning("Unknown record type %d", rtype)
+
     def write(self, msg):
+        if self.cmdgw_binary:
+            msg = cmdgw_records.text(msg)
+        self._write(msg)
+
+    def _write(self, data):
         if self.is_running():
-            logger.debug("CMD OUT: %s", msg[0:100])
+            logger.debug("CMD OUT: %s", data[0:100])
             try:
-                SwiftProcess.write(self, msg)
+                SwiftProcess.write(self, data)
             except (AttributeError, socket.error):
                 logger.warning("FastConnection is down")
             
     def connection_lost(self, port, error_code=-1, output_read=False):
+        if self.cmdgw_unix() and os.path.exists(self.cmdport): # Swift does not remove its socket file
+            try:
+                os.remove(self.cmdport)
+            except OSError:
+                pass
         if self.donestate != DONE_STATE_WORKING:
             # Only if it is still running should we consider restarting swift
             return
@@ -337,12 +532,37 @@ class MySwiftProcess(SwiftProcess):
             self._swift_restart_callback(error_code)
         
     def send_tunnel(self, session, address, data, addr=Address()):
+        self.send_tunnels(session, address, [data], addr)
+        
+    def send_tunnels(self, session, address, packets, addr=Address()):
+        """
+        Send all packets to the same address in a single write on the command connection.
+        Each packet is still framed by its own TUNNELSEND header, so Swift reads them one after the other.
+        @param address: (ip, port) of the destination
+        @param packets: List(str)
+        @param addr: The local socket address to send from, if the port is 0 Swift chooses
+        """
+        if self.cmdgw_binary:
+            source = (addr.ip, addr.port) if addr.port != 0 else ("", 0)
+            self._write("".join([cmdgw_records.tunnelsend(session, address, data, source) for data in packets]))
+            return
         if addr.port == 0:
-            SwiftProcess.send_tunnel(self, session, address, data)
+            header = "TUNNELSEND %s:%d/%s %%d\r\n" % (address[0], address[1], session.encode("HEX"))
         else:
-            self.write("TUNNELSEND %s:%d/%s %d %s\r\n" % (address[0], address[1], session.encode("HEX"), len(data), str(addr)))
-            self.write(data)
+            header = "TUNNELSEND %s:%d/%s %%d %s\r\n" % (address[0], address[1], session.encode("HEX"), str(addr))
+        self.write("".join([header % len(data) + data for data in packets]))
             
+    def remove_download(self, d, removestate, removecontent):
+        SwiftProcess.remove_download(self, d, removestate, removecontent)
+        self._moreinfo.pop(d.get_def().get_roothash(), None)
+
+    def send_setmoreinfo(self, roothash_hex, enable):
+        # assume splock is held to avoid concurrency on socket
+        onoff = "0"
+        if enable:
+            onoff = "2" if MOREINFO_DELTA else "1" # Swift versions without delta mode take any non zero as on
+        self.write('SETMOREINFO ' + roothash_hex + ' ' + onoff + '\r\n')
+
     def is_running(self):
         return (self.fastconn is not None and self.donestate != DONE_STATE_SHUTDOWN
                 and self._last_moreinfo.is_set() and self.is_alive())
@@ -6,10 +6,14 @@
 #
 
 import sys
+import time
+import errno
 from threading import Thread, Lock, currentThread, Event
 import socket
 from traceback import print_exc
 from src.swift.tribler.exceptions import TCPConnectionFailedException
+from src.swift.cmdgw_records import HEADER
+from src.definitions import MAX_WAIT_FOR_TCP, CMDGW_POLL_INTERVAL
 try:
     prctlimported = True
     import prctl
@@ -20,9 +24,11 @@ from dispersy.decorator import attach_profiler
 
 DEBUG = False
 
+RECV_SIZE = 10240
+
 class FastI2IConnection(Thread):
 
-    def __init__(self, port, readlinecallback, closecallback):
+    def __init__(self, port, readlinecallback, closecallback, reactor=None):
         Thread.__init__(self)
         self.setName("FastI2I" + self.getName())
         self.setDaemon(True)
@@ -33,15 +39,31 @@ class FastI2IConnection(Thread):
 
         self.sock = None
         self.sock_connected = Event()
+        self.connect_failed = False # Set together with sock_connected if connecting failed
         # Socket only every read by self
-        self.buffer = ''
+        # Received bytes are kept in self._buffer[self._start:self._end], without copying them around
+        self._buffer = bytearray(4 * RECV_SIZE)
+        self._start = 0 # First byte that has not been consumed
+        self._end = 0 # End of the received bytes
+        self._scan = 0 # Where to continue looking for a line separator
+        self._wait = 0 # Do not read lines before self._end reaches this, the last callback needs more bytes
+        # Once Swift has agreed to binary records, these are handed to recordcallback(self,type,payload) instead of lines
+        self.binary = False
+        self.recordcallback = None
         # write lock on socket
         self.lock = Lock()
+        # If a Reactor is given, the socket is read on its thread and this thread is never started
+        self.reactor = reactor
 
-        self.start()
+        if reactor is None:
+            self.start()
+        else:
+            self.start_on_reactor()
         timedout = self.sock_connected.wait(60)
         if timedout is not None and not timedout: # Previous to 2.7 wait returns None always
             raise TCPConnectionFailedException('Did not connect to socket within 60s.')
+        if self.connect_failed:
+            raise TCPConnectionFailedException('Could not connect to socket within %ss.' % MAX_WAIT_FOR_TCP)
 
     @attach_profiler
     def run(self):
@@ -50,27 +72,97 @@ class FastI2IConnection(Thread):
             prctl.set_name("Tribler" + currentThread().getName())
 
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect(("127.0.0.1", self.port))
+            self.sock = self._connect(MAX_WAIT_FOR_TCP)
+        except:
+            print_exc()
+            self._failed_to_connect()
+            return
+        try:
+            self.sock_connected.set()
+            while self.receive():
+                pass
+        except:
+            print_exc()
+            self.close()
+
+    def start_on_reactor(self):
+        try:
+            self.sock = self._connect(MAX_WAIT_FOR_TCP)
+        except:
+            print_exc()
+            self._failed_to_connect()
+            return
+        try:
+            self.reactor.add_reader(self.sock.fileno(), self._readable)
             self.sock_connected.set()
-            while True:
-                data = self.sock.recv(10240)
-                if len(data) == 0:
-                    break
-                self.data_came_in(data)
         except:
             print_exc()
             self.close()
 
+    def _failed_to_connect(self):
+        """ Let __init__ raise right away instead of waiting for the connection """
+        self.connect_failed = True
+        self.sock_connected.set()
+
+    def _readable(self, fd):
+        try:
+            if not self.receive():
+                self.reactor.remove_reader(fd)
+        except:
+            print_exc()
+            self.close()
+
+    def receive(self):
+        """ Receive once and read what has come in, return False if the connection is closed """
+        self._make_room(RECV_SIZE)
+        n = self.sock.recv_into(memoryview(self._buffer)[self._end:], RECV_SIZE)
+        if n == 0:
+            return False
+        self._end += n
+        self.read_lines()
+        return True
+
+    def _connect(self, timeout=0):
+        """ Connect to the port on localhost, or to the unix domain socket if port is a path.
+        Swift creates the socket file before it listens, so retry for timeout seconds while nobody listens """
+        deadline = time.time() + timeout
+        while True:
+            if isinstance(self.port, basestring):
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                address = self.port
+            else:
+                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                address = ('127.0.0.1', self.port)
+            try:
+                s.connect(address)
+                return s
+            except socket.error as e:
+                s.close()
+                if e.errno not in (errno.ECONNREFUSED, errno.ENOENT) or time.time() >= deadline:
+                    raise
+            time.sleep(CMDGW_POLL_INTERVAL)
+
     def stop(self):
         try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.connect(('127.0.0.1', self.port))
+            s = self._connect()
             s.send('')
             s.close()
         except:
             pass
 
+    def _make_room(self, size):
+        """ Ensure that size bytes can be received after self._end """
+        if len(self._buffer) - self._end >= size:
+            return
+        if self._start > 0: # Move the unconsumed bytes to the front
+            length = self._end - self._start
+            self._buffer[:length] = self._buffer[self._start:self._end]
+            self._scan -= self._start
+            self._wait -= self._start
+            self._start, self._end = 0, length
+        while len(self._buffer) - self._end < size:
+            self._buffer.extend(bytearray(len(self._buffer)))
+
     def data_came_in(self, data):
         """ Read \r\n ended lines from data and call readlinecallback(self,line) """
         # data may come in in parts, not lines! Or multiple lines at same time
@@ -78,41 +170,81 @@ class FastI2IConnection(Thread):
         if DEBUG:
             print >> sys.stderr, "fasti2i: data_came_in", repr(data), len(data)
 
-        if len(self.buffer) == 0:
-            self.buffer = data
-        else:
-            self.buffer = self.buffer + data
+        self._make_room(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
         self.read_lines()
 
     def read_lines(self):
-        while True:
-            cmd, separator, self.buffer = self.buffer.partition("\r\n")
-            if separator:
-                if self.readlinecallback(self, cmd):
-                    # 01/05/12 Boudewijn: when a positive value is returned we immediately return to
-                    # allow more bytes to be pushed into the buffer
-                    self.buffer = "".join((cmd, separator, self.buffer))
-
-                    # 06/05/13 Boudewijn: we must return to read the remainder of the data.  note
-                    # that the remainder (all bytes behind the first separator) must be removed from
-                    # self.buffer during the readlinecallback call
+        if self._end < self._wait:
+            return
+        while self._start < self._end:
+            if self.binary:
+                if not self.read_record():
                     break
-
-            else:
-                self.buffer = cmd
+            elif not self.read_line():
                 break
+        if self._start == self._end: # Everything is consumed, start at the front again
+            self._start = self._end = self._scan = self._wait = 0
+
+    def read_line(self):
+        """ Hand the next line to readlinecallback, return False if it is not complete """
+        index = self._buffer.find("\r\n", self._scan, self._end)
+        if index < 0:
+            self._scan = max(self._start, self._end - 1) # The separator may be split
+            return False
+        line_start = self._start
+        cmd = memoryview(self._buffer)[self._start:index].tobytes()
+        self._start = self._scan = index + 2
+        missing = self.readlinecallback(self, cmd)
+        if missing:
+            # 01/05/12 Boudewijn: when a positive value is returned we immediately return to
+            # allow more bytes to be pushed into the buffer
+            # The line is read again once the missing bytes have come in
+            self._start = self._scan = line_start
+            self._wait = self._end + missing
+            return False
+        return True
+
+    def read_record(self):
+        """ Hand the next record to recordcallback, return False if it is not complete """
+        if self._end - self._start < HEADER.size:
+            self._wait = self._start + HEADER.size
+            return False
+        rtype, length = HEADER.unpack_from(self._buffer, self._start)
+        end = self._start + HEADER.size + length
+        if end > self._end:
+            self._wait = end
+            return False
+        payload = memoryview(self._buffer)[self._start + HEADER.size:end].tobytes()
+        self._start = self._scan = end
+        self.recordcallback(self, rtype, payload)
+        return True
+
+    def available(self):
+        """ Number of received bytes after the current line """
+        return self._end - self._start
+
+    def read(self, length):
+        """ Consume length bytes after the current line, to be called by readlinecallback """
+        data = memoryview(self._buffer)[self._start:self._start + length].tobytes()
+        self._start += length
+        self._scan = max(self._scan, self._start)
+        return data
 
     def write(self, data):
         """ Called by any thread """
         self.lock.acquire()
         try:
             if self.sock is not None:
-                self.sock.send(data)
+                self.sock.sendall(data) # A partial send would corrupt the framing of the next write
         finally:
             self.lock.release()
 
     def close(self):
         if self.sock is not None:
+            if self.reactor is not None:
+                self.reactor.remove_reader(self.sock.fileno())
             self.sock.close()
             self.closecallback(self.port)
             self.sock = None
@@ -153,11 +153,10 @@ class SwiftProcess:
             length = int(words[2])
 
             # require LENGTH bytes
-            if len(ic.buffer) < length:
-                return length - len(ic.buffer)
+            if ic.available() < length:
+                return length - ic.available()
 
-            data = ic.buffer[:length]
-            ic.buffer = ic.buffer[length:]
+            data = ic.read(length)
 
             try:
                 self.roothash2dl["dispersy-endpoint"].i2ithread_data_came_in(session, (host, port), data)
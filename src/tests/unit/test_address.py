@@ -4,8 +4,10 @@ Created on Oct 14, 2013
 @author: Vincent Ketelaars
 '''
 import unittest
+import pickle
 
 from src.address import Address, AF_INET, AF_INET6
+from src.tools.network_interface import Interface
 
 class TestAddress(unittest.TestCase):
 
@@ -99,6 +101,31 @@ class TestAddress(unittest.TestCase):
         self.assertEqual(addr.family, AF_INET6)
         self.assertEqual(addr._flowinfo, 0)
         self.assertEqual(addr._scopeid, 0)
+        
+    def test_cached(self):
+        addr = Address.unknown("10.0.1.0:1")
+        same = Address.unknown("10.0.1.0:1")
+        self.assertEqual(addr, same)
+        self.assertIsNot(addr, same) # Each gets its own instance
+        self.assertTrue(same.is_private_address())
+        same.set_port(2)
+        self.assertEqual(Address.unknown("10.0.1.0:1").port, 1)
+        self.assertEqual(Address.tuple(("10.0.1.0", 1)), addr)
+        self.assertEqual(Address.tuple(("10.0.1.0", 1)), addr)
+        
+    def test_set_ipv4(self):
+        addr = Address(ip="10.0.1.0")
+        addr.set_ipv4("1.2.3.4")
+        self.assertFalse(addr.is_private_address())
+        self.assertTrue(addr.same_subnet("1.2.3.5", interface=Interface("eth0", "1.2.3.4", "255.255.255.0", None)))
+        self.assertFalse(addr.same_subnet("1.2.4.5", interface=Interface("eth0", "1.2.3.4", "255.255.255.0", None)))
+        
+    def test_pickle(self):
+        addr = Address.unknown("[FEDC:BA98:7654:3210:FEDC:BA98:7654:3210]:1/2%3")
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(addr, protocol))
+            self.assertEqual(copy, addr)
+            self.assertEqual(copy._flowinfo, 2)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,64 @@
+'''
+Created on Mar 3, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.address import Address
+from src.swift.channel_index import ChannelIndex
+
+def channel(sip, sport, ip, port, up=0.0, send_queue=0, rtt=0):
+    return {"socket_ip" : sip, "socket_port" : sport, "ip" : ip, "port" : port, "cur_speed_up" : up, 
+            "cur_speed_down" : 0.0, "send_queue" : send_queue, "avg_rtt" : rtt}
+
+class TestChannelIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ChannelIndex()
+        self.peer = Address(ip="1.2.3.4", port=1234)
+        self.other = Address(ip="4.3.2.1", port=4321)
+        self.index.update("a", {"channels" : [channel(u"10.0.0.1", 1, u"1.2.3.4", 1234, up=100.0, send_queue=50),
+                                              channel(u"10.0.0.2", 2, u"1.2.3.4", 1234, up=200.0, send_queue=20),
+                                              channel(u"10.0.0.1", 1, u"4.3.2.1", 4321, up=10.0)]})
+        self.index.update("b", {"channels" : [channel(u"10.0.0.1", 1, u"1.2.3.4", 1234, send_queue=100)]})
+
+    def test_channels(self):
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(len(self.index.channels([self.peer])), 3)
+        self.assertEqual(len(self.index.channels([self.peer, self.other])), 4)
+        self.assertEqual(self.index.channels([Address(ip="9.9.9.9", port=9)]), [])
+
+    def test_update_replaces_swarm(self):
+        self.index.update("b", {"channels" : []})
+        self.assertEqual(len(self.index.channels([self.peer])), 2)
+        self.index.remove_swarm("a")
+        self.assertEqual(self.index.channels([self.peer, self.other]), [])
+        
+    def test_remove_channel(self):
+        self.index.remove_channel("a", Address(ip="10.0.0.1", port=1), self.peer)
+        channels = self.index.channels([self.peer])
+        self.assertEqual(len(channels), 2)
+        self.assertEqual(len(self.index.channels([self.other])), 1)
+        
+    def test_ranked(self):
+        ranked = self.index.ranked([self.peer])
+        self.assertEqual(len(ranked), 3)
+        # The socket 10.0.0.2 has 20 bytes queued at 200 bytes/s
+        self.assertEqual(ranked[0][0].sock_addr, Address(ip="10.0.0.2", port=2))
+        self.assertAlmostEqual(ranked[0][1], 0.1)
+        self.assertAlmostEqual(ranked[-1][1], 1.0)
+        self.index.update("a", {"channels" : []})
+        self.assertEqual(self.index.ranked([self.peer]), []) # Only 10.0.0.1 left, without speed
+        
+    def test_unchanged_update(self):
+        ranked = self.index.ranked([self.peer])
+        changed = self.index.update("b", {"channels" : [channel(u"10.0.0.1", 1, u"1.2.3.4", 1234, send_queue=100)]})
+        self.assertEqual(changed, [])
+        self.assertIs(self.index.ranked([self.peer]), ranked) # Still cached
+        changed = self.index.update("b", {"channels" : [channel(u"10.0.0.1", 1, u"1.2.3.4", 1234, send_queue=10)]})
+        self.assertEqual(len(changed), 1)
+        self.assertIsNot(self.index.ranked([self.peer]), ranked)
+        
+if __name__ == "__main__":
+    unittest.main()
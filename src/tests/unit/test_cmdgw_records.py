@@ -0,0 +1,46 @@
+'''
+Created on Mar 8, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.swift import cmdgw_records as records
+
+ROOTHASH = "\x01" * 20
+
+class TestCmdgwRecords(unittest.TestCase):
+
+    def unpack(self, record):
+        rtype, length = records.HEADER.unpack_from(record)
+        payload = record[records.HEADER.size:]
+        self.assertEqual(length, len(payload))
+        return rtype, payload
+
+    def test_tunnel(self):
+        rtype, payload = self.unpack(records.tunnelsend("ffff", ("1.2.3.4", 1234), "data", ("10.0.0.1", 5678)))
+        self.assertEqual(rtype, records.TUNNELSEND)
+        self.assertEqual(records.unpack_tunnel(payload), ("ffff", ("1.2.3.4", 1234), "data", ("10.0.0.1", 5678)))
+        rtype, payload = self.unpack(records.tunnelrecv("ffff", ("::1", 1234), "\r\n"))
+        self.assertEqual(rtype, records.TUNNELRECV)
+        self.assertEqual(records.unpack_tunnel(payload), ("ffff", ("::1", 1234), "\r\n", ("", 0)))
+
+    def test_info(self):
+        values = (ROOTHASH, 3, 512, 1024, 10.5, 2.0, 1, 2, 500, 600)
+        rtype, payload = self.unpack(records.info(*values))
+        self.assertEqual(rtype, records.INFO)
+        self.assertEqual(records.unpack_info(payload), values)
+
+    def test_channels(self):
+        channel = {"socket_ip" : "10.0.0.1", "socket_port" : 1, "ip" : "1.2.3.4", "port" : 2, "cur_speed_up" : 100.0,
+                   "cur_speed_down" : 50.0, "bytes_up" : 10, "bytes_down" : 20, "raw_bytes_up" : 30,
+                   "raw_bytes_down" : 40, "send_queue" : 5, "avg_rtt" : 1000}
+        midict = {"bytes_up" : 1, "bytes_down" : 2, "raw_bytes_up" : 3, "raw_bytes_down" : 4, "channels" : [channel]}
+        rtype, payload = self.unpack(records.channels(ROOTHASH, midict))
+        self.assertEqual(rtype, records.CHANNELS)
+        self.assertEqual(records.unpack_channels(payload), (ROOTHASH, midict))
+        _, payload = self.unpack(records.channels(ROOTHASH, {}))
+        self.assertEqual(records.unpack_channels(payload)[1]["channels"], [])
+
+if __name__ == "__main__":
+    unittest.main()
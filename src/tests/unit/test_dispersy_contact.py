@@ -6,7 +6,8 @@ Created on Feb 6, 2014
 import unittest
 from datetime import datetime
 from src.address import Address
-from src.dispersy_contact import DispersyContact
+from src.dispersy_contact import DispersyContact, ContactRegistry
+from src.peer import Peer
 from src.logger import get_logger
 logger = get_logger(__name__)
 
@@ -34,6 +35,37 @@ class Test(unittest.TestCase):
         self.assertEqual(self.dc.num_sent(), 5)
         self.assertEqual(self.dc.total_sent(), 759)
         self.assertSequenceEqual(self.dc.no_contact_since(), [self.main])
+        
+    def test_registry_find(self):
+        registry = ContactRegistry([self.dc])
+        other = Address("193.156.108.79", port=12345)
+        self.assertSequenceEqual(registry.find(self.main), [self.dc])
+        self.assertSequenceEqual(registry.find(other), [])
+        self.assertEqual(registry.find_primary(self.main), self.dc)
+        
+        lan = Address("192.168.1.2", port=12345)
+        self.dc.set_peer(Peer([lan], [other], ["id1"], "mid1"))
+        self.dc.member_id = "mid1"
+        self.assertSequenceEqual(registry.find(other), [self.dc])
+        self.assertSequenceEqual(registry.find(lan), [self.dc])
+        self.assertIsNone(registry.find_primary(lan))
+        self.assertSequenceEqual(registry.match(ids=["id1"]), [self.dc])
+        self.assertSequenceEqual(registry.match(mid="mid1"), [self.dc])
+        
+        self.dc.update_address(lan, Address("193.156.108.80", port=12345), "id1", "mid1")
+        self.assertSequenceEqual(registry.find(other), [])
+        
+    def test_registry_discard(self):
+        registry = ContactRegistry()
+        registry.add(self.dc)
+        registry.add(self.dc)
+        self.assertEqual(len(registry), 1)
+        self.assertIn(self.dc, registry)
+        registry.difference_update([self.dc])
+        self.assertEqual(len(registry), 0)
+        self.assertSequenceEqual(registry.find(self.main), [])
+        self.dc.member_id = "mid1" # No longer indexed
+        self.assertSequenceEqual(registry.match(mid="mid1"), [])
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
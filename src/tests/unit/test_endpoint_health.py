@@ -0,0 +1,64 @@
+'''
+Created on Mar 5, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+from datetime import datetime, timedelta
+from errno import EWOULDBLOCK, ENETUNREACH
+
+from src.endpoint_health import EndpointHealth
+from src.swift.channel_index import Channel
+
+def channel(up=0.0, send_queue=0, rtt=0, raw_bytes_up=0):
+    return Channel("a", {"socket_ip" : u"10.0.0.1", "socket_port" : 1, "ip" : u"1.2.3.4", "port" : 1234, 
+                         "cur_speed_up" : up, "cur_speed_down" : 0.0, "send_queue" : send_queue, "avg_rtt" : rtt,
+                         "raw_bytes_up" : raw_bytes_up})
+
+class TestEndpointHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.health = EndpointHealth(alpha=0.5)
+
+    def test_rtt_throughput(self):
+        self.health.update("a", [channel(up=100.0, rtt=100000)])
+        self.assertAlmostEqual(self.health.rtt, 0.1)
+        self.health.update("a", [channel(up=300.0, rtt=300000, raw_bytes_up=10)])
+        self.assertAlmostEqual(self.health.rtt, 0.2)
+        self.assertAlmostEqual(self.health.throughput, 175.0) # Starts at 0
+        self.assertEqual(self.health.loss, 0.0)
+
+    def test_loss(self):
+        self.health.update("a", [channel(send_queue=10, raw_bytes_up=100)])
+        self.health.update("a", [channel(send_queue=10, raw_bytes_up=100)])
+        self.assertAlmostEqual(self.health.loss, 0.5)
+        self.assertAlmostEqual(self.health.expected_transmissions(), 2.0)
+        for _ in range(5):
+            self.health.update("a", [channel(send_queue=10, raw_bytes_up=100)])
+        self.assertTrue(self.health.is_lossy())
+        self.assertFalse(self.health.is_dead())
+        self.health.update("a", [channel(send_queue=10, raw_bytes_up=200)])
+        self.assertFalse(self.health.is_lossy())
+
+    def test_dead(self):
+        self.health.socket_state(0)
+        self.assertFalse(self.health.is_dead())
+        self.health.socket_state(EWOULDBLOCK)
+        self.assertIsNone(self.health.error_since)
+        self.health.socket_state(ENETUNREACH) # The clock starts at the real error
+        self.assertFalse(self.health.is_dead())
+        self.health.error_since -= timedelta(seconds=60)
+        self.assertTrue(self.health.is_dead())
+        self.health.socket_state(EWOULDBLOCK)
+        self.assertFalse(self.health.is_dead())
+        self.health.socket_state(ENETUNREACH) # Restarts the clock
+        self.assertFalse(self.health.is_dead())
+        self.health.socket_state(0)
+        self.assertFalse(self.health.is_dead())
+        self.health.socket_state(ENETUNREACH)
+        self.assertFalse(self.health.is_dead())
+        self.assertTrue(self.health.is_dead(dead_time=-1))
+        self.assertTrue(self.health.error_since <= datetime.utcnow())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+'''
+Created on Mar 20, 2014
+
+@author: Vincent Ketelaars
+'''
+import os
+import socket
+import tempfile
+import shutil
+import unittest
+from threading import Timer, Event
+
+from src.swift.tribler.FastI2I import FastI2IConnection, RECV_SIZE
+
+TIMEOUT = 5.0
+
+class UnconnectedI2I(FastI2IConnection):
+    '''
+    Never connects, data is handed to data_came_in as if it was received
+    '''
+
+    def start(self):
+        self.sock_connected.set()
+
+class Reader(object):
+    '''
+    Reads lines as MySwiftProcess does, with the payload of TUNNELRECV
+    '''
+
+    def __init__(self):
+        self.lines = []
+        self.calls = 0
+
+    def __call__(self, ic, cmd):
+        self.calls += 1
+        words = cmd.split()
+        if words[0] == "TUNNELRECV":
+            length = int(words[2])
+            if ic.available() < length:
+                return length - ic.available()
+            self.lines.append((cmd, ic.read(length)))
+        else:
+            self.lines.append(cmd)
+
+def tunnelrecv(data):
+    return "TUNNELRECV 1.2.3.4:1234/0000 %d\r\n" % len(data) + data
+
+class TestFastI2I(unittest.TestCase):
+
+    def setUp(self):
+        self.reader = Reader()
+        self.conn = UnconnectedI2I("/nonexistent", self.reader, lambda port: None)
+
+    def test_lines(self):
+        self.conn.data_came_in("INFO a\r\nINFO b\r\nINFO")
+        self.assertEqual(self.reader.lines, ["INFO a", "INFO b"])
+        self.conn.data_came_in(" c\r\n")
+        self.assertEqual(self.reader.lines, ["INFO a", "INFO b", "INFO c"])
+        self.assertEqual((self.conn._start, self.conn._end), (0, 0)) # All consumed
+
+    def test_split_separator(self):
+        self.conn.data_came_in("INFO a\r")
+        self.assertEqual(self.reader.lines, [])
+        self.conn.data_came_in("\nINFO b\r")
+        self.assertEqual(self.reader.lines, ["INFO a"])
+        self.conn.data_came_in("\n")
+        self.assertEqual(self.reader.lines, ["INFO a", "INFO b"])
+
+    def test_payload_with_separator(self):
+        self.conn.data_came_in(tunnelrecv("ab\r\ncd") + "INFO a\r\n")
+        self.assertEqual(self.reader.lines, [("TUNNELRECV 1.2.3.4:1234/0000 6", "ab\r\ncd"), "INFO a"])
+
+    def test_short_payload(self):
+        self.conn.data_came_in(tunnelrecv("ab\r\ncd")[:-4])
+        self.assertEqual(self.reader.calls, 1)
+        self.assertEqual(self.reader.lines, [])
+        self.conn.data_came_in("\r\nc") # Still one byte short, so the line is not read again
+        self.assertEqual(self.reader.calls, 1)
+        self.conn.data_came_in("dINFO a\r\n")
+        self.assertEqual(self.reader.calls, 3)
+        self.assertEqual(self.reader.lines, [("TUNNELRECV 1.2.3.4:1234/0000 6", "ab\r\ncd"), "INFO a"])
+        self.assertEqual((self.conn._start, self.conn._end, self.conn._wait), (0, 0, 0))
+
+    def test_compaction(self):
+        first = "INFO " + "a" * (2 * RECV_SIZE) + "\r\n"
+        data = tunnelrecv("".join([chr(i % 256) for i in range(2 * RECV_SIZE)]))
+        self.conn.data_came_in(first + data[:RECV_SIZE])
+        self.assertEqual(self.conn._start, len(first)) # Waits for the rest of the payload
+        self.conn.data_came_in(data[RECV_SIZE:2 * RECV_SIZE]) # Does not fit behind the unconsumed bytes
+        self.assertEqual((self.conn._start, self.conn._end), (0, 2 * RECV_SIZE)) # Moved to the front to make room
+        self.assertEqual(len(self.conn._buffer), 4 * RECV_SIZE)
+        self.assertEqual(self.reader.lines, [first[:-2]])
+        self.conn.data_came_in(data[2 * RECV_SIZE:] + "INFO b\r\n")
+        self.assertEqual(self.reader.lines, [first[:-2], (data[:data.index("\r\n")], data[data.index("\r\n") + 2:]), 
+                                             "INFO b"])
+
+    def test_growth(self):
+        payload = "".join([chr(i % 251) for i in range(5 * RECV_SIZE)])
+        data = tunnelrecv(payload) + "INFO a\r\n"
+        for i in range(0, len(data), RECV_SIZE / 2):
+            self.conn.data_came_in(data[i:i + RECV_SIZE / 2])
+        self.assertTrue(len(self.conn._buffer) > 4 * RECV_SIZE)
+        self.assertEqual(self.reader.lines, [("TUNNELRECV 1.2.3.4:1234/0000 %d" % len(payload), payload), "INFO a"])
+
+class TestFastI2IConnect(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cmdgw.sock")
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.conn = None
+        self.reader = Reader()
+        self.line = Event()
+        def readline(ic, cmd):
+            self.reader(ic, cmd)
+            self.line.set()
+        self.readline = readline
+
+    def tearDown(self):
+        if self.conn is not None:
+            self.conn.close()
+        self.listener.close()
+        shutil.rmtree(self.directory)
+
+    def listen(self):
+        if not os.path.exists(self.path):
+            self.listener.bind(self.path)
+        self.listener.listen(1)
+
+    def connect(self):
+        self.conn = FastI2IConnection(self.path, self.readline, lambda port: None)
+        server, _ = self.listener.accept()
+        server.sendall("INFO a\r\n")
+        self.line.wait(TIMEOUT)
+        server.close()
+        self.assertEqual(self.reader.lines, ["INFO a"])
+
+    def test_bound_before_listen(self):
+        self.listener.bind(self.path) # As Swift does, the file exists but connecting is refused
+        Timer(0.1, self.listen).start()
+        self.connect()
+
+    def test_created_late(self):
+        Timer(0.1, self.listen).start()
+        self.connect()
+
+    def test_give_up(self):
+        conn = UnconnectedI2I(self.path, self.reader, lambda port: None)
+        self.assertRaises(socket.error, conn._connect, 0.05)
+
+if __name__ == "__main__":
+    unittest.main()
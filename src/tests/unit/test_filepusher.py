@@ -6,9 +6,14 @@ Created on Sep 10, 2013
 import unittest
 import os
 import time
+import errno
+import shutil
+import tempfile
 
 from src.filepusher import FilePusher
-from src.definitions import SWIFT_BINPATH, MAX_MESSAGE_SIZE, HASH_LENGTH, FILENAMES_NOT_TO_SEND, FILETYPES_NOT_TO_SEND
+from src.tools import inotify
+from src.definitions import SWIFT_BINPATH, MAX_MESSAGE_SIZE, HASH_LENGTH, FILENAMES_NOT_TO_SEND, FILETYPES_NOT_TO_SEND,\
+    USE_INOTIFY, SLEEP_TIME
 
 from src.tests.unit.definitions import DIRECTORY, FILES
 
@@ -143,5 +148,84 @@ class TestFilePusher(unittest.TestCase):
         
         self.wait_and_asses(all_files)
 
+class TestFilePusherInotify(unittest.TestCase):
+    """
+    Small files only, such that no swift is needed to hash them
+    """
+    
+    def setUp(self):
+        if not USE_INOTIFY or not inotify.available():
+            raise unittest.SkipTest("inotify is not used")
+        self._directory = tempfile.mkdtemp()
+        self._sent = []
+        self._filepusher = FilePusher(lambda message: self._sent.append(message.filename), SWIFT_BINPATH, 
+                                      directories=[self._directory])
+        
+    def tearDown(self):
+        self._filepusher.stop()
+        self._filepusher.join(2 * SLEEP_TIME)
+        shutil.rmtree(self._directory)
+        
+    def write(self, name, content="content"):
+        path = os.path.join(self._directory, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+    
+    def wait_for(self, filename, timeout=4 * SLEEP_TIME):
+        end = time.time() + timeout
+        while filename not in self._sent and time.time() < end:
+            time.sleep(0.05)
+        return filename in self._sent
+    
+    def start(self):
+        first = self.write("first")
+        self._filepusher.start()
+        self.assertTrue(self.wait_for(first)) # The first scan is done
+        self.assertIsNotNone(self._filepusher._inotify)
+        
+    def test_new_subdirectory(self):
+        self.start()
+        os.mkdir(os.path.join(self._directory, "sub"))
+        before = self.write("sub/before") # Possibly before the watch on sub is added
+        self.assertTrue(self.wait_for(before))
+        after = self.write("sub/after")
+        self.assertTrue(self.wait_for(after))
+        self.assertEqual(self._sent.count(before), 1)
+        
+    def test_rewritten_file(self):
+        self.start()
+        path = self.write("rewritten")
+        self.assertTrue(self.wait_for(path))
+        time.sleep(0.05) # Let the modification time change
+        self.write("rewritten", "other content")
+        end = time.time() + 4 * SLEEP_TIME
+        while self._sent.count(path) < 2 and time.time() < end:
+            time.sleep(0.05)
+        self.assertEqual(self._sent.count(path), 2)
+        
+    def test_watch_failure(self):
+        self.start()
+        def add_watch(path, mask):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        self._filepusher._inotify.add_watch = add_watch
+        os.mkdir(os.path.join(self._directory, "sub")) # Can not be watched
+        self.assertTrue(self.wait_for(self.write("sub/file")))
+        self.assertIsNone(self._filepusher._inotify)
+        self.assertTrue(self.wait_for(self.write("scanned"))) # Found by scanning every SLEEP_TIME
+        
+    def test_queue_overflow(self):
+        self.start()
+        watches = self._filepusher._inotify._watches
+        for wd in watches.keys(): # Lose the events of the directory
+            self._filepusher._inotify.rm_watch(wd)
+        missed = self.write("missed")
+        self.assertFalse(self.wait_for(missed, timeout=2 * SLEEP_TIME))
+        read = self._filepusher._inotify.read
+        self._filepusher._inotify.read = lambda timeout: [(None, inotify.IN_Q_OVERFLOW, 0, "")]
+        self.assertTrue(self.wait_for(missed)) # Found by a full scan
+        self._filepusher._inotify.read = read
+        self.assertEqual(self._sent.count(missed), 1)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
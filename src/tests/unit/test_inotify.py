@@ -0,0 +1,59 @@
+'''
+Created on Mar 17, 2014
+
+@author: Vincent Ketelaars
+'''
+import os
+import shutil
+import tempfile
+import unittest
+
+from src.tools import inotify
+
+class TestInotify(unittest.TestCase):
+
+    def setUp(self):
+        if not inotify.available():
+            raise unittest.SkipTest("inotify is not available")
+        self.directory = tempfile.mkdtemp()
+        self.inotify = inotify.Inotify()
+        self.inotify.add_watch(self.directory, inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | inotify.IN_CREATE)
+
+    def tearDown(self):
+        self.inotify.close()
+        shutil.rmtree(self.directory)
+        
+    def names(self, mask):
+        return [name for path, m, _, name in self.inotify.read(1.0) if m & mask and path == self.directory]
+
+    def test_close_write(self):
+        self.assertEqual(self.inotify.read(0.0), [])
+        with open(os.path.join(self.directory, "a"), "w") as f:
+            f.write("a")
+        self.assertEqual(self.names(inotify.IN_CLOSE_WRITE), ["a"])
+        
+    def test_moved_to_and_directory(self):
+        other = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(other, "b"), "w") as f:
+                f.write("b")
+            os.rename(os.path.join(other, "b"), os.path.join(self.directory, "b"))
+            self.assertEqual(self.names(inotify.IN_MOVED_TO), ["b"])
+        finally:
+            shutil.rmtree(other)
+        os.mkdir(os.path.join(self.directory, "sub"))
+        self.assertEqual(self.names(inotify.IN_CREATE | inotify.IN_ISDIR), ["sub"])
+        
+    def test_watch_removed(self):
+        sub = os.path.join(self.directory, "sub")
+        os.mkdir(sub)
+        self.inotify.read(1.0)
+        self.inotify.add_watch(sub, inotify.IN_CLOSE_WRITE)
+        self.assertEqual(len(self.inotify.watches()), 2)
+        os.rmdir(sub)
+        self.inotify.read(1.0)
+        self.assertEqual(self.inotify.watches(), [self.directory])
+        self.assertRaises(OSError, self.inotify.add_watch, os.path.join(self.directory, "missing"), inotify.IN_CREATE)
+
+if __name__ == "__main__":
+    unittest.main()
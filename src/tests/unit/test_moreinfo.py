@@ -0,0 +1,63 @@
+'''
+Created on Mar 9, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+import json
+
+from src.address import Address
+from src.definitions import MOREINFO_MAX_UNREAD_DELTAS
+from src.swift.moreinfo import MoreInfo
+
+def channel(ip, port, bytes_up=0):
+    return {"socket_ip" : "10.0.0.1", "socket_port" : 1, "ip" : ip, "port" : port, "bytes_up" : bytes_up}
+
+class TestMoreInfo(unittest.TestCase):
+
+    def test_lazy(self):
+        midict = MoreInfo(json.dumps({"bytes_up" : 10, "channels" : [channel("1.2.3.4", 1234)]}))
+        self.assertFalse(midict.parsed)
+        self.assertIn("channels", midict)
+        self.assertTrue(midict.parsed)
+        self.assertEqual(midict["bytes_up"], 10)
+        self.assertEqual(midict.get("bytes_down", 0), 0)
+
+    def test_delta(self):
+        first = MoreInfo(json.dumps({"channels" : [channel("1.2.3.4", 1234), channel("4.3.2.1", 4321)]}))
+        second = MoreInfo(json.dumps({"delta" : 1, "channels" : [channel("1.2.3.4", 1234, bytes_up=5)]}), first)
+        channels = sorted(second["channels"], key=lambda c: c["ip"])
+        self.assertEqual(len(channels), 2)
+        self.assertEqual(channels[0]["bytes_up"], 5)
+        self.assertEqual(channels[1]["ip"], "4.3.2.1")
+        
+    def test_remove_channel(self):
+        first = MoreInfo(json.dumps({"channels" : [channel("1.2.3.4", 1234), channel("4.3.2.1", 4321)]}))
+        first.remove_channel(Address(ip="10.0.0.1", port=1), Address(ip="4.3.2.1", port=4321))
+        second = MoreInfo(json.dumps({"delta" : 1, "channels" : []}), first)
+        self.assertEqual([c["ip"] for c in second["channels"]], ["1.2.3.4"])
+        
+    def test_unread_reports(self):
+        first = MoreInfo(json.dumps({"channels" : []}))
+        second = MoreInfo(json.dumps({"delta" : 1, "channels" : []}), first)
+        MoreInfo(json.dumps({"delta" : 1, "channels" : []}), second)
+        self.assertFalse(first.parsed)
+        self.assertFalse(second.parsed)
+
+    def test_full_report_drops_previous(self):
+        first = MoreInfo(json.dumps({"channels" : [channel("1.2.3.4", 1234)]}))
+        second = MoreInfo(json.dumps({"channels" : []}), first)
+        self.assertEqual(second["channels"], [])
+        self.assertFalse(first.parsed)
+
+    def test_max_unread_deltas(self):
+        midict = MoreInfo(json.dumps({"channels" : [channel("1.2.3.4", 1234)]}))
+        for i in range(MOREINFO_MAX_UNREAD_DELTAS * 2):
+            midict = MoreInfo(json.dumps({"delta" : 1, "channels" : [channel("4.3.2.1", 4321, bytes_up=i)]}), midict)
+            self.assertTrue(len(midict._pending) <= MOREINFO_MAX_UNREAD_DELTAS)
+        channels = sorted(midict["channels"], key=lambda c: c["ip"])
+        self.assertEqual([(c["ip"], c["bytes_up"]) for c in channels],
+                         [("1.2.3.4", 0), ("4.3.2.1", MOREINFO_MAX_UNREAD_DELTAS * 2 - 1)])
+
+if __name__ == "__main__":
+    unittest.main()
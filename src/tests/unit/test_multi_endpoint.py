@@ -0,0 +1,178 @@
+'''
+Created on Mar 18, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+import json
+
+from src.swift.swift_process import MySwiftProcess # Before other import because of logger
+from dispersy.candidate import WalkCandidate
+
+from src.address import Address
+from src.dispersy_contact import DispersyContact
+from src.definitions import REDUNDANT_MESSAGE_NAMES, REDUNDANT_PATHS, REDUNDANT_RECV_CACHE_SIZE
+from src.dispersy_extends.endpoint import MultiEndpoint
+from src.endpoint_health import EndpointHealth
+from src.swift.moreinfo import MoreInfo
+from src.tools.network_interface import Interface
+from src.tests.unit.mock_classes import FakeSwift
+
+REDUNDANT = REDUNDANT_MESSAGE_NAMES[0]
+
+class ReadySwift(FakeSwift):
+
+    def is_ready(self):
+        return True
+
+class FakeSwiftEndpoint(object):
+
+    def __init__(self, ip, port, usable=True):
+        self.address = address(ip, port)
+        self.wan_address = self.address
+        self.usable = usable
+        self.socket_running = True
+        self.is_alive = True
+        self.health = EndpointHealth()
+        self.sent = []
+
+    def is_usable(self):
+        return self.usable
+
+    def get_contact(self, address=Address(), mid=None):
+        return None
+
+    def enqueue_send(self, candidate, packets):
+        self.sent.append((candidate.sock_addr, list(packets)))
+        return True
+
+def address(ip, port):
+    broadcast = ip.rsplit(".", 1)[0] + ".255"
+    return Address(ip=ip, port=port, interface=Interface("eth_" + ip, ip, "255.255.255.0", broadcast))
+
+def packet(name, i):
+    return name + ":" + str(i)
+
+def report(*peers):
+    return MoreInfo(json.dumps({"channels" : [{"socket_ip" : "1.1.1.1", "socket_port" : 1, "ip" : ip, "port" : port}
+                                              for ip, port in peers]}))
+
+def channel(e, speed_up, send_queue=0, ip="8.8.8.8", port=1000):
+    return {"socket_ip" : e.address.ip, "socket_port" : e.address.port, "ip" : ip, "port" : port, 
+            "cur_speed_up" : speed_up, "send_queue" : send_queue}
+
+def candidate(ip="8.8.8.8", port=1000):
+    return WalkCandidate((ip, port), True, (ip, port), (ip, port), u"unknown")
+
+class TestMultiEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.endpoint = MultiEndpoint(ReadySwift([]))
+        self.endpoint.update_dispersy_contacts = lambda sock_addr, packets, recv=True: (None, None)
+        self.endpoint._packet_name = lambda data: data.split(":")[0]
+        self.e1 = FakeSwiftEndpoint("1.1.1.1", 1)
+        self.e2 = FakeSwiftEndpoint("2.2.2.2", 2)
+        self.e3 = FakeSwiftEndpoint("1.1.1.1", 3) # Shares its ip with e1
+        self.endpoint.swift_endpoints = [self.e1, self.e2, self.e3]
+        self.endpoint._endpoint = self.e1
+
+    def sent(self):
+        return [p for e in self.endpoint.swift_endpoints for _, ps in e.sent for p in ps]
+
+    def test_redundant_endpoints(self):
+        paths = self.endpoint._redundant_endpoints(candidate(), [packet(REDUNDANT, 0)])
+        self.assertEqual(len(paths), REDUNDANT_PATHS)
+        self.assertEqual(len(set([e.address.ip for e, _ in paths])), len(paths)) # Disjoint local ips
+        self.assertTrue(all([paddr == Address.tuple(("8.8.8.8", 1000)) for _, paddr in paths]))
+        self.e2.usable = False
+        self.assertEqual(len(self.endpoint._redundant_endpoints(candidate(), [packet(REDUNDANT, 0)])), 1)
+
+    def test_is_duplicate(self):
+        self.assertFalse(self.endpoint._is_duplicate("a"))
+        self.assertTrue(self.endpoint._is_duplicate("a"))
+        self.assertFalse(self.endpoint._is_duplicate("b"))
+        for i in range(REDUNDANT_RECV_CACHE_SIZE):
+            self.endpoint._is_duplicate(str(i))
+        self.assertFalse(self.endpoint._is_duplicate("a")) # Forgotten
+
+    def test_mixed_batch(self):
+        packets = [packet("data", 0), packet(REDUNDANT, 1), packet("data", 2)]
+        self.assertTrue(self.endpoint.send([candidate()], packets))
+        sent = self.sent()
+        self.assertEqual(sent.count(packet(REDUNDANT, 1)), REDUNDANT_PATHS)
+        self.assertEqual(sent.count(packet("data", 0)), 1)
+        self.assertEqual(sent.count(packet("data", 2)), 1)
+        ordinary = [ps for e in self.endpoint.swift_endpoints for _, ps in e.sent if packet("data", 0) in ps]
+        self.assertEqual(ordinary, [[packet("data", 0), packet("data", 2)]]) # In order, on one path
+
+    def test_single_endpoint_batch(self):
+        self.endpoint.swift_endpoints = [self.e1]
+        packets = [packet("data", 0), packet(REDUNDANT, 1)]
+        self.endpoint.send([candidate()], packets)
+        self.assertEqual(self.e1.sent, [(("8.8.8.8", 1000), packets)])
+
+    def test_unread_moreinfo(self):
+        first = report(("8.8.8.8", 1000))
+        self.endpoint.moreinfo_callback("a" * 20, first)
+        self.assertFalse(first.parsed)
+        second = report(("8.8.8.8", 1000), ("9.9.9.9", 1000))
+        self.endpoint.moreinfo_callback("a" * 20, second)
+        self.assertFalse(first.parsed)
+        self.assertFalse(second.parsed)
+        self.assertEqual(self.endpoint._channel_index.swarm("a" * 20), [])
+
+    def test_apply_moreinfo(self):
+        midict = report(("8.8.8.8", 1000), ("9.9.9.9", 1000))
+        self.endpoint.moreinfo_callback("a" * 20, midict)
+        self.endpoint.apply_moreinfo()
+        self.assertTrue(midict.parsed)
+        self.assertEqual(sorted([c.peer_addr.ip for c in self.endpoint._channel_index.swarm("a" * 20)]), 
+                         ["8.8.8.8", "9.9.9.9"])
+        self.assertEqual(self.endpoint._pending_moreinfo, {})
+
+    def stripes(self, packets):
+        return dict([(e, ps) for e, _, ps in self.endpoint._stripe_packets(candidate(), packets)])
+
+    def test_stripe_packets(self):
+        self.endpoint._channel_index.update("a" * 20, {"channels" : [channel(self.e1, 100.0), channel(self.e2, 100.0)]})
+        packets = [packet("data", i) * (1 + i % 3) for i in range(8)]
+        stripes = self.stripes(packets)
+        self.assertEqual(sorted(stripes.keys()), sorted([self.e1, self.e2]))
+        self.assertEqual(sorted(stripes[self.e1] + stripes[self.e2]), sorted(packets))
+        for ps in stripes.itervalues(): # Each stripe keeps the original order
+            self.assertEqual(ps, [p for p in packets if p in ps])
+        size = lambda ps: sum([len(p) for p in ps])
+        self.assertLessEqual(abs(size(stripes[self.e1]) - size(stripes[self.e2])), max([len(p) for p in packets]))
+
+    def test_stripe_by_capacity(self):
+        self.endpoint._channel_index.update("a" * 20, {"channels" : [channel(self.e1, 300.0), channel(self.e2, 100.0)]})
+        stripes = self.stripes([packet("data", i) for i in range(8)])
+        self.assertEqual(len(stripes[self.e1]), 6)
+        self.assertEqual(len(stripes[self.e2]), 2)
+
+    def test_stripe_around_send_queue(self):
+        self.endpoint._channel_index.update("a" * 20, {"channels" : [channel(self.e1, 100.0), 
+                                                                     channel(self.e2, 100.0, send_queue=1000)]})
+        stripes = self.stripes([packet("data", i) for i in range(8)]) # Less than the queue of e2
+        self.assertEqual(stripes.keys(), [self.e1])
+
+    def test_no_stripes(self):
+        self.endpoint._channel_index.update("a" * 20, {"channels" : [channel(self.e1, 100.0), channel(self.e2, 0.0)]})
+        self.assertEqual(self.endpoint._stripe_packets(candidate(), [packet("data", i) for i in range(8)]), [])
+        self.e2.usable = False
+        self.endpoint._channel_index.update("a" * 20, {"channels" : [channel(self.e1, 100.0), channel(self.e2, 100.0)]})
+        self.assertEqual(self.endpoint._stripe_packets(candidate(), [packet("data", i) for i in range(8)]), [])
+
+    def test_subnet_endpoints(self):
+        contact = DispersyContact(Address(ip="1.1.1.9", port=5))
+        self.assertEqual([e for e, _ in self.endpoint._subnet_endpoints(contact)], [self.e1, self.e3])
+        subnets = self.endpoint._subnet_cache[1]
+        self.assertEqual([e for e, _ in self.endpoint._subnet_endpoints(contact, [self.e3])], [self.e3])
+        self.assertIs(self.endpoint._subnet_cache[1], subnets) # Not built again
+        self.e2.address = address("1.1.1.2", 2)
+        self.assertEqual([e for e, _ in self.endpoint._subnet_endpoints(contact)], [self.e1, self.e2, self.e3])
+        self.endpoint.swift_endpoints = [self.e2, self.e3]
+        self.assertEqual([e for e, _ in self.endpoint._subnet_endpoints(contact)], [self.e2, self.e3])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+'''
+Created on Mar 7, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.tools.networks import InterfaceTable, ip_to_int, AF_INET, AF_INET6
+
+class TestInterfaceTable(unittest.TestCase):
+
+    def setUp(self):
+        self.table = InterfaceTable()
+
+    def test_ip_to_int(self):
+        self.assertEqual(ip_to_int("10.0.0.1"), 10 * 2**24 + 1)
+        self.assertEqual(ip_to_int("::1", AF_INET6), 1)
+
+    def test_subnet_interface(self):
+        interface = self.table.subnet_interface("127.0.0.5")
+        self.assertEqual(interface.name, "lo")
+        self.assertIsNone(self.table.subnet_interface("0.0.0.1"))
+        self.assertTrue(self.table.exists("lo", "127.0.0.1"))
+        
+    def test_copies(self):
+        interfaces = self.table.interfaces(AF_INET)
+        self.assertTrue(len(interfaces) > 0)
+        interfaces[0].device = "changed"
+        self.assertNotEqual(self.table.interfaces(AF_INET)[0].device, "changed")
+        self.table.invalidate()
+        self.assertEqual(len(self.table.interfaces(AF_INET)), len(interfaces))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+'''
+Created on Mar 6, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.dispersy_extends.packet_classifier import PacketClassifier, UNKNOWN_NAME
+
+class Meta(object):
+    
+    def __init__(self, name):
+        self.name = name
+        
+class Decode(object):
+    
+    def __init__(self, name):
+        self.meta = Meta(name)
+
+class Conversion(object):
+    
+    def __init__(self, prefix, names):
+        self.prefix = prefix
+        self._decode_message_map = dict([(chr(i), Decode(n)) for i, n in names.iteritems()])
+        
+class Community(object):
+    
+    def __init__(self, cid, conversions):
+        self.cid = cid
+        self._conversions = conversions
+
+class TestPacketClassifier(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.cid = "c" * 20
+        self.classifier = PacketClassifier(self.convert)
+        
+    def convert(self, packet):
+        self.calls.append(packet)
+        if packet[2:22] != self.cid:
+            raise KeyError(packet[2:22])
+        return Meta("converted")
+
+    def test_community(self):
+        prefix = "\x00\x01" + self.cid
+        self.classifier.add_community(Community(self.cid, [Conversion(prefix, {12 : "small", 14 : "addresses"})]))
+        self.assertEqual(len(self.classifier), 2)
+        self.assertEqual(self.classifier.name(prefix + chr(12) + "payload"), "small")
+        self.assertEqual(self.classifier.name(prefix + chr(14)), "addresses")
+        self.assertEqual(self.calls, [])
+        self.classifier.remove_community(self.cid)
+        self.assertEqual(len(self.classifier), 0)
+        
+    def test_lazy(self):
+        packet = "\x00\x01" + self.cid + chr(13) + "payload"
+        self.assertEqual(self.classifier.name(packet), "converted")
+        self.assertEqual(self.classifier.name(packet[:23] + "other payload"), "converted")
+        self.assertEqual(len(self.calls), 1)
+        
+    def test_unknown(self):
+        packet = "\x00\x01" + "d" * 20 + chr(13)
+        self.assertEqual(self.classifier.name(packet), UNKNOWN_NAME)
+        self.assertEqual(self.classifier.name(packet), UNKNOWN_NAME)
+        self.assertEqual(len(self.calls), 2) # Not cached
+        
+if __name__ == "__main__":
+    unittest.main()
@@ -7,13 +7,14 @@ import unittest
 from threading import Event
 
 from src.tools.periodic_task import Looper, PeriodicTask
+from src.tools.reactor import Reactor
 
 class TestPeriodicTask(unittest.TestCase):
 
 
     def test_max_iterations(self):
         sleep = 0.01
-        looper = Looper(sleep)
+        looper = Looper()
         
         def test():
             pass
@@ -29,7 +30,7 @@ class TestPeriodicTask(unittest.TestCase):
         
     def test_call(self):
         sleep = 0.01
-        looper = Looper(sleep)
+        looper = Looper()
         
         self.counter = 0
         def test():
@@ -45,7 +46,7 @@ class TestPeriodicTask(unittest.TestCase):
         
     def test_args(self):
         sleep = 0.01
-        looper = Looper(sleep)
+        looper = Looper()
         
         self.counter = 0
         def test(multi=1):
@@ -60,5 +61,77 @@ class TestPeriodicTask(unittest.TestCase):
         
         self.assertEqual(self.counter % m, 0)
 
+    def test_stop_and_order(self):
+        sleep = 0.01
+        looper = Looper() # Sleeps until the first task is due
+        
+        calls = []
+        stopped = PeriodicTask(calls.append, sleep, delay=sleep, args=("stopped",))
+        looper.add_task(PeriodicTask(calls.append, 1.0, delay=2 * sleep, args=("second",)))
+        looper.add_task(PeriodicTask(calls.append, 1.0, delay=sleep, args=("first",)))
+        looper.add_task(stopped)
+        stopped.stop()
+        looper.start()
+        
+        event = Event()
+        event.wait(5 * sleep)
+        looper.stop()
+        
+        self.assertEqual(calls, ["first", "second"])
+        self.assertEqual(len(looper.tasks), 2)
+        
+    def test_reactor(self):
+        sleep = 0.01
+        reactor = Reactor()
+        reactor.start()
+        looper = Looper(reactor=reactor)
+        
+        self.counter = 0
+        def test():
+            self.counter += 1
+        
+        looper.add_task(PeriodicTask(test, sleep, max_iterations=2))
+        looper.start()
+        
+        event = Event()
+        event.wait(5 * sleep)
+        looper.stop()
+        reactor.stop()
+        
+        self.assertEqual(self.counter, 2)
+        self.assertEqual(len(looper.tasks), 0)
+
+    def test_task_added_later(self):
+        sleep = 0.01
+        looper = Looper()
+        self.assertEqual(looper._timeout(), None) # Nothing to wait for
+        looper.start()
+        
+        calls = []
+        event = Event()
+        event.wait(2 * sleep)
+        looper.add_task(PeriodicTask(calls.append, 10.0, args=("added",)))
+        event.wait(2 * sleep)
+        self.assertEqual(calls, ["added"])
+        self.assertGreater(looper._timeout(), 1.0) # Waits for the next call, without waking up before
+        looper.stop()
+        
+    def test_reactor_task_added_later(self):
+        sleep = 0.01
+        reactor = Reactor()
+        reactor.start()
+        looper = Looper(reactor=reactor)
+        looper.start()
+        self.assertEqual(looper._timer, None) # No timer while there are no tasks
+        
+        calls = []
+        looper.add_task(PeriodicTask(calls.append, sleep, max_iterations=2, args=("added",)))
+        event = Event()
+        event.wait(5 * sleep)
+        self.assertEqual(calls, ["added", "added"])
+        self.assertEqual(looper._timer, None)
+        looper.stop()
+        reactor.stop()
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
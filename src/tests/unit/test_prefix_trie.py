@@ -0,0 +1,48 @@
+'''
+Created on Mar 7, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.tools.prefix_trie import PrefixTrie
+from src.tools.networks import ip_to_int, AF_INET6
+
+class TestPrefixTrie(unittest.TestCase):
+
+    def setUp(self):
+        self.trie = PrefixTrie()
+        self.trie.insert(ip_to_int("10.0.0.0"), 8, "10/8")
+        self.trie.insert(ip_to_int("10.1.0.0"), 16, "10.1/16")
+        self.trie.insert(ip_to_int("192.168.1.0"), 24, "192.168.1/24")
+
+    def test_longest_match(self):
+        self.assertEqual(len(self.trie), 3)
+        self.assertEqual(self.trie.longest_match(ip_to_int("10.1.2.3")), "10.1/16")
+        self.assertEqual(self.trie.longest_match(ip_to_int("10.2.2.3")), "10/8")
+        self.assertEqual(self.trie.longest_match(ip_to_int("192.168.1.255")), "192.168.1/24")
+        self.assertIsNone(self.trie.longest_match(ip_to_int("192.168.2.1")))
+        self.assertSequenceEqual(self.trie.matches(ip_to_int("10.1.2.3")), ["10/8", "10.1/16"])
+        self.assertIn(ip_to_int("10.255.0.1"), self.trie)
+        self.assertNotIn(ip_to_int("11.0.0.1"), self.trie)
+        
+    def test_get(self):
+        self.assertEqual(self.trie.get(ip_to_int("10.1.0.0"), 16), "10.1/16")
+        self.assertIsNone(self.trie.get(ip_to_int("10.1.0.0"), 12))
+        self.trie.insert(ip_to_int("10.1.0.0"), 16, "replaced")
+        self.assertEqual(len(self.trie), 3)
+        self.assertEqual(self.trie.get(ip_to_int("10.1.0.0"), 16), "replaced")
+        
+    def test_default_route(self):
+        self.trie.insert(0, 0, "default")
+        self.assertEqual(self.trie.longest_match(ip_to_int("8.8.8.8")), "default")
+        self.assertEqual(PrefixTrie.prefix_length(ip_to_int("255.255.240.0")), 20)
+        
+    def test_ipv6(self):
+        trie = PrefixTrie(128)
+        trie.insert(ip_to_int("fe80::", AF_INET6), 64, "link local")
+        self.assertEqual(trie.longest_match(ip_to_int("fe80::1", AF_INET6)), "link local")
+        self.assertIsNone(trie.longest_match(ip_to_int("2001::1", AF_INET6)))
+
+if __name__ == "__main__":
+    unittest.main()
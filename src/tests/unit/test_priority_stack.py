@@ -69,5 +69,41 @@ class TestPriorityStack(unittest.TestCase):
         for i in stack:
             self.assertIsInstance(i, str)
 
+    def test_fifo_among_equal(self):
+        stack = PriorityStack()
+        for i in range(5):
+            stack.put(1, i)
+        stack.put(2, "first")
+        self.assertEqual([stack.pop() for _ in range(6)], ["first", 0, 1, 2, 3, 4])
+        
+    def test_key(self):
+        stack = PriorityStack()
+        self.assertTrue(stack.put(1, "a", key="a", size=10))
+        self.assertFalse(stack.put(2, "a again", key="a", size=10))
+        self.assertTrue(stack.put(1, "b", key="b", size=5))
+        self.assertIn("a", stack)
+        self.assertEqual(stack.total_size(), 15)
+        self.assertEqual(stack.remove("a"), "a")
+        self.assertIsNone(stack.remove("a"))
+        self.assertNotIn("a", stack)
+        self.assertEqual(len(stack), 1)
+        self.assertEqual(stack.total_size(), 5)
+        self.assertEqual(stack.peek(), "b")
+        self.assertEqual(stack.pop(), "b")
+        self.assertEqual(stack.total_size(), 0)
+        self.assertTrue(stack.put(1, "a", key="a")) # Can be put again once it is off the stack
+
+    def test_rekey(self):
+        stack = PriorityStack()
+        for i in range(5):
+            stack.put((0, i), i, key=i, size=1)
+        stack.remove(4)
+        stack.rekey(lambda item: (0, -item, 0)) # Keys of another shape
+        self.assertEqual(list(stack), [0, 1, 2, 3])
+        stack.put((0, -5, 0), 5)
+        stack.put((1, 0, 0), "first")
+        self.assertEqual(stack.total_size(), 4)
+        self.assertEqual([stack.pop() for _ in range(7)], ["first", 0, 1, 2, 3, 5, None])
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,63 @@
+'''
+Created on Mar 10, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+import os
+from threading import Event
+
+from src.tools.reactor import Reactor
+from src.tools.clock import monotonic
+
+class TestReactor(unittest.TestCase):
+
+    def setUp(self):
+        self.reactor = Reactor()
+        self.reactor.start()
+        
+    def tearDown(self):
+        self.reactor.stop()
+        self.reactor.join(1)
+
+    def test_call_later(self):
+        done = Event()
+        calls = []
+        self.reactor.call_later(0.02, calls.append, 2)
+        self.reactor.call_later(0.01, calls.append, 1)
+        self.reactor.call_later(0.03, done.set)
+        self.reactor.call_later(0.01, calls.append, 3).cancel()
+        done.wait(1)
+        self.assertEqual(calls, [1, 2])
+        
+    def test_call_periodic(self):
+        done = Event()
+        calls = []
+        def call():
+            calls.append(monotonic())
+            if len(calls) == 3:
+                timer.cancel()
+                done.set()
+        timer = self.reactor.call_periodic(0.01, call, delay=0)
+        done.wait(1)
+        self.assertEqual(len(calls), 3)
+        self.assertLessEqual(calls[0], calls[1])
+        
+    def test_reader(self):
+        read, write = os.pipe()
+        done = Event()
+        data = []
+        def readable(fd):
+            data.append(os.read(fd, 100))
+            if data[-1] == "":
+                self.reactor.remove_reader(fd)
+                done.set()
+        self.reactor.add_reader(read, readable)
+        os.write(write, "swift")
+        os.close(write)
+        done.wait(1)
+        self.assertEqual("".join(data), "swift")
+        os.close(read)
+
+if __name__ == "__main__":
+    unittest.main()
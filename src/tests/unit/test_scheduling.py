@@ -0,0 +1,53 @@
+'''
+Created on Mar 15, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.tools.priority_stack import PriorityStack
+from src.swift.scheduling import SchedulingPolicy, ShortestFirstPolicy, EarliestDeadlinePolicy, WeightedFairPolicy, \
+    get_policy
+
+class TestScheduling(unittest.TestCase):
+
+    def fill(self, policy, files):
+        """
+        @param files: List of (name, priority, size, timestamp, directory)
+        @return: The names in the order they are popped
+        """
+        stack = PriorityStack()
+        for name, priority, size, timestamp, directory in files:
+            stack.put(policy.key(priority, size, timestamp, directory), name, key=name)
+        order = []
+        while len(stack):
+            policy.popped(stack.peek_priority())
+            order.append(stack.pop())
+        return order
+
+    def test_default(self):
+        files = [("a", 0, 10, 1.0, "/d"), ("b", 0, 10, 2.0, "/d"), ("c", 1, 10, 0.0, "/d")]
+        self.assertEqual(self.fill(SchedulingPolicy(), files), ["c", "b", "a"])
+        self.assertTrue(isinstance(get_policy("timestamp"), SchedulingPolicy))
+        
+    def test_shortest_first(self):
+        files = [("video", 0, 10**9, 1.0, "/v"), ("s1", 0, 100, 2.0, "/s"), ("s2", 0, 50, 3.0, "/s"), 
+                 ("s3", 0, 100, 1.5, "/s"), ("urgent", 1, 10**10, 4.0, "/v")]
+        self.assertEqual(self.fill(ShortestFirstPolicy(), files), ["urgent", "s2", "s3", "s1", "video"])
+        
+    def test_earliest_deadline(self):
+        policy = EarliestDeadlinePolicy(slas={"/sensor" : 5.0}, default=60.0)
+        files = [("video", 0, 10**9, 0.0, "/video"), ("sensor", 0, 100, 10.0, "/sensor/a"), 
+                 ("late", 0, 100, 100.0, "/sensor")]
+        self.assertEqual(self.fill(policy, files), ["sensor", "video", "late"])
+        
+    def test_weighted_fair(self):
+        policy = WeightedFairPolicy(weights={"/a" : 2.0})
+        files = [("a1", 0, 100, 0.0, "/a"), ("a2", 0, 100, 0.0, "/a"), ("a3", 0, 100, 0.0, "/a"), 
+                 ("a4", 0, 100, 0.0, "/a"), ("b1", 0, 100, 0.0, "/b"), ("b2", 0, 100, 0.0, "/b")]
+        self.assertEqual(self.fill(policy, files), ["a1", "b1", "a2", "a3", "b2", "a4"])
+        # A directory that has been idle starts at the current virtual time
+        self.assertEqual(self.fill(policy, [("c1", 0, 100, 0.0, "/c"), ("b3", 0, 100, 0.0, "/b")]), ["c1", "b3"])
+
+if __name__ == "__main__":
+    unittest.main()
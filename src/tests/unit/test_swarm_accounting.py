@@ -0,0 +1,99 @@
+'''
+Created on Mar 13, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+
+from src.swift.swarm_accounting import SwarmAccounting, DOWNLOADING, SEEDING
+
+class FakeDef(object):
+    
+    def get_roothash_as_hex(self):
+        return "00" * 20
+
+class FakeDownload(object):
+    
+    def __init__(self, status, speed=0.0, dynasize=0, progress=0.0, peer=True):
+        self.status = status
+        self.down = speed
+        self.dynasize = dynasize
+        self.progress = progress
+        self.peer = peer
+        
+    def downloading(self):
+        return self.status == DOWNLOADING
+    
+    def seeding(self):
+        return self.status == SEEDING
+    
+    def initialized(self):
+        return False
+    
+    def speed(self, direction):
+        return self.down
+    
+    def has_peer(self):
+        return self.peer
+    
+    def get_def(self):
+        return FakeDef()
+
+class TestSwarmAccounting(unittest.TestCase):
+
+    def setUp(self):
+        self.swarms = SwarmAccounting()
+
+    def test_update(self):
+        d = FakeDownload(DOWNLOADING)
+        self.assertTrue(self.swarms.update("a", d))
+        self.assertFalse(self.swarms.update("a", d))
+        self.swarms.update("b", FakeDownload(SEEDING))
+        self.swarms.update("c", FakeDownload(None))
+        self.assertEqual(self.swarms.downloading, 1)
+        self.assertEqual(self.swarms.seeding, 1)
+        self.assertEqual(len(self.swarms), 2) # Swarms that are neither are not counted
+        d.status = SEEDING
+        self.assertTrue(self.swarms.update("a", d))
+        self.assertEqual(self.swarms.downloading, 0)
+        self.assertEqual(self.swarms.seeding, 2)
+        self.assertEqual(self.swarms.state("a"), (SEEDING, False))
+        self.assertEqual(self.swarms.state("c"), (None, False))
+        
+    def test_almost_done(self):
+        d = FakeDownload(DOWNLOADING, speed=100.0, dynasize=1024 * 1024, progress=0.99)
+        self.swarms.update("a", d)
+        self.assertEqual(self.swarms.almost_done, 1)
+        d.progress = 0.0
+        self.swarms.update("a", d)
+        self.assertEqual(self.swarms.almost_done, 0)
+        self.assertEqual(self.swarms.downloading, 1)
+        d.progress = 0.99
+        self.swarms.update("a", d)
+        self.assertTrue(self.swarms.remove("a"))
+        self.assertFalse(self.swarms.remove("a"))
+        self.assertEqual(self.swarms.almost_done, 0)
+        self.assertEqual(self.swarms.downloading, 0)
+        
+    def test_smoothed_speed(self):
+        swarms = SwarmAccounting(alpha=0.5)
+        d = FakeDownload(DOWNLOADING, speed=100.0, dynasize=1024 * 1024, progress=0.99)
+        swarms.update("a", d)
+        d.down = 0.0 # A single INFO without speed
+        swarms.update("a", d)
+        self.assertEqual(swarms.almost_done, 1)
+        self.assertEqual(len(swarms.swarms(DOWNLOADING)), 1)
+        
+    def test_peerless(self):
+        d = FakeDownload(DOWNLOADING, peer=False)
+        self.swarms.update("a", d)
+        self.swarms.update("b", FakeDownload(DOWNLOADING))
+        self.swarms.update("c", FakeDownload(SEEDING, peer=False))
+        self.assertEqual(self.swarms.peerless(DOWNLOADING), [d])
+        self.assertEqual(len(self.swarms.peerless(SEEDING)), 1)
+        self.swarms.clear()
+        self.assertEqual(self.swarms.peerless(DOWNLOADING), [])
+        self.assertFalse("a" in self.swarms)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+'''
+Created on Mar 14, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+import random
+
+from src.swift.swarm_concurrency import SwarmConcurrency
+
+class TestSwarmConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.concurrency = SwarmConcurrency(4, minimum=1, maximum=6, alpha=0.5, gain=0.1, probe_ticks=1)
+
+    def test_increase_while_goodput_rises(self):
+        self.assertEqual(self.concurrency.update(4, 400.0), 4) # First sample
+        self.assertEqual(self.concurrency.update(3, 400.0), 4) # Not all swarms in use
+        self.assertEqual(self.concurrency.update(4, 400.0), 5) # Probe
+        self.assertEqual(self.concurrency.update(5, 600.0), 6) # Goodput rose, probe again
+        self.assertEqual(self.concurrency.update(6, 1000.0), 6) # Maximum
+        
+    def test_back_off_when_goodput_flat(self):
+        self.concurrency.update(4, 400.0)
+        self.assertEqual(self.concurrency.update(4, 400.0), 5) # Probe
+        self.assertEqual(self.concurrency.update(5, 420.0), 4) # Not a clear gain, undo
+        self.assertEqual(self.concurrency.update(4, 430.0), 4) # Still within the margin of 400
+        self.assertEqual(self.concurrency.update(0, 0.0), 4) # Nothing running
+        self.assertEqual(self.concurrency.update(4, 600.0), 5) # Clearly above the goodput before the probe
+        
+    def test_wait_for_probe(self):
+        concurrency = SwarmConcurrency(4, minimum=1, maximum=10, alpha=1.0, gain=0.1, probe_ticks=3)
+        concurrency.update(4, 400.0)
+        self.assertEqual(concurrency.update(4, 400.0), 5)
+        self.assertEqual(concurrency.update(5, 400.0), 5)
+        self.assertEqual(concurrency.update(5, 400.0), 5)
+        self.assertEqual(concurrency.update(5, 400.0), 4)
+        
+    def test_saturated_link(self):
+        random.seed(0)
+        concurrency = SwarmConcurrency(5)
+        for _ in range(300):
+            active = concurrency.allowed # The stack is never empty
+            concurrency.update(active, 1000.0 * random.uniform(0.95, 1.05))
+            self.assertLessEqual(concurrency.allowed, 6)
+        self.assertEqual(concurrency.allowed, 5)
+        
+    def test_link_with_room(self):
+        random.seed(0)
+        concurrency = SwarmConcurrency(5)
+        for _ in range(300):
+            active = concurrency.allowed
+            concurrency.update(active, min(active, 8) * 100.0 * random.uniform(0.95, 1.05))
+        self.assertIn(concurrency.allowed, [8, 9])
+        
+    def test_decrease_on_collapse(self):
+        self.concurrency.update(4, 400.0)
+        self.assertEqual(self.concurrency.update(4, 100.0), 2)
+        self.assertEqual(self.concurrency.update(1, 25.0), 2) # Same throughput per swarm
+        self.assertEqual(self.concurrency.update(2, 10.0), 1)
+        self.assertEqual(self.concurrency.update(1, 1.0), 1) # Minimum
+        
+    def test_decrease_on_send_queue(self):
+        self.concurrency.update(4, 400.0, send_queue=10)
+        self.assertEqual(self.concurrency.update(3, 400.0, send_queue=15), 4)
+        self.assertEqual(self.concurrency.update(3, 400.0, send_queue=100), 2)
+
+if __name__ == "__main__":
+    unittest.main()
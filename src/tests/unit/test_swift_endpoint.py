@@ -0,0 +1,160 @@
+'''
+Created on Mar 19, 2014
+
+@author: Vincent Ketelaars
+'''
+import sys
+import unittest
+from threading import Event, RLock, Thread, current_thread
+
+from src.swift.swift_process import MySwiftProcess # Before other import because of logger
+from dispersy.candidate import WalkCandidate
+
+from src.address import Address
+from src.definitions import ENDPOINT_SEND_QUEUE_SIZE
+from src.dispersy_extends.endpoint import SwiftEndpoint
+from src.tests.unit.mock_classes import FakeSwift
+
+TIMEOUT = 5.0
+
+class TunnelSwift(FakeSwift):
+
+    def __init__(self, addresses):
+        FakeSwift.__init__(self, addresses)
+        self.splock = RLock()
+        self.sent = []
+        self.sent_event = Event()
+        self.blocked = Event()
+        self.blocked.set()
+
+    def is_ready(self):
+        return True
+
+    def send_tunnels(self, session, address, packets, addr=Address()):
+        self.blocked.wait(TIMEOUT)
+        self.sent.append((current_thread().name, address, list(packets)))
+        self.sent_event.set()
+
+class FakeStatistics(object):
+
+    def __init__(self):
+        self.endpoint_send = {}
+
+    def dict_inc(self, dictionary, key):
+        dictionary[key] = dictionary.get(key, 0) + 1
+
+class FakeCommunity(object):
+
+    def __init__(self, cid):
+        self.cid = cid
+
+class FakeDispersy(object):
+
+    def __init__(self):
+        self.statistics = FakeStatistics()
+        self._bootstrap_candidates = {}
+
+    def get_community(self, cid, load=False, auto_load=False):
+        return FakeCommunity(cid)
+
+    def is_valid_address(self, address):
+        return True
+
+    def convert_packet_to_meta_message(self, data, load=False, auto_load=False):
+        raise KeyError(data) # Not a Dispersy message
+
+def candidate(i):
+    return WalkCandidate(("8.8.8.8", i), True, ("8.8.8.8", i), ("8.8.8.8", i), u"unknown")
+
+class TestSwiftEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.address = Address(ip="127.0.0.1", port=12345)
+        self.swift = TunnelSwift([self.address])
+        self.endpoint = SwiftEndpoint(self.swift, self.address)
+        self.endpoint._session = "session"
+        self.endpoint.update_dispersy_contacts = lambda sock_addr, packets, recv=True: None
+
+    def tearDown(self):
+        self.swift.blocked.set()
+        thread = self.endpoint._send_thread
+        self.endpoint.close()
+        if thread is not None:
+            thread.join(TIMEOUT)
+
+    def wait_for(self, count):
+        while len(self.swift.sent) < count and self.swift.sent_event.wait(TIMEOUT):
+            self.swift.sent_event.clear()
+        self.assertEqual(len(self.swift.sent), count)
+
+    def test_send_before_open(self):
+        self.endpoint._dispersy = FakeDispersy()
+        self.assertTrue(self.endpoint.enqueue_send(candidate(1), ["a"]))
+        self.assertEqual(self.swift.sent, [(current_thread().name, ("8.8.8.8", 1), ["a"])]) # Sent directly
+
+    def test_drain_in_order(self):
+        self.endpoint.open(FakeDispersy())
+        for i in range(10):
+            self.assertTrue(self.endpoint.enqueue_send(candidate(i), [str(i)]))
+        self.wait_for(10)
+        self.assertEqual([address[1] for _, address, _ in self.swift.sent], range(10))
+        self.assertTrue(all([name.startswith("SwiftEndpoint_send_") for name, _, _ in self.swift.sent]))
+
+    def test_send_without_splock(self):
+        self.endpoint.open(FakeDispersy())
+        with self.swift.splock: # Another thread talks to swift, which should not hold up this endpoint
+            self.endpoint.enqueue_send(candidate(1), ["a"])
+            self.wait_for(1)
+
+    def test_full_queue(self):
+        self.endpoint.open(FakeDispersy())
+        self.swift.blocked.clear()
+        self.endpoint.enqueue_send(candidate(0), ["0"]) # Taken by the send thread, which blocks on it
+        while not self.endpoint._send_queue.empty():
+            self.swift.sent_event.wait(0.01)
+        for i in range(ENDPOINT_SEND_QUEUE_SIZE):
+            self.assertTrue(self.endpoint.enqueue_send(candidate(i), [str(i)]))
+        self.assertFalse(self.endpoint.enqueue_send(candidate(0), ["dropped"]))
+        self.swift.blocked.set()
+        self.wait_for(ENDPOINT_SEND_QUEUE_SIZE + 1)
+
+    def test_reopen(self):
+        self.endpoint.open(FakeDispersy())
+        thread = self.endpoint._send_thread
+        self.endpoint.close()
+        thread.join(TIMEOUT)
+        self.endpoint._swift = self.swift # As restart_swift would
+        self.endpoint.open(FakeDispersy())
+        self.assertTrue(self.endpoint.enqueue_send(candidate(1), ["a"]))
+        self.wait_for(1)
+
+class TestContacts(unittest.TestCase):
+
+    def setUp(self):
+        self.address = Address(ip="127.0.0.1", port=12345)
+        self.endpoint = SwiftEndpoint(TunnelSwift([self.address]), self.address)
+        self.endpoint._dispersy = FakeDispersy()
+        self.interval = sys.getcheckinterval()
+        sys.setcheckinterval(1) # Switch threads as often as possible
+
+    def tearDown(self):
+        sys.setcheckinterval(self.interval)
+
+    def test_concurrent_updates(self):
+        packet = "\x00\x01" + "c" * 20 + "data"
+        go = Event()
+        def update(recv):
+            go.wait(TIMEOUT)
+            for i in range(500): # Each thread finds and adds the same new addresses
+                self.endpoint.update_dispersy_contacts(("8.8.8.8", i), [packet], recv=recv)
+        threads = [Thread(target=update, args=(i % 2 == 0,)) for i in range(4)] # Send threads and the receiving thread
+        [t.start() for t in threads]
+        go.set()
+        [t.join(TIMEOUT) for t in threads]
+        contacts = list(self.endpoint.dispersy_contacts)
+        self.assertEqual(len(contacts), 500) # One contact per address
+        self.assertEqual(sum([dc.num_sent() for dc in contacts]), 1000)
+        self.assertEqual(sum([dc.num_rcvd() for dc in contacts]), 1000)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,186 @@
+'''
+Created on Mar 19, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+from datetime import datetime
+
+from src.swift.swift_process import MySwiftProcess # Before other import because of logger
+
+from src.dispersy_extends.endpoint import SwiftHandler
+from src.tests.unit.mock_classes import FakeSwift
+
+class FakeDef(object):
+
+    def __init__(self, roothash):
+        self.roothash = roothash
+
+    def get_roothash(self):
+        return self.roothash
+
+    def get_roothash_as_hex(self):
+        return self.roothash.encode("hex")
+
+class FakeDownload(object):
+
+    def __init__(self, roothash):
+        self.definition = FakeDef(roothash)
+        self.bad_swarm = False
+        self.status = None
+        self.down_speed = 0.0
+        self.dynasize = 1024
+        self.progress = 0.5
+        self.on_stack = False
+
+    def get_def(self):
+        return self.definition
+
+    def downloading(self):
+        return self.status == "downloading"
+
+    def seeding(self):
+        return self.status == "seeding"
+
+    def initialized(self):
+        return False
+
+    def speed(self, direction):
+        return self.down_speed
+
+    def has_peer(self):
+        return True
+
+    def stacked(self):
+        self.on_stack = True
+
+    def checkpointing(self):
+        pass
+
+class RecordingSwift(FakeSwift):
+
+    def __init__(self):
+        FakeSwift.__init__(self, [])
+        self.removed = []
+
+    def is_ready(self):
+        return True
+
+    def start_download(self, d):
+        self.roothash2dl[d.get_def().get_roothash()] = d
+        if d.status is None:
+            d.status = "seeding" if d.upload else "downloading"
+
+    def remove_download(self, d, rm_state, rm_content):
+        del self.roothash2dl[d.get_def().get_roothash()]
+        d.status = None
+        self.removed.append((d.get_def().get_roothash(), rm_state, rm_content))
+
+    def checkpoint_download(self, d):
+        pass
+
+class TestPreemptSwarm(unittest.TestCase):
+
+    def setUp(self):
+        self.swift = RecordingSwift()
+        self.handler = SwiftHandler(self.swift)
+        self.handler._socket_running = (0, datetime.utcnow())
+        self.handler._download_concurrency.limit = 2
+        self.handler._seeding_concurrency.limit = 2
+        self.downloads = {}
+
+    def put(self, name, priority, upload=True):
+        d = self.downloads.setdefault(name, FakeDownload(name))
+        d.upload = upload
+        put = self.handler.put_swift_upload_stack if upload else self.handler.put_swift_download_stack
+        put(lambda: self.handler.swift_start(d, "cid"), 1, float(len(self.downloads)), priority=priority, key=name)
+        self.handler.evaluate_swift_swarms() # As the next tick of the loop would
+        return d
+
+    def running(self):
+        return sorted(self.swift.roothash2dl.keys())
+
+    def stacked(self, upload=True):
+        stack = self.handler._swift_upload_stack if upload else self.handler._swift_download_stack
+        return [(item[5], item[6]) for item in stack]
+
+    def test_no_preemption_with_free_slots(self):
+        self.put("low", 0)
+        self.put("urgent", 5)
+        self.assertEqual(self.running(), ["low", "urgent"])
+        self.assertEqual(self.swift.removed, [])
+
+    def test_lowest_priority_newest_first(self):
+        self.handler._seeding_concurrency.limit = 3
+        self.put("one", 1)
+        self.put("old", 0)
+        self.put("new", 0)
+        self.put("urgent", 5)
+        self.assertEqual(self.running(), ["old", "one", "urgent"])
+        self.assertEqual(self.swift.removed, [("new", False, False)]) # Keeps state and content
+        self.assertEqual(self.stacked(), [("new", 0)]) # With its original key and priority
+        self.assertTrue(self.downloads["new"].on_stack)
+
+    def test_no_preemption_for_equal_priority(self):
+        self.put("a", 1)
+        self.put("b", 1)
+        self.put("c", 1)
+        self.assertEqual(self.running(), ["a", "b"])
+        self.assertEqual(self.stacked(), [("c", 1)])
+
+    def test_skip_almost_done(self):
+        self.put("old", 0, upload=False)
+        self.put("new", 0, upload=False)
+        new = self.downloads["new"]
+        new.down_speed = 1000.0 # Done within ALMOST_DONE_DOWNLOADING_TIME
+        self.handler.info_callback("new", new)
+        self.handler._download_concurrency.limit = 1
+        self.put("urgent", 5, upload=False)
+        self.assertEqual(self.running(), ["new", "urgent"])
+        self.assertEqual(self.stacked(upload=False), [("old", 0)])
+
+    def test_only_same_stack(self):
+        self.handler._seeding_concurrency.limit = 1
+        finished = self.put("finished", 0, upload=False)
+        finished.status = "seeding" # The download finished and is now seeding
+        self.handler.info_callback("finished", finished)
+        self.put("urgent", 5)
+        self.assertEqual(self.running(), ["finished"])
+        self.assertEqual(self.stacked(upload=False), [])
+        self.assertEqual(self.stacked(), [("urgent", 5)])
+
+class TestSchedulingPolicy(unittest.TestCase):
+
+    def setUp(self):
+        self.swift = RecordingSwift()
+        self.handler = SwiftHandler(self.swift)
+
+    def put(self, name, size, timestamp):
+        d = FakeDownload(name)
+        d.upload = True
+        self.handler.put_swift_upload_stack(lambda: self.handler.swift_start(d, "cid"), size, timestamp, key=name)
+
+    def stacked(self):
+        return [item[5] for item in self.handler._swift_upload_stack]
+
+    def running(self):
+        return sorted(self.swift.roothash2dl.keys())
+
+    def test_switch_with_items_queued(self):
+        self.put("old", 10, 1.0)
+        self.put("new", 1000, 2.0)
+        self.assertEqual(self.stacked(), ["new", "old"]) # Newest first
+        self.handler.set_scheduling_policy("wfq")
+        self.assertEqual(self.stacked(), ["old", "new"]) # Queued in the order they were put
+        self.put("small", 1, 3.0)
+        for _ in range(3):
+            self.handler.pop_swift_upload_stack()
+        self.assertEqual(self.running(), ["new", "old", "small"])
+        self.assertEqual(len(self.handler._swift_upload_stack), 0)
+        self.handler.set_scheduling_policy("srsf")
+        self.put("large", 1000, 4.0)
+        self.put("medium", 100, 5.0)
+        self.assertEqual(self.stacked(), ["medium", "large"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+'''
+Created on Mar 20, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+import json
+from threading import Event, RLock
+
+from src.swift.swift_process import MySwiftProcess # Before other import because of logger
+from src.swift.tribler.SwiftProcess import DONE_STATE_WORKING
+
+from src.definitions import SWIFT_ERROR_TCP_FAILED
+from src.swift import cmdgw_records
+
+from src.tests.unit.mock_classes import FakeSwift
+
+ROOTHASH = "a" * 20
+
+class FakeDownload(object):
+
+    def __init__(self):
+        self.moreinfo = []
+        self._channel_closed_callback = None
+
+    def i2ithread_moreinfo_callback(self, midict):
+        self.moreinfo.append(midict) # Does not read it
+
+class ReadlineSwift(FakeSwift):
+
+    def __init__(self):
+        FakeSwift.__init__(self, [])
+        self.splock = RLock()
+        self.donestate = DONE_STATE_WORKING
+        self.cmdgw_binary = False
+        self._negotiated = Event()
+        self._negotiated.set()
+        self._negotiating = False
+        self.cmdport = None
+        self.lost = []
+        self.written = []
+        self.reply = None # Swift's answer to what is written
+        self._moreinfo = {}
+        self._moreinfo_callback = None
+        self._channel_closed_callback = None
+        self.download = FakeDownload()
+        self.roothash2dl[ROOTHASH] = self.download
+
+    def _write(self, data):
+        self.written.append(data)
+        if self.reply is not None:
+            self.i2ithread_readlinecallback(self.fastconn, self.reply)
+
+    def connection_lost(self, port, error_code=-1, output_read=False):
+        self.lost.append(error_code)
+
+    def moreinfo(self, report):
+        self.i2ithread_readlinecallback(None, "MOREINFO " + ROOTHASH.encode("hex") + " " + json.dumps(report))
+
+class FakeConnection(object):
+
+    def __init__(self):
+        self.binary = False
+        self.recordcallback = None
+
+def channel(port, bytes_up=0):
+    return {"socket_ip" : "10.0.0.1", "socket_port" : 1, "ip" : "1.2.3.4", "port" : port, "bytes_up" : bytes_up}
+
+class TestMoreInfoLines(unittest.TestCase):
+
+    def setUp(self):
+        self.swift = ReadlineSwift()
+
+    def test_full_reports_unparsed(self):
+        for i in range(100):
+            self.swift.moreinfo({"channels" : [channel(1, bytes_up=i)]})
+        reports = self.swift.download.moreinfo
+        self.assertEqual(len(reports), 100)
+        self.assertFalse(any([r.parsed for r in reports]))
+        self.assertEqual(reports[-1]["channels"][0]["bytes_up"], 99)
+        self.assertFalse(any([r.parsed for r in reports[:-1]]))
+
+    def test_delta_reports_unparsed(self):
+        self.swift.moreinfo({"channels" : [channel(1), channel(2)]})
+        for i in range(100):
+            self.swift.moreinfo({"delta" : 1, "channels" : [channel(1 + i % 2, bytes_up=i)]})
+        reports = self.swift.download.moreinfo
+        self.assertFalse(any([r.parsed for r in reports]))
+        channels = sorted(reports[-1]["channels"], key=lambda c: c["port"])
+        self.assertEqual([c["bytes_up"] for c in channels], [98, 99])
+        self.assertFalse(any([r.parsed for r in reports[:-1]]))
+
+    def test_channel_closed(self):
+        self.swift.moreinfo({"channels" : [channel(1), channel(2)]})
+        self.swift.i2ithread_readlinecallback(None, "CHANNELCLOSED " + ROOTHASH.encode("hex") + " 10.0.0.1:1 1.2.3.4:2")
+        self.swift.moreinfo({"delta" : 1, "channels" : []})
+        self.assertEqual([c["port"] for c in self.swift.download.moreinfo[-1]["channels"]], [1])
+
+class TestNegotiation(unittest.TestCase):
+
+    def setUp(self):
+        self.swift = ReadlineSwift()
+        self.swift.fastconn = FakeConnection()
+
+    def test_binary(self):
+        self.swift.reply = cmdgw_records.NEGOTIATE
+        self.swift.negotiate_binary()
+        self.assertEqual(self.swift.written, [cmdgw_records.NEGOTIATE + "\r\n"])
+        self.assertTrue(self.swift.cmdgw_binary)
+        self.assertTrue(self.swift.fastconn.binary)
+        self.assertFalse(self.swift._negotiating)
+
+    def test_not_supported(self):
+        self.swift.reply = "ERROR unknown command"
+        self.swift.negotiate_binary()
+        self.assertFalse(self.swift.cmdgw_binary)
+        self.assertFalse(self.swift._negotiating)
+        self.assertEqual(self.swift.lost, [])
+
+    def test_late_binary(self):
+        self.swift._negotiating = True # negotiate_binary has timed out and continued in text
+        self.swift.i2ithread_readlinecallback(self.swift.fastconn, cmdgw_records.NEGOTIATE)
+        self.assertFalse(self.swift.cmdgw_binary)
+        self.assertTrue(self.swift.fastconn.binary) # The records that follow are not read as lines
+        self.assertEqual(self.swift.lost, [SWIFT_ERROR_TCP_FAILED])
+
+    def test_late_error(self):
+        self.swift._negotiating = True
+        self.swift.i2ithread_readlinecallback(self.swift.fastconn, "ERROR unknown command")
+        self.assertFalse(self.swift._negotiating)
+        self.swift.moreinfo({"channels" : []})
+        self.assertEqual(len(self.swift.download.moreinfo), 1)
+        self.assertEqual(self.swift.lost, [])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+'''
+Created on Mar 11, 2014
+
+@author: Vincent Ketelaars
+'''
+import unittest
+from threading import Event
+
+from src.tools.timer_wheel import TimerWheel
+
+class TestTimerWheel(unittest.TestCase):
+
+    def setUp(self):
+        self.wheel = TimerWheel(tick=0.01, slots=4)
+        self.wheel.start()
+        
+    def tearDown(self):
+        self.wheel.stop()
+
+    def test_schedule(self):
+        calls = []
+        done = Event()
+        self.wheel.schedule(0.03, calls.append, 2)
+        self.wheel.schedule(0.01, calls.append, 1)
+        self.wheel.schedule(0.07, done.set) # More than one round
+        done.wait(1)
+        self.assertEqual(calls, [1, 2])
+        self.assertEqual(len(self.wheel), 0)
+        
+    def test_cancel(self):
+        calls = []
+        done = Event()
+        timer = self.wheel.schedule(0.01, calls.append, 1)
+        self.wheel.cancel(timer)
+        self.wheel.reschedule(timer, 0.01) # Stays cancelled
+        self.wheel.schedule(0.03, done.set)
+        done.wait(1)
+        self.assertEqual(calls, [])
+        
+    def test_reschedule(self):
+        calls = []
+        done = Event()
+        timer = self.wheel.schedule(0.01, calls.append, 1)
+        self.wheel.reschedule(timer, 0.05)
+        self.wheel.schedule(0.03, done.set)
+        done.wait(1)
+        self.assertEqual(calls, [])
+        self.assertEqual(len(self.wheel), 1)
+
+if __name__ == "__main__":
+    unittest.main()
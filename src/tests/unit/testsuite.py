@@ -4,7 +4,7 @@ Created on Sep 17, 2013
 @author: Vincent Ketelaars
 '''
 import unittest
-from test_filepusher import TestFilePusher
+from test_filepusher import TestFilePusher, TestFilePusherInotify
 import test_community
 import test_conversion
 import test_endpoint
@@ -18,12 +18,31 @@ import test_swift_community
 import test_dispersy_contact
 import test_peer
 import test_priority_stack
+import test_channel_index
+import test_endpoint_health
+import test_packet_classifier
+import test_networks
+import test_prefix_trie
+import test_cmdgw_records
+import test_moreinfo
+import test_reactor
+import test_timer_wheel
+import test_swarm_accounting
+import test_swarm_concurrency
+import test_scheduling
+import test_inotify
+import test_multi_endpoint
+import test_swift_handler
+import test_swift_endpoint
+import test_swift_process
+import test_fasti2i
 
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(TestFilePusher('test_dir_and_files')) # If this one succeeds, test_directory does not have to run
     suite.addTest(TestFilePusher('test_files'))
     suite.addTest(TestFilePusher('test_directory'))
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(TestFilePusherInotify))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_community))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_conversion))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_endpoint))
@@ -37,6 +56,24 @@ def suite():
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_dispersy_contact))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_peer))
     suite.addTest(unittest.TestLoader().loadTestsFromModule(test_priority_stack))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_channel_index))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_endpoint_health))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_packet_classifier))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_networks))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_prefix_trie))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_cmdgw_records))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_moreinfo))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_reactor))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_timer_wheel))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_swarm_accounting))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_swarm_concurrency))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_scheduling))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_inotify))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_multi_endpoint))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_swift_handler))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_swift_endpoint))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_swift_process))
+    suite.addTest(unittest.TestLoader().loadTestsFromModule(test_fasti2i))
     # For testing of tests
 #     suite.addTest(unittest.TestLoader().loadTestsFromTestCase(test_endpoint.TestEndpointNoConnection))
     return suite
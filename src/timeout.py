@@ -3,39 +3,32 @@ Created on Oct 11, 2013
 
 @author: Vincent Ketelaars
 '''
-from threading import Event
-
 from src.definitions import TIMEOUT_INTRODUCTION_REQUEST
-from src.tools.runner import CallFunctionThread
 
 from src.logger import get_logger
 logger = get_logger(__name__)
 
 class IntroductionRequestTimeout(object):
     '''
-    classdocs
+    Resend the introduction request every TIMEOUT_INTRODUCTION_REQUEST seconds, until the candidate responds.
+    The retries are timers on a TimerWheel that is shared by all candidates of the community.
     '''
 
-    def __init__(self, helper_candidate, send_request):
-        self.event = Event()
+    def __init__(self, helper_candidate, send_request, timer_wheel):
         self.helper_candidate = helper_candidate
         self.helper_candidate.set_timeout(self)
         self.send_request = send_request
-        self.thread = CallFunctionThread()
-        self.thread.put(self.wait_and_see)
-        self.thread.start()
-        
+        self.timer_wheel = timer_wheel
+        self.timer = timer_wheel.schedule(TIMEOUT_INTRODUCTION_REQUEST, self.wait_and_see)
+
     def wait_and_see(self):
-        self.event.wait(TIMEOUT_INTRODUCTION_REQUEST)
         if not self.helper_candidate.introduction_response_received():
             self.send_request()
-            self.thread.put(self.wait_and_see)
-        else:
-            self.thread.stop()
-            
+            self.timer_wheel.reschedule(self.timer, TIMEOUT_INTRODUCTION_REQUEST)
+
     @property
     def candidate(self):
         return self.helper_candidate
-    
+
     def stop(self):
-        self.event.set()
\ No newline at end of file
+        self.timer_wheel.cancel(self.timer)
@@ -0,0 +1,40 @@
+'''
+Created on Mar 10, 2014
+
+@author: Vincent Ketelaars
+'''
+import ctypes
+import ctypes.util
+import time
+
+CLOCK_MONOTONIC = 1 # As defined by linux
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+def _find_clock_gettime():
+    for name in (ctypes.util.find_library("rt"), ctypes.util.find_library("c")):
+        if name is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(name, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+        if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(_Timespec())) == 0:
+            return clock_gettime
+    return None
+
+_clock_gettime = _find_clock_gettime()
+
+def monotonic():
+    """
+    Timers should not jump along with the wall clock, which datetime.utcnow and time.time do.
+    Where clock_gettime is not available, this falls back to time.time.
+    @return: Seconds since an arbitrary point in time
+    """
+    if _clock_gettime is None:
+        return time.time()
+    t = _Timespec()
+    _clock_gettime(CLOCK_MONOTONIC, ctypes.byref(t))
+    return t.tv_sec + t.tv_nsec * 1e-9
@@ -0,0 +1,136 @@
+'''
+Created on Mar 17, 2014
+
+@author: Vincent Ketelaars
+'''
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+
+# As defined by linux in sys/inotify.h
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+_EVENT = struct.Struct("iIII") # wd, mask, cookie, len, followed by len bytes of name
+
+def _find_libc():
+    name = ctypes.util.find_library("c")
+    if name is None:
+        return None
+    try:
+        libc = ctypes.CDLL(name, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError): # Not linux
+        return None
+    return libc
+
+_libc = _find_libc()
+
+def available():
+    """
+    @return: True if inotify can be used on this system
+    """
+    return _libc is not None
+
+def _error():
+    e = ctypes.get_errno()
+    return OSError(e, os.strerror(e))
+
+class Inotify(object):
+    '''
+    Thin wrapper around the inotify system calls of linux, through ctypes.
+    Events are returned as (path of the watch, mask, cookie, name), where name is empty for events of the watch itself.
+    '''
+
+    def __init__(self):
+        if _libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise _error()
+        self._watches = {} # wd : path
+        self._buffer = ""
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self, path, mask):
+        """
+        @return: Watch descriptor, watching the same path again returns the same descriptor
+        @raise OSError: If the path can not be watched, for example ENOSPC when the watch limit is reached
+        """
+        wd = _libc.inotify_add_watch(self._fd, path, mask)
+        if wd < 0:
+            raise _error()
+        self._watches[wd] = path
+        return wd
+
+    def rm_watch(self, wd):
+        if self._watches.pop(wd, None) is not None:
+            _libc.inotify_rm_watch(self._fd, wd)
+
+    def watches(self):
+        """
+        @return: List of the watched paths
+        """
+        return self._watches.values()
+
+    def read(self, timeout=None):
+        """
+        Wait at most timeout seconds for events
+        @return: List of (path, mask, cookie, name)
+        """
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                return []
+            raise
+        if not readable:
+            return []
+        try:
+            while True:
+                data = os.read(self._fd, 65536)
+                if not data:
+                    break
+                self._buffer += data
+        except OSError as e:
+            if e.errno != errno.EAGAIN:
+                raise
+        events = []
+        offset = 0
+        while offset + _EVENT.size <= len(self._buffer):
+            wd, mask, cookie, length = _EVENT.unpack_from(self._buffer, offset)
+            if offset + _EVENT.size + length > len(self._buffer):
+                break
+            name = self._buffer[offset + _EVENT.size:offset + _EVENT.size + length].rstrip("\0")
+            offset += _EVENT.size + length
+            if mask & IN_IGNORED: # The watch is gone, for instance because its directory was removed
+                path = self._watches.pop(wd, None)
+            else:
+                path = self._watches.get(wd)
+            if path is not None or mask & IN_Q_OVERFLOW:
+                events.append((path, mask, cookie, name))
+        self._buffer = self._buffer[offset:]
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._watches = {}
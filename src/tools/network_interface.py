@@ -19,7 +19,7 @@ class Interface(object):
     def copy(cls, interface):
         assert isinstance(interface, Interface)
         return Interface(interface.name, interface.address, interface.netmask, interface.broadcast, 
-                         interface.version, interface.device, interface.gateway)
+                         interface._version, interface.device, interface.gateway)
         
     def ipv4(self):
         return self._version == AF_INET
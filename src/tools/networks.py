@@ -3,12 +3,150 @@ Created on Jan 13, 2014
 
 @author: Vincent Ketelaars
 '''
+import socket
+import time
+from struct import unpack
+from binascii import hexlify
+from errno import EAGAIN, EWOULDBLOCK
+from threading import Lock
+
 import netifaces
 from src.tools.network_interface import Interface, AF_INET, AF_INET6
+from src.tools.prefix_trie import PrefixTrie
+from src.definitions import INTERFACE_TABLE_REFRESH
 from src.logger import get_logger
 logger = get_logger(__name__)
 
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV6_IFADDR = 0x100
+
+def ip_to_int(ip, version=AF_INET):
+    """
+    @param ip: ip address string
+    @return: The integer value of this ip address
+    """
+    if version == AF_INET6:
+        return int(hexlify(socket.inet_pton(AF_INET6, ip)), 16)
+    return unpack("!L", socket.inet_aton(ip))[0]
+
+class InterfaceTable(object):
+    '''
+    Process wide table of the network interfaces, so that netifaces is not queried on each lookup.
+    On Linux an rtnetlink socket is subscribed to link and address changes, and the table is rebuilt
+    at the first lookup after such an event. Without rtnetlink the table is rebuilt once it is older than refresh_time.
+    Lookups return copies, because the users of an Interface are allowed to change it.
+    '''
+
+    def __init__(self, refresh_time=INTERFACE_TABLE_REFRESH):
+        self.refresh_time = refresh_time
+        self._lock = Lock()
+        self._interfaces = {} # version : List(Interface)
+        self._subnets = {} # version : PrefixTrie of List(Interface)
+        self._updated = None # Time of the last refresh
+        self._netlink = self._open_netlink()
+
+    def _open_netlink(self):
+        try:
+            s = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            s.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV6_IFADDR))
+            s.setblocking(False)
+            return s
+        except (AttributeError, socket.error): # Not Linux
+            logger.debug("No rtnetlink, the interface table is refreshed every %f seconds", self.refresh_time)
+            return None
+
+    def _changed(self):
+        """
+        Drain the rtnetlink socket
+        @return: True if any event came in
+        """
+        changed = False
+        while True:
+            try:
+                if not self._netlink.recv(65536):
+                    return changed
+                changed = True # Only link and address messages are subscribed to
+            except socket.error as e:
+                # EAGAIN means it is empty, anything else (i.e. ENOBUFS) could mean we have missed events
+                return changed or e.errno not in (EAGAIN, EWOULDBLOCK)
+
+    def _stale(self):
+        if self._updated is None:
+            return True
+        if self._netlink is not None:
+            return self._changed()
+        return self._updated + self.refresh_time < time.time()
+
+    def invalidate(self):
+        with self._lock:
+            self._updated = None
+
+    def _refresh(self):
+        # Assume lock is held
+        self._interfaces = {}
+        self._subnets = {}
+        for version in (AF_INET, AF_INET6):
+            self._interfaces[version] = list(_query_interface_addresses(version))
+            self._subnets[version] = PrefixTrie(128 if version == AF_INET6 else 32)
+            for i in self._interfaces[version]:
+                try:
+                    netmask = ip_to_int(i.netmask, version)
+                    network = ip_to_int(i.address, version) & netmask
+                except (TypeError, ValueError, socket.error): # No address or netmask
+                    continue
+                prefix_length = PrefixTrie.prefix_length(netmask)
+                interfaces = self._subnets[version].get(network, prefix_length)
+                if interfaces is None:
+                    interfaces = []
+                    self._subnets[version].insert(network, prefix_length, interfaces)
+                interfaces.append(i)
+        self._updated = time.time()
+
+    def interfaces(self, version=AF_INET):
+        """
+        @return: List(Interface) of this version
+        """
+        with self._lock:
+            if self._stale():
+                self._refresh()
+            interfaces = self._interfaces.get(version)
+        if interfaces is None:
+            logger.warning("Unknown version %s", version)
+            return []
+        return [Interface.copy(i) for i in interfaces]
+
+    def subnet_interface(self, ip, version=AF_INET):
+        """
+        @param ip: ip address string
+        @return: The Interface with the most specific subnet that has ip in it, or None
+        """
+        ip = ip_to_int(ip, version)
+        with self._lock:
+            if self._stale():
+                self._refresh()
+            interfaces = self._subnets[version].longest_match(ip) if version in self._subnets else None
+            if interfaces:
+                return Interface.copy(interfaces[0])
+        return None
+
+    def exists(self, name, address):
+        """
+        @return: True if an interface with this name and ip address exists
+        """
+        return any(i.name == name and i.address == address for i in self.interfaces(AF_INET) + self.interfaces(AF_INET6))
+
+interface_table = InterfaceTable()
+
 def get_interface_addresses(version=AF_INET):
+    """
+    Yields Interface instances for each available interface of this version, from the interface table.
+    """
+    for interface in interface_table.interfaces(version):
+        yield interface
+
+def _query_interface_addresses(version=AF_INET):
     """
     Yields Interface instances for each available AF_INET interface found.
 
@@ -4,78 +4,144 @@ Created on Nov 27, 2013
 @author: Vincent Ketelaars
 '''
 
-from datetime import datetime, timedelta
-from threading import Event, Thread
+import heapq
+from threading import Event, Thread, Lock
+
+from src.tools.clock import monotonic
 
 class PeriodicTask(object):
     '''
     Simple holder for a task that needs to be executed periodically.
-    It contains the last time executed, function reference, arguments, time period and maximum iterations.
+    It contains the next time to execute, function reference, arguments, time period and maximum iterations.
     '''
 
     def __init__(self, func, period, max_iterations=-1, delay=0.0, args=(), kwargs={}):
-        self.last_time = datetime.utcnow() + timedelta(seconds=delay - period) # Start after delay seconds
+        self.next_time = monotonic() + delay # Start after delay seconds
         self.iteration = 0
         self.max_iterations = max_iterations # -1 is infinite
         self.function = func
-        self.period = timedelta(seconds=period) # period should be in seconds
+        self.period = period # period should be in seconds
         self.args = args # tuple
         self.kwargs = kwargs # dictionary
-        
+
     def iterations_left(self):
         return self.max_iterations == -1 or self.max_iterations > self.iteration
-        
+
     def have_to_go(self):
-        return self.last_time + self.period < now()
-    
+        return self.next_time <= monotonic()
+
     def call(self):
-        self.last_time = now()
+        self.next_time = monotonic() + self.period
         self.iteration += 1
         self.function(*self.args, **self.kwargs)
-        
+
     def stop(self):
         self.max_iterations = 0
-        
+
 
 class PeriodicIntroductionRequest(PeriodicTask):
-    
+
     def __init__(self, func, period, candidate, delay=0.0, args=(), kwargs={}):
         PeriodicTask.__init__(self, func, period, delay=delay, args=args, kwargs=kwargs)
         self.candidate = candidate
 
 class Looper(Thread):
     """
-    This Looper holds any number of periodic tasks and checks every timeout time if the task needs to be called
-    or deleted
+    This Looper holds any number of periodic tasks in a heap ordered by the next time they have to be called,
+    and sleeps until the first of them is due, or until a task is added when there are none.
+    Stopped tasks are dropped when they reach the top of the heap.
+    Adding a task is O(log n), stopping it O(1).
     """
-    
-    def __init__(self, sleep=0.1, name="Looper"):
+
+    def __init__(self, name="Looper", reactor=None):
         Thread.__init__(self, name=name)
         self.setDaemon(True)
-        self.sleep = sleep
         self.event = Event()
-        self.tasks = []
-        
+        self._wake = Event() # Set when a task is added that is due before the current sleep ends
+        self._heap = [] # (next time, sequence, PeriodicTask)
+        self._sequence = 0 # Keeps tasks that are due at the same time in the order they were added
+        self._lock = Lock()
+        self.reactor = reactor # If set, the tasks are called by a timer on the reactor instead of by this thread
+        self._timer = None
+        self._started = False
+
+    @property
+    def tasks(self):
+        """
+        @return: List of the tasks that have iterations left
+        """
+        with self._lock:
+            return [task for _, _, task in self._heap if task.iterations_left()]
+
+    def start(self):
+        self._started = True
+        if self.reactor is None:
+            Thread.start(self)
+        else:
+            self._schedule_on_reactor()
+
     def run(self):
         while not self.event.is_set():
-            marked_for_delete = []
-            for task in self.tasks:
-                if not task.iterations_left():
-                    marked_for_delete.append(task)
-                elif task.have_to_go():
-                    task.call()
-            
-            for task in marked_for_delete:
-                self.tasks.remove(task)
-            del marked_for_delete
-            self.event.wait(self.sleep)
+            self.loop_once()
+            self._wake.wait(self._timeout())
+            self._wake.clear()
+
+    def _timeout(self):
+        """
+        @return: Seconds until the first task is due, or None if there is no task
+        """
+        with self._lock:
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - monotonic())
+
+    def loop_once(self):
+        """
+        Call the tasks that are due
+        """
+        now = monotonic()
+        while True:
+            with self._lock:
+                if not self._heap or self._heap[0][0] > now:
+                    break
+                _, _, task = heapq.heappop(self._heap)
+            if not task.iterations_left():
+                continue
+            if task.next_time > now: # Rescheduled from outside
+                self._push(task)
+                continue
+            task.call()
+            if task.iterations_left():
+                self._push(task)
+
+    def _push(self, task):
+        with self._lock:
+            self._sequence += 1
+            heapq.heappush(self._heap, (task.next_time, self._sequence, task))
+            return self._heap[0][2] is task
+
+    def _schedule_on_reactor(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        timeout = self._timeout()
+        if not self.event.is_set() and timeout is not None: # add_task schedules again
+            self._timer = self.reactor.call_later(timeout, self._reactor_loop_once)
+
+    def _reactor_loop_once(self):
+        self.loop_once()
+        self._schedule_on_reactor()
 
     def add_task(self, periodic_task):
         assert isinstance(periodic_task, PeriodicTask)
-        self.tasks.append(periodic_task)
+        if self._push(periodic_task): # Due before any other task
+            if self.reactor is None:
+                self._wake.set()
+            elif self._started:
+                self._schedule_on_reactor()
 
     def stop(self):
         self.event.set()
- 
-def now():
-    return datetime.utcnow()
\ No newline at end of file
+        self._wake.set()
+        if self._timer is not None:
+            self._timer.cancel()
@@ -0,0 +1,88 @@
+'''
+Created on Mar 7, 2014
+
+@author: Vincent Ketelaars
+'''
+
+_EMPTY = object() # Marks a node without value
+
+class PrefixTrie(object):
+    '''
+    Binary trie over integer ip prefixes, for longest prefix matching of ip addresses.
+    Each node is a list [zero child, one child, value].
+    A lookup follows the bits of the ip from the most significant bit, and stops where the trie ends,
+    so it takes at most as many steps as the longest prefix that was inserted.
+    '''
+
+    def __init__(self, bits=32):
+        """
+        @param bits: Length of the addresses, 32 for IPv4 and 128 for IPv6
+        """
+        self.bits = bits
+        self._root = [None, None, _EMPTY]
+        self._size = 0
+
+    @staticmethod
+    def prefix_length(netmask):
+        """
+        @param netmask: Integer netmask
+        @return: The number of leading ones
+        """
+        return bin(netmask).count("1")
+
+    def insert(self, network, prefix_length, value):
+        """
+        Insert or replace the value for this prefix
+        @param network: Integer network address, bits beyond prefix_length are ignored
+        """
+        node = self._root
+        for i in range(self.bits - 1, self.bits - 1 - prefix_length, -1):
+            bit = (network >> i) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, _EMPTY]
+            node = node[bit]
+        if node[2] is _EMPTY:
+            self._size += 1
+        node[2] = value
+
+    def get(self, network, prefix_length, default=None):
+        """
+        @return: The value of exactly this prefix, or default
+        """
+        node = self._root
+        for i in range(self.bits - 1, self.bits - 1 - prefix_length, -1):
+            node = node[(network >> i) & 1]
+            if node is None:
+                return default
+        return default if node[2] is _EMPTY else node[2]
+
+    def matches(self, ip):
+        """
+        @param ip: Integer ip address
+        @return: List of values of all prefixes that contain ip, shortest prefix first
+        """
+        values = []
+        node = self._root
+        i = self.bits - 1
+        while node is not None:
+            if node[2] is not _EMPTY:
+                values.append(node[2])
+            if i < 0:
+                break
+            node = node[(ip >> i) & 1]
+            i -= 1
+        return values
+
+    def longest_match(self, ip, default=None):
+        """
+        @param ip: Integer ip address
+        @return: The value of the longest prefix that contains ip, or default
+        """
+        values = self.matches(ip)
+        return values[-1] if values else default
+
+    def __contains__(self, ip):
+        return len(self.matches(ip)) > 0
+
+    def __len__(self):
+        return self._size
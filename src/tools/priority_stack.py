@@ -3,47 +3,127 @@ Created on Feb 19, 2014
 
 @author: Vincent Ketelaars
 '''
+import heapq
+
 from src.logger import get_logger
 logger = get_logger(__name__)
 
+class _Entry(object):
+    '''
+    Heap entry, ordered such that the highest priority comes first, and the earliest put among equal priorities
+    '''
+    __slots__ = ("priority", "sequence", "key", "item", "size", "removed")
+
+    def __init__(self, priority, sequence, key, item, size):
+        self.priority = priority
+        self.sequence = sequence
+        self.key = key
+        self.item = item
+        self.size = size
+        self.removed = False
+
+    def __lt__(self, other):
+        if self.priority == other.priority:
+            return self.sequence < other.sequence
+        return self.priority > other.priority
+
 class PriorityStack(object):
     '''
     This class represents a stack where input is prioritized by a single parameter
     Note that that parameter can also be a tuple, effectively allowing for multiple parameters
     where the first is the primary priority.
+    Items with equal priority come off in the order they were put.
+    The items are kept in a heap, next to an index by key which is used to refuse duplicates and to remove items.
+    Removed items stay in the heap until they reach the top.
     '''
 
     def __init__(self):
-        self._stack = [] # (priority, item)
-        
-    def put(self, priority, item):
-        # TODO: Implement binary search to increase insert speed
-        i = len(self._stack)
-        for i in range(len(self._stack) - 1, -1, -1): # Starting at the end
-            if self._stack[i][0] < priority:
-                i += 1
-                break
-        self._stack[i:i] = [(priority, item)]
-        logger.debug("Put item %s, with priority %s in %dth place of %d", str(item), str(priority), 
-                     len(self._stack) - i, len(self._stack))
-        
+        self._heap = [] # _Entry
+        self._index = {} # key : _Entry
+        self._sequence = 0
+        self._total_size = 0
+
+    def put(self, priority, item, key=None, size=0):
+        """
+        @param key: Hashable identifier of the item, an item whose key is already on the stack is not put again.
+        Without key, the item is always put
+        @param size: Added to total_size while the item is on the stack
+        @return: True if the item was put
+        """
+        if key is not None and key in self._index:
+            return False
+        self._sequence += 1
+        entry = _Entry(priority, self._sequence, key if key is not None else object(), item, size)
+        heapq.heappush(self._heap, entry)
+        self._index[entry.key] = entry
+        self._total_size += size
+        logger.debug("Put item %s, with priority %s in stack of %d", str(item), str(priority), len(self._index))
+        return True
+
+    def _clean_top(self):
+        while self._heap and self._heap[0].removed:
+            heapq.heappop(self._heap)
+
     def pop(self):
-        if len(self._stack):
-            return self._stack.pop()[1]
+        self._clean_top()
+        if self._heap:
+            entry = heapq.heappop(self._heap)
+            del self._index[entry.key]
+            self._total_size -= entry.size
+            return entry.item
         return None
-    
+
     def peek(self):
-        if len(self._stack):
-            return self._stack[len(self._stack) - 1][1]
+        self._clean_top()
+        if self._heap:
+            return self._heap[0].item
         return None
-    
+
+    def peek_priority(self):
+        """
+        @return: The priority of the item that pop would return, or None if there is none
+        """
+        self._clean_top()
+        if self._heap:
+            return self._heap[0].priority
+        return None
+
+    def remove(self, key):
+        """
+        Remove the item with this key
+        @return: The item, or None if there was none
+        """
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return None
+        entry.removed = True
+        self._total_size -= entry.size
+        return entry.item
+
+    def rekey(self, priority):
+        """
+        Give each item a new priority, in the order the items were put
+        @param priority: Function that returns the new priority of an item
+        """
+        entries = sorted(self._index.itervalues(), key=lambda entry: entry.sequence)
+        for entry in entries:
+            entry.priority = priority(entry.item)
+        heapq.heapify(entries)
+        self._heap = entries
+
+    def total_size(self):
+        """
+        @return: The sum of the sizes of the items on the stack
+        """
+        return self._total_size
+
     def __iter__(self):
-        for i in range(len(self._stack) - 1, -1, -1):
-            yield self._stack[i][1]
-            
-    def __contains__(self, elem):
-        return self._stack.__contains__(elem)
-        
+        for entry in sorted(self._index.itervalues()):
+            yield entry.item
+
+    def __contains__(self, key):
+        return key in self._index
+
     def __len__(self):
-        return len(self._stack)
-        
\ No newline at end of file
+        return len(self._index)
+
@@ -0,0 +1,195 @@
+'''
+Created on Mar 10, 2014
+
+@author: Vincent Ketelaars
+'''
+import os
+import errno
+import heapq
+import select
+from threading import Thread, Lock, Event
+try:
+    import fcntl
+except ImportError: # Windows, where neither epoll nor poll is available for the reactor
+    fcntl = None
+
+from src.tools.clock import monotonic
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+def set_nonblocking(fd):
+    fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+
+class Timer(object):
+    '''
+    Handle of a function that is scheduled on the Reactor, periodically if period is set
+    '''
+    __slots__ = ("deadline", "period", "func", "args", "cancelled")
+
+    def __init__(self, deadline, period, func, args):
+        self.deadline = deadline
+        self.period = period
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Reactor(Thread):
+    '''
+    A single thread that waits for any of its file descriptors to become readable, using select.epoll,
+    or select.poll where epoll is not available, and runs timers from a heap ordered by deadline.
+    Other threads wake it up through a pipe when they add a reader or an earlier timer.
+    Callbacks run on the reactor thread, so they should not block.
+    '''
+
+    def __init__(self, name="Reactor"):
+        Thread.__init__(self, name=name)
+        self.setDaemon(True)
+        self._epoll = hasattr(select, "epoll")
+        if self._epoll:
+            self._poller = select.epoll()
+            self._events = select.EPOLLIN | select.EPOLLERR | select.EPOLLHUP
+        else:
+            self._poller = select.poll()
+            self._events = select.POLLIN | select.POLLERR | select.POLLHUP
+        self._readers = {} # fd : callback(fd)
+        self._timers = [] # Heap of (deadline, sequence, Timer)
+        self._sequence = 0 # Keeps timers with the same deadline in the order they were added
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._wake_read, self._wake_write = os.pipe()
+        set_nonblocking(self._wake_read)
+        set_nonblocking(self._wake_write)
+        self._poller.register(self._wake_read, self._events)
+
+    def add_reader(self, fd, callback):
+        """
+        @param callback: function(fd) called whenever fd is readable, has hung up or is in error
+        """
+        with self._lock:
+            self._readers[fd] = callback
+            self._poller.register(fd, self._events)
+        self._wake()
+
+    def remove_reader(self, fd):
+        with self._lock:
+            if self._readers.pop(fd, None) is not None:
+                try:
+                    self._poller.unregister(fd)
+                except (IOError, OSError, KeyError, ValueError): # Already closed
+                    pass
+
+    def call_later(self, delay, func, *args):
+        """
+        @param delay: Seconds
+        @rtype: Timer
+        """
+        return self._schedule(Timer(monotonic() + delay, None, func, args))
+
+    def call_periodic(self, period, func, *args, **kwargs):
+        """
+        Call func every period seconds, the first time after delay seconds
+        @rtype: Timer
+        """
+        return self._schedule(Timer(monotonic() + kwargs.get("delay", period), period, func, args))
+
+    def _schedule(self, timer):
+        with self._lock:
+            first = not self._timers or timer.deadline < self._timers[0][0]
+            self._push(timer)
+        if first:
+            self._wake()
+        return timer
+
+    def _push(self, timer):
+        # Assume lock is held
+        self._sequence += 1
+        heapq.heappush(self._timers, (timer.deadline, self._sequence, timer))
+
+    def _wake(self):
+        if self.is_alive() and not self._stop_event.is_set():
+            try:
+                os.write(self._wake_write, "x")
+            except OSError as e:
+                if e.errno != errno.EAGAIN: # A wake up is already pending
+                    raise
+
+    def _timeout(self):
+        """
+        @return: Seconds until the first timer, or -1 for none
+        """
+        with self._lock:
+            if not self._timers:
+                return -1
+            return max(0.0, self._timers[0][0] - monotonic())
+
+    def _poll(self, timeout):
+        if self._epoll:
+            return self._poller.poll(timeout)
+        return self._poller.poll(None if timeout < 0 else timeout * 1000)
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                events = self._poll(self._timeout())
+            except (IOError, OSError, select.error) as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            for fd, _ in events:
+                if fd == self._wake_read:
+                    try:
+                        while os.read(self._wake_read, 4096):
+                            pass
+                    except OSError:
+                        pass
+                    continue
+                callback = self._readers.get(fd)
+                if callback is not None:
+                    self._call(callback, (fd,))
+            self._run_timers()
+
+    def _run_timers(self):
+        now = monotonic()
+        due = []
+        with self._lock:
+            while self._timers and self._timers[0][0] <= now:
+                timer = heapq.heappop(self._timers)[2]
+                if timer.cancelled:
+                    continue
+                due.append(timer)
+                if timer.period is not None: # Do not try to catch up with missed periods
+                    timer.deadline = max(timer.deadline + timer.period, now)
+                    self._push(timer)
+        for timer in due:
+            if not timer.cancelled:
+                self._call(timer.func, timer.args)
+
+    def _call(self, func, args):
+        try:
+            func(*args)
+        except:
+            logger.exception("Reactor call to %s failed", func)
+
+    def stop(self):
+        self._stop_event.set()
+        try:
+            os.write(self._wake_write, "x")
+        except OSError:
+            pass
+
+_reactor = None
+_reactor_lock = Lock()
+
+def get_reactor():
+    """
+    @return: The Reactor that is shared by the whole process, started on first use
+    """
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = Reactor()
+            _reactor.start()
+        return _reactor
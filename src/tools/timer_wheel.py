@@ -0,0 +1,129 @@
+'''
+Created on Mar 11, 2014
+
+@author: Vincent Ketelaars
+'''
+from math import ceil
+from threading import Thread, Event, Lock
+
+from src.tools.clock import monotonic
+from src.logger import get_logger
+logger = get_logger(__name__)
+
+class WheelTimer(object):
+    '''
+    Handle of a function scheduled on a TimerWheel
+    '''
+    __slots__ = ("slot", "rounds", "func", "args", "cancelled")
+
+    def __init__(self, func, args):
+        self.slot = None
+        self.rounds = 0
+        self.func = func
+        self.args = args
+        self.cancelled = False
+
+class TimerWheel(Thread):
+    '''
+    Hashed timer wheel, which runs any number of timers in a single thread.
+    The wheel has a number of slots, one of which is visited each tick. A timer is put in the slot that is
+    visited when it expires, together with the number of full rounds the wheel has to make before that.
+    Scheduling, cancelling and rescheduling are O(1), and the precision is one tick.
+    '''
+
+    def __init__(self, tick=0.1, slots=512, name="TimerWheel"):
+        """
+        @param tick: Seconds between two slots
+        """
+        Thread.__init__(self, name=name)
+        self.setDaemon(True)
+        self.tick = tick
+        self._slots = [set() for _ in range(slots)]
+        self._current = 0 # Slot that was visited last
+        self._size = 0
+        self._lock = Lock()
+        self._wake = Event() # Set when a timer is added to an empty wheel
+        self._stop_event = Event()
+
+    def schedule(self, delay, func, *args):
+        """
+        Call func after delay seconds, on the thread of the wheel
+        @rtype: WheelTimer
+        """
+        timer = WheelTimer(func, args)
+        self._insert(timer, delay)
+        return timer
+
+    def reschedule(self, timer, delay):
+        """
+        Call the function of timer after delay seconds, instead of when it was scheduled.
+        A cancelled timer stays cancelled.
+        """
+        with self._lock:
+            if timer.cancelled:
+                return
+            self._remove(timer)
+        self._insert(timer, delay)
+
+    def cancel(self, timer):
+        with self._lock:
+            timer.cancelled = True
+            self._remove(timer)
+
+    def _insert(self, timer, delay):
+        ticks = max(1, int(ceil(delay / self.tick)))
+        with self._lock:
+            timer.slot = (self._current + ticks) % len(self._slots)
+            timer.rounds = (ticks - 1) // len(self._slots)
+            self._slots[timer.slot].add(timer)
+            self._size += 1
+        self._wake.set()
+
+    def _remove(self, timer):
+        # Assume lock is held
+        if timer.slot is not None:
+            self._slots[timer.slot].discard(timer)
+            timer.slot = None
+            self._size -= 1
+
+    def run(self):
+        next_tick = monotonic() + self.tick
+        while not self._stop_event.is_set():
+            if self._size == 0: # Nothing to do until something is scheduled
+                self._wake.wait()
+                self._wake.clear()
+                next_tick = monotonic() + self.tick
+                continue
+            delay = next_tick - monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)
+                continue
+            next_tick += self.tick
+            for timer in self._advance():
+                try:
+                    timer.func(*timer.args)
+                except:
+                    logger.exception("Timer call to %s failed", timer.func)
+
+    def _advance(self):
+        """
+        Visit the next slot
+        @return: List(WheelTimer) that expired
+        """
+        expired = []
+        with self._lock:
+            self._current = (self._current + 1) % len(self._slots)
+            for timer in list(self._slots[self._current]):
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                else:
+                    self._remove(timer)
+                    expired.append(timer)
+        return expired
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def __len__(self):
+        return self._size